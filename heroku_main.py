@@ -25,9 +25,10 @@ async def start_bot():
         logger.info("Starting HackReality Bot on Heroku...")
         
         # Import here to avoid circular imports
-        from main import TelegramBot
+        from main import TelegramBot, configure_gc
         
         # Create bot instance
+        configure_gc()
         bot = TelegramBot()
         
         # Get the application directly
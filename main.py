@@ -4,8 +4,10 @@ Main Telegram Bot Application
 A modular Telegram bot with onboarding, options, setup, payment, and iteration modules.
 """
 
+import gc
 import logging
 import os
+from functools import wraps
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
 from dotenv import load_dotenv
@@ -22,7 +24,7 @@ from modules.user_state import UserStateManager
 from modules.error_handler import ErrorHandler
 from modules.monitoring import MonitoringManager
 from modules.security import SecurityManager
-from modules.performance import PerformanceManager
+from modules.performance import KeyedLock, PerformanceManager
 from modules.ux_improvements import UXManager
 from modules.analytics import AnalyticsManager
 from modules.admin_notifications import admin_notifications
@@ -37,6 +39,14 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Most of the bot's allocations are short-lived, so collect the young generation
+# far less often than the default 700 allocations
+GC_THRESHOLDS = (50_000, 10, 10)
+
+def configure_gc():
+    """Apply the bot's GC thresholds; process-wide, so only entry points call this"""
+    gc.set_threshold(*GC_THRESHOLDS)
+
 class TelegramBot:
     def __init__(self):
         self.token = os.getenv('TELEGRAM_BOT_TOKEN')
@@ -46,6 +56,7 @@ class TelegramBot:
         # Initialize modules
         self.db_manager = DatabaseManager()
         self.state_manager = UserStateManager()
+        admin_notifications.set_db_manager(self.db_manager)
         
         self.onboarding = OnboardingModule(self.db_manager, self.state_manager)
         self.option = OptionModule(self.db_manager, self.state_manager, self)
@@ -59,30 +70,41 @@ class TelegramBot:
         self.ux = UXManager(self.db_manager)
         self.analytics = AnalyticsManager(self.db_manager)
         
+        # Updates run concurrently across users; each user's updates are serialized by _per_user
+        self._user_locks = KeyedLock()
+        
         # Initialize application
-        self.application = Application.builder().token(self.token).build()
+        self.application = Application.builder().token(self.token).concurrent_updates(True).build()
         self._setup_handlers()
     
+    def _per_user(self, callback):
+        """Wrap a handler so one user's updates run in arrival order while other users' run concurrently"""
+        @wraps(callback)
+        async def handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            async with self._user_locks.hold(update.effective_user.id):
+                await callback(update, context)
+        return handler
+    
     def _setup_handlers(self):
         """Setup command and message handlers"""
         # Start command
-        self.application.add_handler(CommandHandler("start", self.start_command))
+        self.application.add_handler(CommandHandler("start", self._per_user(self.start_command)))
         
         # Help command
-        self.application.add_handler(CommandHandler("help", self.help_command))
+        self.application.add_handler(CommandHandler("help", self._per_user(self.help_command)))
         
         # Status command
-        self.application.add_handler(CommandHandler("status", self.status_command))
+        self.application.add_handler(CommandHandler("status", self._per_user(self.status_command)))
         
         # Message handlers for different modules
         self.application.add_handler(MessageHandler(
             filters.TEXT & ~filters.COMMAND, 
-            self.handle_message
+            self._per_user(self.handle_message)
         ))
         
         # Callback query handler
         self.application.add_handler(CallbackQueryHandler(
-            self.handle_callback_query
+            self._per_user(self.handle_callback_query)
         ))
     
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -366,6 +388,7 @@ Use `/start` to continue your journey or `/help` for assistance.
 def main():
     """Main function"""
     try:
+        configure_gc()
         bot = TelegramBot()
         
         # Check if there's already an event loop running
@@ -5,17 +5,26 @@ Handles sending notifications from main bot modules to admin bot
 """
 
 import os
+import html
 import asyncio
 import logging
+from collections import deque
 from datetime import datetime
 from dotenv import load_dotenv
 from telegram import Bot
+from telegram.constants import ParseMode
+from modules.text_utils import truncate
 
 # Load environment variables
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Telegram's per-message text limit; batched notifications are split to stay under it
+_MESSAGE_LIMIT = 4096
+# Goals in admin notifications are cut like the display_goal shown to users
+_GOAL_LIMIT = 80
+
 class AdminNotificationService:
     """Service for sending notifications to admin bot"""
     
@@ -26,8 +35,27 @@ class AdminNotificationService:
         if not self.admin_bot_token:
             logger.warning("ADMIN_BOT_TOKEN not found, admin notifications disabled")
             self.admin_bot_token = None
+        
+        # Regular plan requests are batched into one admin message per flush
+        self.batch_flush_interval = 3.0  # seconds
+        self.batch_max_size = 20
+        self.batch_buffer_limit = 200
+        self._pending_regular_plan_requests = deque()
+        self._dropped_regular_plan_requests = 0
+        self._flush_task = None
+        
+        # Keeps a reference to every running flush so none is garbage-collected mid-send
+        self._flush_tasks = set()
+        
+        # Donation confirmations are batched over a shorter window and never dropped
+        self.donation_flush_interval = 1.0  # seconds
+        self._pending_donation_confirmations = deque()
+        self._donation_flush_task = None
+        
+        # Used to look up user names off the user's request path
+        self.db_manager = None
     
-    async def send_notification(self, message: str, notification_type: str = "general"):
+    async def send_notification(self, message: str, notification_type: str = "general", parse_mode: str = 'Markdown'):
         """Send notification to admin via admin bot"""
         try:
             if not self.admin_bot_token:
@@ -42,7 +70,7 @@ class AdminNotificationService:
             await admin_bot.send_message(
                 chat_id=self.admin_user_id,
                 text=message,
-                parse_mode='Markdown'
+                parse_mode=parse_mode
             )
             
             logger.info(f"Admin notification sent successfully: {notification_type}")
@@ -71,36 +99,228 @@ class AdminNotificationService:
     async def notify_regular_plan_request(self, user_id: int, user_name: str, user_goal: str, order_id: str):
         """Notify admin about Regular plan request"""
         message = f"""
-🚧 **Запрос Обычного плана**
+🚧 <b>Запрос Обычного плана</b>
 
-👤 **Пользователь:** {user_name} (ID: {user_id})
-🎯 **Цель:** "{user_goal}"
-📦 **Заказ:** #{order_id}
+👤 <b>Пользователь:</b> {html.escape(user_name)} (ID: {user_id})
+🎯 <b>Цель:</b> "{html.escape(truncate(user_goal, _GOAL_LIMIT))}"
+📦 <b>Заказ:</b> #{order_id}
 
-⏰ **Время:** {self._get_current_time()}
+⏰ <b>Время:</b> {self._get_current_time()}
 
-**Действие:** Пользователь заинтересован в Обычном плане, но план пока в разработке.
+<b>Действие:</b> Пользователь заинтересован в Обычном плане, но план пока в разработке.
         """
-        return await self.send_notification(message, "regular_plan_requests")
+        return await self.send_notification(message, "regular_plan_requests", parse_mode=ParseMode.HTML)
+    
+    def set_db_manager(self, db_manager):
+        """Give the service database access for resolving user names"""
+        self.db_manager = db_manager
+    
+    async def _get_user_name(self, user_id: int) -> str:
+        """Look up a user's first name, or an empty string if unavailable"""
+        if not self.db_manager:
+            return ""
+        try:
+            user_profile = await self.db_manager.get_user_profile(user_id)
+        except Exception as e:
+            logger.error(f"Error looking up user {user_id} for admin notification: {e}")
+            return ""
+        return user_profile.get("first_name", "") if user_profile else ""
+    
+    def queue_regular_plan_request(self, user_id: int, user_goal: str, order_id: str):
+        """Queue a Regular plan request to be sent to admin with the next batch"""
+        if len(self._pending_regular_plan_requests) >= self.batch_buffer_limit:
+            self._pending_regular_plan_requests.popleft()
+            self._dropped_regular_plan_requests += 1
+        
+        self._pending_regular_plan_requests.append({
+            "user_id": user_id,
+            "user_goal": user_goal,
+            "order_id": order_id,
+            "time": self._get_current_time()
+        })
+        
+        self._schedule_flush(
+            "_flush_task", self._pending_regular_plan_requests,
+            self.flush_regular_plan_requests, self.batch_flush_interval
+        )
+    
+    def _start_flush(self, coro):
+        """Run a flush in the background, keeping a reference until it finishes"""
+        task = asyncio.create_task(coro)
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+        return task
+    
+    def _schedule_flush(self, task_attr: str, pending, flush, interval: float):
+        """Flush a full batch right away, otherwise make sure a delayed flush is pending"""
+        if len(pending) >= self.batch_max_size:
+            self._start_flush(flush())
+            return
+        
+        self._schedule_delayed_flush(task_attr, flush, interval)
+    
+    def _schedule_delayed_flush(self, task_attr: str, flush, interval: float):
+        """Start a delayed flush unless one is already waiting"""
+        task = getattr(self, task_attr)
+        if task is None or task.done():
+            setattr(self, task_attr, self._start_flush(self._flush_after_interval(task_attr, flush, interval)))
+    
+    async def _flush_after_interval(self, task_attr: str, flush, interval: float):
+        """Wait for more items to accumulate, then flush them"""
+        await asyncio.sleep(interval)
+        # Clear the handle before sending so items queued during the send schedule their own flush
+        setattr(self, task_attr, None)
+        await flush()
+    
+    async def flush_regular_plan_requests(self):
+        """Send all queued Regular plan requests to admin, splitting only to fit Telegram's limit"""
+        requests = list(self._pending_regular_plan_requests)
+        self._pending_regular_plan_requests.clear()
+        dropped = self._dropped_regular_plan_requests
+        self._dropped_regular_plan_requests = 0
+        
+        if not requests:
+            return False
+        
+        for request in requests:
+            if "user_name" not in request:
+                request["user_name"] = await self._get_user_name(request["user_id"])
+        
+        if len(requests) == 1 and not dropped:
+            request = requests[0]
+            sent = 1 if await self.notify_regular_plan_request(
+                request["user_id"], request["user_name"], request["user_goal"], request["order_id"]
+            ) else 0
+        else:
+            entries = [
+                f"""👤 <b>Пользователь:</b> {html.escape(request['user_name'])} (ID: {request['user_id']})
+🎯 <b>Цель:</b> "{html.escape(truncate(request['user_goal'], _GOAL_LIMIT))}"
+📦 <b>Заказ:</b> #{request['order_id']}
+⏰ <b>Время:</b> {request['time']}"""
+                for request in requests
+            ]
+            sent = await self._send_entries(
+                entries,
+                "\n🚧 <b>Запросы Обычного плана: {count}</b>\n\n",
+                "\n\n<b>Действие:</b> Пользователи заинтересованы в Обычном плане, но план пока в разработке.\n",
+                "regular_plan_requests",
+                note=f"\n\n⚠️ <b>Пропущено из-за переполнения:</b> {dropped}" if dropped else ""
+            )
+        
+        if sent < len(requests):
+            self._requeue_regular_plan_requests(requests[sent:], dropped if sent == 0 else 0)
+        return sent == len(requests)
+    
+    def _requeue_regular_plan_requests(self, requests, dropped: int):
+        """Put undelivered requests back at the front of the queue and retry after the interval"""
+        if not self.admin_bot_token:
+            # Notifications are disabled and were logged instead; retrying can't deliver them
+            return
+        
+        self._pending_regular_plan_requests.extendleft(reversed(requests))
+        self._dropped_regular_plan_requests += dropped
+        while len(self._pending_regular_plan_requests) > self.batch_buffer_limit:
+            self._pending_regular_plan_requests.popleft()
+            self._dropped_regular_plan_requests += 1
+        
+        self._schedule_delayed_flush("_flush_task", self.flush_regular_plan_requests, self.batch_flush_interval)
+    
+    async def _send_entries(self, entries, header: str, footer: str, notification_type: str, note: str = "") -> int:
+        """Send entries as HTML messages that each fit Telegram's limit; returns how many were delivered
+        
+        header is formatted with the entry count of each message; note is added to the first one only.
+        """
+        sent = 0
+        while sent < len(entries):
+            budget = _MESSAGE_LIMIT - len(header) - len(footer) - len(note) - 8
+            count = 1
+            budget -= len(entries[sent])
+            while sent + count < len(entries) and len(entries[sent + count]) + 2 <= budget:
+                budget -= len(entries[sent + count]) + 2
+                count += 1
+            
+            chunk = entries[sent:sent + count]
+            message = header.format(count=len(chunk)) + "\n\n".join(chunk) + note + footer
+            if not await self.send_notification(message, notification_type, parse_mode=ParseMode.HTML):
+                break
+            sent += count
+            note = ""
+        return sent
     
     async def notify_donation_confirmation(self, user_id: int, user_name: str, order_id: str, target_goal: str, plan_details: dict):
         """Notify admin about donation confirmation"""
         message = f"""
-💰 **ПОДТВЕРЖДЕНИЕ ДОНАТА**
+💰 <b>ПОДТВЕРЖДЕНИЕ ДОНАТА</b>
 
-👤 **Пользователь:** {user_name} (ID: {user_id})
-📦 **Заказ:** #{order_id}
-🎯 **Цель:** "{target_goal}"
-📋 **План:** {plan_details.get('name', 'Unknown')}
-💰 **Сумма:** {plan_details.get('price', 'Unknown')}
+👤 <b>Пользователь:</b> {html.escape(user_name)} (ID: {user_id})
+📦 <b>Заказ:</b> #{order_id}
+🎯 <b>Цель:</b> "{html.escape(truncate(target_goal, _GOAL_LIMIT))}"
+📋 <b>План:</b> {html.escape(str(plan_details.get('name', 'Unknown')))}
+💰 <b>Сумма:</b> {html.escape(str(plan_details.get('price', 'Unknown')))}
 
-⏰ **Время:** {self._get_current_time()}
+⏰ <b>Время:</b> {self._get_current_time()}
 
-**Действие:** Пользователь подтвердил, что сделал донат на номер +79853659487
+<b>Действие:</b> Пользователь подтвердил, что сделал донат на номер +79853659487
 
-**Нужно подтвердить получение доната!**
+<b>Нужно подтвердить получение доната!</b>
         """
-        return await self.send_notification(message, "payments")
+        return await self.send_notification(message, "payments", parse_mode=ParseMode.HTML)
+    
+    def queue_donation_confirmation(self, user_id: int, user_name: str, order_id: str, target_goal: str, plan_details: dict):
+        """Queue a donation confirmation to be sent to admin with the next batch"""
+        self._pending_donation_confirmations.append({
+            "user_id": user_id,
+            "user_name": user_name,
+            "order_id": order_id,
+            "target_goal": target_goal,
+            "plan_details": plan_details,
+            "time": self._get_current_time()
+        })
+        
+        self._schedule_flush(
+            "_donation_flush_task", self._pending_donation_confirmations,
+            self.flush_donation_confirmations, self.donation_flush_interval
+        )
+    
+    async def flush_donation_confirmations(self):
+        """Send all queued donation confirmations to admin, splitting only to fit Telegram's limit"""
+        confirmations = list(self._pending_donation_confirmations)
+        self._pending_donation_confirmations.clear()
+        
+        if not confirmations:
+            return False
+        
+        if len(confirmations) == 1:
+            confirmation = confirmations[0]
+            sent = 1 if await self.notify_donation_confirmation(
+                confirmation["user_id"], confirmation["user_name"], confirmation["order_id"],
+                confirmation["target_goal"], confirmation["plan_details"]
+            ) else 0
+        else:
+            entries = [
+                f"""👤 <b>Пользователь:</b> {html.escape(confirmation['user_name'])} (ID: {confirmation['user_id']})
+📦 <b>Заказ:</b> #{confirmation['order_id']}
+🎯 <b>Цель:</b> "{html.escape(truncate(confirmation['target_goal'], _GOAL_LIMIT))}"
+📋 <b>План:</b> {html.escape(str(confirmation['plan_details'].get('name', 'Unknown')))}
+💰 <b>Сумма:</b> {html.escape(str(confirmation['plan_details'].get('price', 'Unknown')))}
+⏰ <b>Время:</b> {confirmation['time']}"""
+                for confirmation in confirmations
+            ]
+            sent = await self._send_entries(
+                entries,
+                "\n💰 <b>ПОДТВЕРЖДЕНИЯ ДОНАТОВ: {count}</b>\n\n",
+                "\n\n<b>Действие:</b> Пользователи подтвердили, что сделали донат на номер +79853659487"
+                "\n\n<b>Нужно подтвердить получение донатов!</b>\n",
+                "payments"
+            )
+        
+        if sent < len(confirmations) and self.admin_bot_token:
+            # Admins have to act on every confirmation, so undelivered ones are retried, never dropped
+            self._pending_donation_confirmations.extendleft(reversed(confirmations[sent:]))
+            self._schedule_delayed_flush(
+                "_donation_flush_task", self.flush_donation_confirmations, self.donation_flush_interval
+            )
+        return sent == len(confirmations)
     
     async def notify_setup_complete(self, user_id: int, order_id: str, target_goal: str, selected_plan: str):
         """Notify admin about setup completion"""
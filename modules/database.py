@@ -6,15 +6,144 @@ Handles all database operations for the Telegram bot.
 import sqlite3
 import json
 import logging
-from typing import Optional, Dict, Any, List
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, NamedTuple, Callable, Tuple
 from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
 
+class UserProfile(NamedTuple):
+    """Row of the users table with attribute access"""
+    user_id: int
+    username: Optional[str]
+    first_name: Optional[str]
+    last_name: Optional[str]
+    language: Optional[str]
+    city: Optional[str]
+    timezone: Optional[str]
+    timezone_offset: Optional[str]
+    timezone_name: Optional[str]
+    messaging_enabled: Optional[bool]
+    created_at: Optional[str]
+    updated_at: Optional[str]
+    last_activity: Optional[str]
+
+_USER_PROFILE_COLUMNS = ", ".join(UserProfile._fields)
+
+class ActiveSubscription(NamedTuple):
+    """Key columns of a user's active subscription"""
+    id: int
+    subscription_type: Optional[str]
+
+# Hot-path statements are kept as fixed module-level text: sqlite3 caches the
+# compiled statement per connection keyed by SQL text, so pooled connections
+# parse each of these once and only bind/execute afterwards.
+_SELECT_USER_PROFILE_SQL = f'SELECT {_USER_PROFILE_COLUMNS} FROM users WHERE user_id = ?'
+_SELECT_STATE_DATA_SQL = 'SELECT state_data FROM user_states WHERE user_id = ?'
+# Picks the requested top-level keys out of the stored blob inside SQLite;
+# json_each reports booleans as integers, so they are turned back into JSON
+_SELECT_STATE_FIELDS_SQL = ("SELECT (SELECT json_group_object(key, CASE type WHEN 'true' THEN json('true') "
+                            "WHEN 'false' THEN json('false') ELSE value END) "
+                            "FROM json_each(NULLIF(state_data, '')) WHERE key IN (SELECT value FROM json_each(?))) "
+                            'FROM user_states WHERE user_id = ?')
+_UPDATE_STATE_DATA_SQL = 'UPDATE user_states SET state_data = ?, updated_at = CURRENT_TIMESTAMP WHERE user_id = ?'
+_INSERT_STATE_DATA_SQL = ('INSERT INTO user_states (user_id, current_state, state_data, updated_at) '
+                          'VALUES (?, NULL, ?, CURRENT_TIMESTAMP)')
+_SELECT_ACTIVE_SUBSCRIPTION_SQL = ('SELECT * FROM subscriptions '
+                                   "WHERE user_id = ? AND status = 'active' AND end_date > CURRENT_TIMESTAMP "
+                                   'ORDER BY created_at DESC LIMIT 1')
+_SELECT_ACTIVE_SUBSCRIPTION_KEY_SQL = ('SELECT id, subscription_type FROM subscriptions '
+                                       "WHERE user_id = ? AND status = 'active' AND end_date > CURRENT_TIMESTAMP "
+                                       'ORDER BY created_at DESC LIMIT 1')
+
+# State blobs are written compactly and keep non-ASCII text as UTF-8: most
+# stored text is Cyrillic, which ASCII escaping would blow up to \uXXXX runs.
+_encode_state = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+
 class DatabaseManager:
-    def __init__(self, db_path: str = "bot_database.db"):
+    def __init__(self, db_path: str = "bot_database.db", pool_min_size: int = 2, pool_max_size: int = 8,
+                 state_cache_size: int = 4096):
         self.db_path = db_path
+        self.pool_min_size = pool_min_size
+        self.pool_max_size = pool_max_size
+        self._pool: List[sqlite3.Connection] = []
+        self._read_conn = None
+        # Write-through cache of state blobs as stored JSON text, least recently
+        # used first; decoded on every read so callers get their own copy
+        self.state_cache_size = state_cache_size
+        self._state_cache: "OrderedDict[int, str]" = OrderedDict()
+        # Event name -> callbacks taking user_id; see subscribe()
+        self._listeners = defaultdict(list)
         self.init_database()
+        # Warm the pool so the first requests of a burst skip the connect
+        self._pool.extend(self._open_connection() for _ in range(pool_min_size))
+    
+    def _open_connection(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, check_same_thread=False)
+    
+    @contextmanager
+    def _connection(self):
+        """Borrow a pooled connection; commits on success, rolls back on error.
+        
+        At most pool_max_size idle connections are kept; extra connections
+        opened under load are closed on release.
+        """
+        conn = self._pool.pop() if self._pool else self._open_connection()
+        try:
+            with conn:
+                yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            if len(self._pool) < self.pool_max_size:
+                self._pool.append(conn)
+            else:
+                conn.close()
+    
+    def _remember_state(self, user_id: int, data_json: str):
+        """Store a user's state JSON as it is in the database"""
+        self._state_cache[user_id] = data_json
+        self._state_cache.move_to_end(user_id)
+        if len(self._state_cache) > self.state_cache_size:
+            self._state_cache.popitem(last=False)
+    
+    def subscribe(self, event: str, callback: Callable[[int], Any]):
+        """Call callback(user_id) after writes that change a user's data.
+        
+        Events: "user_updated" (profile or state) and "subscription_updated".
+        """
+        self._listeners[event].append(callback)
+    
+    def _emit(self, event: str, user_id: int):
+        for callback in self._listeners.get(event, ()):
+            try:
+                callback(user_id)
+            except Exception as e:
+                logger.error(f"Error in {event} listener for user {user_id}: {e}")
+    
+    def _emit_for_order(self, cursor, order_id: str):
+        """Emit subscription_updated for the owner of an order"""
+        if not self._listeners.get("subscription_updated"):
+            return
+        cursor.execute('SELECT user_id FROM subscriptions WHERE order_id = ?', (order_id,))
+        result = cursor.fetchone()
+        if result:
+            self._emit("subscription_updated", result[0])
+    
+    def pooled_connection(self):
+        """Borrow a pooled connection for callers outside this module (see _connection)"""
+        return self._connection()
+    
+    def _read_connection(self) -> sqlite3.Connection:
+        """Shared autocommit connection for hot single-row reads.
+        
+        Reads never open a transaction on it, so it can be reused as-is
+        without the commit/teardown a fresh connection pays on every call.
+        """
+        if self._read_conn is None:
+            self._read_conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        return self._read_conn
     
     def init_database(self):
         """Initialize database tables"""
@@ -173,6 +302,14 @@ class DatabaseManager:
                 )
             ''')
             
+            # Sequences table - Named monotonically increasing counters
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS sequences (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            
             # Create indexes for better performance
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_messages_user_id ON user_messages(user_id)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_messages_created_at ON user_messages(created_at)')
@@ -182,6 +319,7 @@ class DatabaseManager:
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_content_delivery_delivered_at ON content_delivery(delivered_at)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_sessions_user_id ON user_sessions(user_id)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_feedback_user_id ON user_feedback(user_id)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_subscriptions_user_status ON subscriptions(user_id, status, end_date)')
             
             conn.commit()
             logger.info("Database initialized successfully with enhanced structure")
@@ -196,28 +334,30 @@ class DatabaseManager:
     async def initialize_user(self, user_id: int, username: str, first_name: str = None, last_name: str = None):
         """Initialize a new user in the database"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
-            
-            # Insert or update user
-            cursor.execute('''
-                INSERT OR REPLACE INTO users (user_id, username, first_name, last_name, updated_at, last_activity)
-                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
-            ''', (user_id, username, first_name, last_name))
-            
-            # Initialize user state
-            cursor.execute('''
-                INSERT OR REPLACE INTO user_states (user_id, current_state, state_data, onboarding_step, updated_at)
-                VALUES (?, 'onboarding', '{}', 0, CURRENT_TIMESTAMP)
-            ''', (user_id,))
-            
-            # Initialize user preferences
-            cursor.execute('''
-                INSERT OR IGNORE INTO user_preferences (user_id, setup_completed)
-                VALUES (?, FALSE)
-            ''', (user_id,))
-            
-            conn.commit()
+                
+                # Insert or update user
+                cursor.execute('''
+                    INSERT OR REPLACE INTO users (user_id, username, first_name, last_name, updated_at, last_activity)
+                    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+                ''', (user_id, username, first_name, last_name))
+                
+                # Initialize user state
+                cursor.execute('''
+                    INSERT OR REPLACE INTO user_states (user_id, current_state, state_data, onboarding_step, updated_at)
+                    VALUES (?, 'onboarding', '{}', 0, CURRENT_TIMESTAMP)
+                ''', (user_id,))
+                
+                # Initialize user preferences
+                cursor.execute('''
+                    INSERT OR IGNORE INTO user_preferences (user_id, setup_completed)
+                    VALUES (?, FALSE)
+                ''', (user_id,))
+                
+                conn.commit()
+                self._remember_state(user_id, '{}')
+                self._emit("user_updated", user_id)
             logger.info(f"User {user_id} initialized with enhanced structure")
             
         except sqlite3.Error as e:
@@ -229,7 +369,7 @@ class DatabaseManager:
     
     async def get_user_state(self, user_id: int) -> Optional[str]:
         """Get user's current state"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT current_state FROM user_states WHERE user_id = ?', (user_id,))
             result = cursor.fetchone()
@@ -237,20 +377,36 @@ class DatabaseManager:
     
     async def set_user_state(self, user_id: int, state: str, state_data: Dict[str, Any] = None):
         """Set user's current state"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
-            data_json = json.dumps(state_data or {})
+            data_json = _encode_state(state_data or {})
             cursor.execute('''
                 INSERT OR REPLACE INTO user_states (user_id, current_state, state_data, updated_at)
                 VALUES (?, ?, ?, CURRENT_TIMESTAMP)
             ''', (user_id, state, data_json))
             conn.commit()
+            self._remember_state(user_id, data_json)
+            self._emit("user_updated", user_id)
     
     async def get_user_state_data(self, user_id: int) -> Dict[str, Any]:
         """Get user's state data"""
-        with sqlite3.connect(self.db_path) as conn:
+        data_json = self._state_cache.get(user_id)
+        if data_json is None:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(_SELECT_STATE_DATA_SQL, (user_id,))
+                result = cursor.fetchone()
+                data_json = result[0] if result and result[0] else ''
+            self._remember_state(user_id, data_json)
+        else:
+            self._state_cache.move_to_end(user_id)
+        return json.loads(data_json) if data_json else {}
+    
+    async def get_user_state_fields(self, user_id: int, fields: Tuple[str, ...]) -> Dict[str, Any]:
+        """Get only the given top-level keys of a user's state data; missing keys are left out"""
+        with self._connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT state_data FROM user_states WHERE user_id = ?', (user_id,))
+            cursor.execute(_SELECT_STATE_FIELDS_SQL, (json.dumps(fields), user_id))
             result = cursor.fetchone()
             if result and result[0]:
                 return json.loads(result[0])
@@ -258,13 +414,116 @@ class DatabaseManager:
     
     async def update_user_state_data(self, user_id: int, data: Dict[str, Any]):
         """Update user's state data"""
-        current_data = await self.get_user_state_data(user_id)
-        current_data.update(data)
-        await self.set_user_state(user_id, await self.get_user_state(user_id), current_data)
+        await self.merge_user_state_data(user_id, data)
+    
+    async def merge_user_state_data(self, user_id: int, updates: Dict[str, Any]) -> Dict[str, Any]:
+        """Merge updates into user's state data in one round-trip and return the previous data"""
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            previous_data, data_json = self._merge_state_data(cursor, user_id, updates)
+            conn.commit()
+            self._remember_state(user_id, data_json)
+            self._emit("user_updated", user_id)
+            return previous_data
+    
+    async def update_user_state_data_and_get_profile(self, user_id: int, data: Dict[str, Any]) -> Optional[UserProfile]:
+        """Update user's state data and read their profile over a single connection"""
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            _, data_json = self._merge_state_data(cursor, user_id, data)
+            cursor.execute(_SELECT_USER_PROFILE_SQL, (user_id,))
+            result = cursor.fetchone()
+            conn.commit()
+            self._remember_state(user_id, data_json)
+            self._emit("user_updated", user_id)
+            return UserProfile(*result) if result else None
+    
+    async def prefetch_user_context(self, user_id: int) -> Dict[str, Any]:
+        """Read a user's profile and active subscription key from one snapshot"""
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN')
+            cursor.execute(_SELECT_USER_PROFILE_SQL, (user_id,))
+            result = cursor.fetchone()
+            profile = UserProfile(*result) if result else None
+            
+            cursor.execute(_SELECT_ACTIVE_SUBSCRIPTION_KEY_SQL, (user_id,))
+            result = cursor.fetchone()
+            subscription = ActiveSubscription(*result) if result else None
+            
+            return {"profile": profile, "subscription": subscription}
+    
+    async def get_user_bundle(self, user_id: int) -> Dict[str, Any]:
+        """Read a user's state data, full profile row and full active subscription row together"""
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN')
+            cursor.execute(_SELECT_STATE_DATA_SQL, (user_id,))
+            result = cursor.fetchone()
+            state_data = json.loads(result[0]) if result and result[0] else {}
+            
+            bundle = {"state": state_data, "profile": None, "subscription": None}
+            for key, sql in (("profile", 'SELECT * FROM users WHERE user_id = ?'),
+                             ("subscription", _SELECT_ACTIVE_SUBSCRIPTION_SQL)):
+                cursor.execute(sql, (user_id,))
+                result = cursor.fetchone()
+                if result:
+                    columns = [description[0] for description in cursor.description]
+                    bundle[key] = dict(zip(columns, result))
+            
+            return bundle
+    
+    async def mark_regular_plan_shown(self, user_id: int):
+        """Record that the Regular plan notice was shown and return the user to plan selection"""
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE user_states
+                SET state_data = json_set(COALESCE(NULLIF(state_data, ''), '{}'),
+                                          '$.step', 'plan_selection',
+                                          '$.regular_plan_shown_at', CAST(strftime('%s', 'now') AS INTEGER)),
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE user_id = ?
+            ''', (user_id,))
+            conn.commit()
+            # The new blob is built by SQLite, so the next read reloads it
+            self._state_cache.pop(user_id, None)
+            self._emit("user_updated", user_id)
+    
+    def _merge_state_data(self, cursor, user_id: int, updates: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
+        """Merge updates into the stored state data using an open cursor; returns the previous data and the new JSON"""
+        cursor.execute(_SELECT_STATE_DATA_SQL, (user_id,))
+        result = cursor.fetchone()
+        previous_data = json.loads(result[0]) if result and result[0] else {}
+        
+        merged_data = dict(previous_data)
+        merged_data.update(updates)
+        data_json = _encode_state(merged_data)
+        
+        if result:
+            cursor.execute(_UPDATE_STATE_DATA_SQL, (data_json, user_id))
+        else:
+            cursor.execute(_INSERT_STATE_DATA_SQL, (user_id, data_json))
+        return previous_data, data_json
+    
+    async def next_sequence_value(self, name: str) -> int:
+        """Atomically increment a named counter and return its new value"""
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO sequences (name, value) VALUES (?, 1)
+                ON CONFLICT(name) DO UPDATE SET value = value + 1
+            ''', (name,))
+            cursor.execute('SELECT value FROM sequences WHERE name = ?', (name,))
+            value = cursor.fetchone()[0]
+            conn.commit()
+            return value
     
     async def create_subscription(self, user_id: int, subscription_type: str, payment_id: str = None) -> int:
         """Create a new subscription"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             
             # Calculate end date based on subscription type
@@ -283,18 +542,15 @@ class DatabaseManager:
             
             subscription_id = cursor.lastrowid
             conn.commit()
+            self._emit("subscription_updated", user_id)
             logger.info(f"Subscription created for user {user_id}: {subscription_type}")
             return subscription_id
     
     async def get_active_subscription(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Get user's active subscription"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT * FROM subscriptions 
-                WHERE user_id = ? AND status = 'active' AND end_date > CURRENT_TIMESTAMP
-                ORDER BY created_at DESC LIMIT 1
-            ''', (user_id,))
+            cursor.execute(_SELECT_ACTIVE_SUBSCRIPTION_SQL, (user_id,))
             
             result = cursor.fetchone()
             if result:
@@ -302,9 +558,27 @@ class DatabaseManager:
                 return dict(zip(columns, result))
             return None
     
+    async def has_active_subscription(self, user_id: int) -> Optional[ActiveSubscription]:
+        """Get the id and type of user's active subscription, if there is one"""
+        cursor = self._read_connection().cursor()
+        cursor.execute(_SELECT_ACTIVE_SUBSCRIPTION_KEY_SQL, (user_id,))
+        result = cursor.fetchone()
+        return ActiveSubscription(*result) if result else None
+    
+    async def get_subscription(self, subscription_id: int) -> Optional[Dict[str, Any]]:
+        """Get a subscription row by id"""
+        cursor = self._read_connection().cursor()
+        cursor.execute('SELECT * FROM subscriptions WHERE id = ?', (subscription_id,))
+        result = cursor.fetchone()
+        
+        if result:
+            columns = [description[0] for description in cursor.description]
+            return dict(zip(columns, result))
+        return None
+    
     async def update_user_settings(self, user_id: int, key_texts: List[str], preferences: Dict[str, Any] = None):
         """Update user's settings and key texts"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             
             key_texts_json = json.dumps(key_texts)
@@ -320,7 +594,7 @@ class DatabaseManager:
     
     async def get_user_settings(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Get user's settings"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT * FROM user_settings WHERE user_id = ?', (user_id,))
             result = cursor.fetchone()
@@ -338,7 +612,7 @@ class DatabaseManager:
     
     async def log_iteration(self, user_id: int, iteration_number: int, content: str, status: str = "sent"):
         """Log an iteration sent to user"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO iterations (user_id, iteration_number, content, sent_at, status)
@@ -348,7 +622,7 @@ class DatabaseManager:
     
     async def get_user_iterations(self, user_id: int) -> List[Dict[str, Any]]:
         """Get user's iteration history"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT * FROM content_delivery WHERE user_id = ? ORDER BY delivered_at DESC
@@ -363,7 +637,7 @@ class DatabaseManager:
     async def store_user_message(self, user_id: int, message_text: str, message_type: str = "text", 
                                 module_context: str = None, state_context: str = None):
         """Store a message from user"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO user_messages (user_id, message_text, message_type, module_context, state_context)
@@ -381,7 +655,7 @@ class DatabaseManager:
     async def store_bot_message(self, user_id: int, message_text: str, message_type: str = "text",
                                module_context: str = None, state_context: str = None):
         """Store a message sent by bot"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO bot_messages (user_id, message_text, message_type, module_context, state_context)
@@ -393,7 +667,7 @@ class DatabaseManager:
     
     async def get_user_messages(self, user_id: int, limit: int = 100) -> List[Dict[str, Any]]:
         """Get user's message history"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT * FROM user_messages WHERE user_id = ? 
@@ -406,7 +680,7 @@ class DatabaseManager:
     
     async def get_bot_messages(self, user_id: int, limit: int = 100) -> List[Dict[str, Any]]:
         """Get bot's message history to user"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT * FROM bot_messages WHERE user_id = ? 
@@ -419,7 +693,7 @@ class DatabaseManager:
     
     async def get_conversation_history(self, user_id: int, limit: int = 50) -> List[Dict[str, Any]]:
         """Get combined conversation history (user + bot messages)"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT 'user' as sender, message_text, created_at as timestamp, module_context, state_context
@@ -452,7 +726,7 @@ class DatabaseManager:
         
         values.append(user_id)
         
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute(f'''
                 UPDATE users SET {', '.join(update_fields)}, updated_at = CURRENT_TIMESTAMP
@@ -460,24 +734,31 @@ class DatabaseManager:
             ''', values)
             
             conn.commit()
+            self._emit("user_updated", user_id)
             logger.info(f"Updated user profile for {user_id}")
     
     async def get_user_profile(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Get complete user profile"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
-            result = cursor.fetchone()
-            
-            if result:
-                columns = [description[0] for description in cursor.description]
-                return dict(zip(columns, result))
-            return None
+        cursor = self._read_connection().cursor()
+        cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
+        result = cursor.fetchone()
+        
+        if result:
+            columns = [description[0] for description in cursor.description]
+            return dict(zip(columns, result))
+        return None
+    
+    async def get_user_profile_record(self, user_id: int) -> Optional[UserProfile]:
+        """Get user profile as a UserProfile record"""
+        cursor = self._read_connection().cursor()
+        cursor.execute(_SELECT_USER_PROFILE_SQL, (user_id,))
+        result = cursor.fetchone()
+        return UserProfile(*result) if result else None
     
     async def store_user_feedback(self, user_id: int, feedback_type: str, feedback_text: str,
                                  rating: int = None, content_id: int = None):
         """Store user feedback"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO user_feedback (user_id, feedback_type, feedback_text, rating, content_id)
@@ -489,7 +770,7 @@ class DatabaseManager:
     
     async def get_user_feedback(self, user_id: int, limit: int = 50) -> List[Dict[str, Any]]:
         """Get user's feedback history"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT * FROM user_feedback WHERE user_id = ? 
@@ -502,7 +783,7 @@ class DatabaseManager:
     
     async def start_user_session(self, user_id: int) -> int:
         """Start a new user session"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO user_sessions (user_id, session_start)
@@ -517,7 +798,7 @@ class DatabaseManager:
     async def end_user_session(self, session_id: int, messages_count: int = 0, 
                               modules_used: str = None, session_data: str = None):
         """End a user session"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 UPDATE user_sessions 
@@ -530,7 +811,7 @@ class DatabaseManager:
     
     async def get_user_sessions(self, user_id: int, limit: int = 20) -> List[Dict[str, Any]]:
         """Get user's session history"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT * FROM user_sessions WHERE user_id = ? 
@@ -543,7 +824,7 @@ class DatabaseManager:
     
     async def get_user_statistics(self, user_id: int) -> Dict[str, Any]:
         """Get comprehensive user statistics"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             
             # Get basic counts
@@ -581,7 +862,7 @@ class DatabaseManager:
                                 subscription_type: str, plan_details: dict) -> bool:
         """Create a new subscription/order for a specific goal"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT INTO subscriptions (
@@ -596,6 +877,7 @@ class DatabaseManager:
                     plan_details.get('result_time', ''), 'pending_payment'
                 ))
                 conn.commit()
+                self._emit("subscription_updated", user_id)
                 logger.info(f"Created subscription {order_id} for user {user_id}")
                 return True
         except Exception as e:
@@ -605,7 +887,7 @@ class DatabaseManager:
     async def get_subscription_by_order_id(self, order_id: str) -> dict:
         """Get subscription details by order ID"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     SELECT * FROM subscriptions WHERE order_id = ?
@@ -623,7 +905,7 @@ class DatabaseManager:
                                        payment_id: str = None, payment_method: str = None) -> bool:
         """Update subscription status (e.g., after payment)"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 if payment_id and payment_method:
                     cursor.execute('''
@@ -639,6 +921,7 @@ class DatabaseManager:
                         WHERE order_id = ?
                     ''', (status, order_id))
                 conn.commit()
+                self._emit_for_order(cursor, order_id)
                 logger.info(f"Updated subscription {order_id} status to {status}")
                 return True
         except Exception as e:
@@ -648,7 +931,7 @@ class DatabaseManager:
     async def get_user_active_subscriptions(self, user_id: int) -> list:
         """Get all active subscriptions for a user"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     SELECT * FROM subscriptions 
@@ -667,7 +950,7 @@ class DatabaseManager:
     async def mark_goal_achieved(self, order_id: str) -> bool:
         """Mark a goal as achieved and end the subscription"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     UPDATE subscriptions 
@@ -676,6 +959,7 @@ class DatabaseManager:
                     WHERE order_id = ?
                 ''', (order_id,))
                 conn.commit()
+                self._emit_for_order(cursor, order_id)
                 logger.info(f"Marked goal as achieved for subscription {order_id}")
                 return True
         except Exception as e:
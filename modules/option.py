@@ -3,79 +3,408 @@ Option Module
 Handles subscription plan selection with three main scenarios: Extreme, 2-week, and Regular.
 """
 
+import asyncio
+import html
 import logging
+import re
+import time
+from functools import lru_cache, partial
+from types import MappingProxyType
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.constants import ParseMode
 from telegram.ext import ContextTypes
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from modules.admin_notifications import admin_notifications
+from modules.database import UserProfile
+from modules.paying import PayingModule
+from modules.performance import KeyedLock, TTLCache
+from modules.text_utils import truncate
 
 logger = logging.getLogger(__name__)
 
+_BASE36_DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+# City groups used for personalized recommendations (matched on lowercased city)
+_METRO_CITY_RE = re.compile(r"москв|спб|санкт")
+_REGIONAL_CITY_RE = re.compile(r"екатеринбург|новосибирск|красноярск")
+
+def _base36(number: int) -> str:
+    """Encode a positive integer in upper-case base36"""
+    digits = []
+    while number:
+        number, remainder = divmod(number, 36)
+        digits.append(_BASE36_DIGITS[remainder])
+    return "".join(reversed(digits)) or "0"
+
+# Goal-oriented subscription plans, shared read-only by every OptionModule
+_SUBSCRIPTION_PLANS = MappingProxyType({
+    "extreme": MappingProxyType({
+        "name": "Экстремальный план",
+        "duration": "7 дней",
+        "price": "₽4,990",
+        "approach": "10-15 минут каждые 2-3 часа",
+        "result_time": "Результат может быть достигнут в течение недели",
+        "features": (
+            "Интенсивная работа над целью",
+            "10-15 минут каждые 2-3 часа",
+            "Максимальная скорость достижения",
+            "Приоритетная поддержка",
+            "Неограниченные правки",
+            "Индивидуальные техники работы с реальностью"
+        ),
+        "description": "Для тех, кто готов к интенсивной работе и хочет достичь цели максимально быстро."
+    }),
+    "2week": MappingProxyType({
+        "name": "2-недельный план",
+        "duration": "14 дней",
+        "price": "₽2,490",
+        "approach": "15 минут в день",
+        "result_time": "Стабильный прогресс за 2 недели",
+        "features": (
+            "Ежедневная работа над целью",
+            "15 минут в день",
+            "Сбалансированный подход",
+            "Стандартная поддержка",
+            "3 правки на контент",
+            "Стандартные техники трансформации"
+        ),
+        "description": "Отличный выбор для стабильного прогресса в достижении цели."
+    }),
+    "regular": MappingProxyType({
+        "name": "Обычный план",
+        "duration": "30 дней",
+        "price": "₽990",
+        "approach": "Раз в день, более детальный подход",
+        "result_time": "Устойчивый результат за месяц",
+        "features": (
+            "Ежедневная работа над целью",
+            "Более детальный и устойчивый подход",
+            "Глубокое погружение в проблему",
+            "Базовая поддержка",
+            "1 правка на контент",
+            "Мягкие техники трансформации"
+        ),
+        "description": "Идеально для тех, кто предпочитает глубокий и устойчивый подход к достижению цели."
+    })
+})
+
+# Bullet list of each plan's features, rendered once for the plan details screen
+_FEATURES_TEXT = MappingProxyType({
+    plan_key: "\n".join(f"✅ {feature}" for feature in plan["features"])
+    for plan_key, plan in _SUBSCRIPTION_PLANS.items()
+})
+
+def _render_plan_details(plan_key: str) -> str:
+    """Render the details screen for a plan"""
+    plan = _SUBSCRIPTION_PLANS[plan_key]
+    return f"""
+🎯 **{plan['name']}**
+
+💰 **Цена:** {plan['price']} на {plan['duration']}
+
+📋 **Описание:**
+{plan['description']}
+
+✨ **Что включено:**
+{_FEATURES_TEXT[plan_key]}
+
+Готов выбрать этот план? 🚀
+        """
+
+# Plan screens depend only on the static catalogue, so they are rendered once
+_PLAN_DETAILS_TEXT = MappingProxyType({
+    plan_key: _render_plan_details(plan_key) for plan_key in _SUBSCRIPTION_PLANS
+})
+
+_PLAN_COMPARISON_TEXT = """
+📊 **Сравнение планов**
+
+| Характеристика | Обычный | 2-недельный | Экстремальный |
+|----------------|---------|-------------|---------------|
+| **Цена** | ₽990 | ₽2,490 | ₽4,990 |
+| **Длительность** | 7 дней | 14 дней | 30 дней |
+| **Частота** | Еженедельно | Каждые 2 дня | Ежедневно |
+| **Поддержка** | Базовая | Стандартная | Приоритетная |
+| **Правки** | 1 на контент | 3 на контент | Без ограничений |
+| **Шаблоны** | Базовые | Стандартные | Премиум |
+
+**💡 Рекомендации:**
+• **Обычный**: Идеально для начинающих и мягкого старта
+• **2-недельный**: Отлично для стабильных изменений
+• **Экстремальный**: Для тех, кто готов к кардинальным переменам
+
+Какой план тебя больше интересует? 🎯
+        """
+
+# Static segments of the larger per-user screens, joined around the dynamic values
+_GOAL_OVERVIEW_GOAL_LABEL = "🎯 **Твоя цель:** \""
+_GOAL_OVERVIEW_PLANS = (
+    "\"\n"
+    "\n"
+    "💎 **Выбери план для достижения этой цели:**\n"
+    "\n"
+    "Я предлагаю три подхода к работе с твоей целью:\n"
+    "\n"
+    "**🚀 Экстремальный план** - ₽4,990\n"
+    "• 10-15 минут каждые 2-3 часа\n"
+    "• Результат может быть достигнут в течение недели\n"
+    "\n"
+    "**⚡ 2-недельный план** - ₽2,490  \n"
+    "• 15 минут в день\n"
+    "• Стабильный прогресс за 2 недели\n"
+    "\n"
+    "**📝 Обычный план** - ₽990\n"
+    "• Раз в день, более детальный подход\n"
+    "• Устойчивый результат за месяц\n"
+    "\n"
+    "**Заказ №"
+)
+_GOAL_OVERVIEW_ORDER_NOTE = (
+    "** - каждый план работает только с одной целью до завершения.\n"
+    "\n"
+)
+_GOAL_OVERVIEW_FOOTER = (
+    "\n"
+    "\n"
+    "Какой подход тебе больше подходит? 🎯\n"
+    "        "
+)
+
+_VALIDATION_HEADER = (
+    "\n"
+    "🤔 **Важный вопрос о твоей цели**\n"
+    "\n"
+    "**Заказ №"
+)
+_VALIDATION_GOAL_LABEL = (
+    "**\n"
+    "🎯 **Твоя цель:** \""
+)
+_VALIDATION_FOOTER = (
+    "\n"
+    "\n"
+    "**Скажи честно:** Ты действительно веришь, что эта цель может быть достигнута в нашей вселенной за указанное время?\n"
+    "\n"
+    "Если твоя цель кажется слишком амбициозной или нереалистичной, я предлагаю:\n"
+    "\n"
+    "**🎯 Установить промежуточную цель** - серьезный шаг к твоей мечте, который:\n"
+    "• Реально достижим за выбранное время\n"
+    "• Даст тебе ощущение реального прогресса\n"
+    "• Приблизит к основной цели\n"
+    "• Покажет, что ты действительно движешься вперед\n"
+    "\n"
+    "**Примеры промежуточных целей:**\n"
+    "• Вместо \"стать миллионером\" → \"заработать первые 100,000 рублей\"\n"
+    "• Вместо \"найти любовь всей жизни\" → \"пойти на 3 свидания\"\n"
+    "• Вместо \"стать знаменитым\" → \"создать контент, который понравится 1000 людям\"\n"
+    "\n"
+    "**Что ты выберешь?**\n"
+    "1️⃣ Оставить текущую цель\n"
+    "2️⃣ Установить промежуточную цель\n"
+    "        "
+)
+
+_VALIDATION_PLAN_TEXT = MappingProxyType({
+    plan_key: "".join(("\"\n📋 **Выбранный план:** ", plan["name"], " - ", plan["result_time"], _VALIDATION_FOOTER))
+    for plan_key, plan in _SUBSCRIPTION_PLANS.items()
+})
+
+_CONFIRMATION_HEADER = (
+    "\n"
+    "🎉 **Отличный выбор!**\n"
+    "\n"
+    "**Заказ №"
+)
+_CONFIRMATION_GOAL_LABEL = (
+    "**\n"
+    "🎯 **Цель:** \""
+)
+_CONFIRMATION_FOOTER = (
+    "\n"
+    "\n"
+    "**Что дальше:**\n"
+    "1️⃣ Обработаю платеж безопасно\n"
+    "2️⃣ Начну работать с твоей целью\n"
+    "3️⃣ Буду доставлять персональный контент\n"
+    "4️⃣ Помогу достичь результата!\n"
+    "\n"
+    "Готов оплатить и начать работу над целью? 🚀\n"
+    "        "
+)
+
+_CONFIRMATION_PLAN_TEXT = MappingProxyType({
+    plan_key: "".join((
+        "\"\n📋 **План:** ", plan["name"], " - ", plan["price"],
+        "\n⏱️ **Подход:** ", plan["approach"], "\n🎯 **Результат:** ", plan["result_time"],
+        _CONFIRMATION_FOOTER
+    ))
+    for plan_key, plan in _SUBSCRIPTION_PLANS.items()
+})
+
+_INTERMEDIATE_GOAL_HEADER = (
+    "\n"
+    "🎯 **Отлично! Давай установим промежуточную цель**\n"
+    "\n"
+    "**Твоя основная мечта:** \""
+)
+_INTERMEDIATE_GOAL_FOOTER = (
+    "\"\n"
+    "\n"
+    "Теперь подумай и напиши **промежуточную цель** - серьезный шаг к твоей мечте, который:\n"
+    "\n"
+    "✅ **Реально достижим** за выбранное время\n"
+    "✅ **Даст ощущение прогресса** - ты почувствуешь, что движешься вперед\n"
+    "✅ **Приблизит к основной цели** - это будет важный шаг к мечте\n"
+    "✅ **Мотивирует продолжать** - после достижения захочется идти дальше\n"
+    "\n"
+    "**Примеры хороших промежуточных целей:**\n"
+    "• \"Найти 3 интересные вакансии и подать заявки\"\n"
+    "• \"Пойти на 2 свидания с разными людьми\"\n"
+    "• \"Создать первый контент и получить 100 лайков\"\n"
+    "• \"Найти 5 способов дополнительного заработка\"\n"
+    "• \"Начать заниматься спортом 3 раза в неделю\"\n"
+    "\n"
+    "**Напиши свою промежуточную цель:**\n"
+    "        "
+)
+
+# Regular plan is not available yet; only the order and goal vary on this screen.
+# Sent as HTML, so the goal only needs html.escape.
+_REGULAR_DEVELOPMENT_HEADER = (
+    "\n"
+    "🚧 <b>Обычный план в разработке</b>\n"
+    "\n"
+    "<b>Заказ №"
+)
+_REGULAR_DEVELOPMENT_GOAL_LABEL = (
+    "</b>\n"
+    "🎯 <b>Твоя цель:</b> \""
+)
+_REGULAR_DEVELOPMENT_FOOTER = (
+    "\"\n"
+    "\n"
+    "К сожалению, <b>Обычный план</b> сейчас находится в процессе разработки и пока недоступен.\n"
+    "\n"
+    "<b>Что это означает:</b>\n"
+    "• Мы работаем над созданием более детального и устойчивого подхода\n"
+    "• План будет включать глубокую работу с твоей целью\n"
+    "• Ожидаем запуск в ближайшее время\n"
+    "\n"
+    "<b>Твоя заявка сохранена!</b> 📝\n"
+    "Мы уведомили администратора о твоем интересе к Обычному плану.\n"
+    "\n"
+    "<b>Пока что предлагаем выбрать один из доступных планов:</b>\n"
+    "\n"
+    "<b>🚀 Экстремальный план</b> - ₽4,990\n"
+    "• 10-15 минут каждые 2-3 часа\n"
+    "• Результат может быть достигнут в течение недели\n"
+    "\n"
+    "<b>⚡ 2-недельный план</b> - ₽2,490\n"
+    "• 15 минут в день\n"
+    "• Стабильный прогресс за 2 недели\n"
+    "\n"
+    "Какой план тебе больше подходит? 🎯\n"
+    "        "
+)
+
+@lru_cache(maxsize=4096)
+def _build_regular_development_text(order_id: str, display_goal: str) -> str:
+    """Render the regular-plan notice; repeated clicks for the same order hit the cache"""
+    return "".join((
+        _REGULAR_DEVELOPMENT_HEADER, order_id, _REGULAR_DEVELOPMENT_GOAL_LABEL,
+        html.escape(display_goal), _REGULAR_DEVELOPMENT_FOOTER
+    ))
+
+_REGULAR_DEVELOPMENT_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🚀 Экстремальный план", callback_data="plan_extreme")],
+    [InlineKeyboardButton("⚡ 2-недельный план", callback_data="plan_2week")],
+    [InlineKeyboardButton("🔙 Назад к планам", callback_data="back_to_plans")]
+])
+
+_PLAN_OVERVIEW_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📊 Сравнить планы", callback_data="compare_plans")],
+    [InlineKeyboardButton("🚀 Экстремальный", callback_data="plan_extreme")],
+    [InlineKeyboardButton("⚡ 2-недельный", callback_data="plan_2week")],
+    [InlineKeyboardButton("📝 Обычный", callback_data="plan_regular")]
+])
+
+_PLAN_DETAILS_MARKUP = MappingProxyType({
+    plan_key: InlineKeyboardMarkup([
+        [InlineKeyboardButton(f"✅ Выбрать {plan['name']}", callback_data=f"select_{plan_key}")],
+        [InlineKeyboardButton("🔙 Назад к планам", callback_data="back_to_plans")],
+        [InlineKeyboardButton("❓ Задать вопросы", callback_data="ask_plan_questions")]
+    ])
+    for plan_key, plan in _SUBSCRIPTION_PLANS.items()
+})
+
+_PLAN_COMPARISON_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📝 Обычный план", callback_data="plan_regular")],
+    [InlineKeyboardButton("⚡ 2-недельный план", callback_data="plan_2week")],
+    [InlineKeyboardButton("🚀 Экстремальный план", callback_data="plan_extreme")],
+    [InlineKeyboardButton("🔙 Назад к обзору", callback_data="back_to_overview")]
+])
+
+_GOAL_VALIDATION_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("✅ Оставить текущую цель", callback_data="keep_original_goal")],
+    [InlineKeyboardButton("🎯 Установить промежуточную", callback_data="set_intermediate_goal")]
+])
+
+_PLAN_CONFIRMATION_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("💳 Оплатить и начать", callback_data="confirm_plan")],
+    [InlineKeyboardButton("🔙 Изменить план", callback_data="back_to_plans")]
+])
+
+_PLAN_HELP_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🚀 Экстремальный план", callback_data="plan_extreme")],
+    [InlineKeyboardButton("⚡ 2-недельный план", callback_data="plan_2week")],
+    [InlineKeyboardButton("📝 Обычный план", callback_data="plan_regular")],
+    [InlineKeyboardButton("📊 Сравнить все планы", callback_data="compare_plans")]
+])
+
+_PLAN_QUESTIONS_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🚀 Экстремальный план", callback_data="plan_extreme")],
+    [InlineKeyboardButton("⚡ 2-недельный план", callback_data="plan_2week")],
+    [InlineKeyboardButton("📝 Обычный план", callback_data="plan_regular")],
+    [InlineKeyboardButton("🔙 Назад к планам", callback_data="back_to_plans")]
+])
+
 class OptionModule:
     def __init__(self, db_manager, state_manager, bot_instance=None):
         self.db_manager = db_manager
         self.state_manager = state_manager
         self.bot_instance = bot_instance
-        
-        # Define goal-oriented subscription plans
-        self.subscription_plans = {
-            "extreme": {
-                "name": "Экстремальный план",
-                "duration": "7 дней",
-                "price": "₽4,990",
-                "approach": "10-15 минут каждые 2-3 часа",
-                "result_time": "Результат может быть достигнут в течение недели",
-                "features": [
-                    "Интенсивная работа над целью",
-                    "10-15 минут каждые 2-3 часа",
-                    "Максимальная скорость достижения",
-                    "Приоритетная поддержка",
-                    "Неограниченные правки",
-                    "Индивидуальные техники работы с реальностью"
-                ],
-                "description": "Для тех, кто готов к интенсивной работе и хочет достичь цели максимально быстро."
-            },
-            "2week": {
-                "name": "2-недельный план",
-                "duration": "14 дней",
-                "price": "₽2,490",
-                "approach": "15 минут в день",
-                "result_time": "Стабильный прогресс за 2 недели",
-                "features": [
-                    "Ежедневная работа над целью",
-                    "15 минут в день",
-                    "Сбалансированный подход",
-                    "Стандартная поддержка",
-                    "3 правки на контент",
-                    "Стандартные техники трансформации"
-                ],
-                "description": "Отличный выбор для стабильного прогресса в достижении цели."
-            },
-            "regular": {
-                "name": "Обычный план",
-                "duration": "30 дней",
-                "price": "₽990",
-                "approach": "Раз в день, более детальный подход",
-                "result_time": "Устойчивый результат за месяц",
-                "features": [
-                    "Ежедневная работа над целью",
-                    "Более детальный и устойчивый подход",
-                    "Глубокое погружение в проблему",
-                    "Базовая поддержка",
-                    "1 правка на контент",
-                    "Мягкие техники трансформации"
-                ],
-                "description": "Идеально для тех, кто предпочитает глубокий и устойчивый подход к достижению цели."
-            }
+        self._paying_module = None
+        
+        # Short-lived profile cache keyed by user_id; expired entries are pruned on insert,
+        # and once 1024 users are cached the oldest entry is evicted
+        self._profile_cache = TTLCache(ttl=60, max_size=1024)
+        
+        # Option-flow updates are serialized per chat
+        self._chat_locks = KeyedLock()
+        # Callbacks being handled: (chat_id, callback data) -> completion future
+        self._inflight_callbacks = {}
+        # Plan confirmations finishing in the background, keyed by chat_id
+        self._confirmation_tasks = {}
+        
+        self.subscription_plans = _SUBSCRIPTION_PLANS
+        
+        # Callbacks whose data maps directly to a handler
+        self._callback_handlers = {
+            "compare_plans": self._show_plan_comparison,
+            "back_to_plans": self._show_plan_overview,
+            "back_to_overview": self._show_plan_overview,
+            "confirm_plan": self._confirm_plan_selection,
+            "ask_plan_questions": self._handle_plan_questions
         }
     
     async def start_option_selection(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Start the goal collection and option selection process"""
         user_id = update.effective_user.id
         
-        # Get user profile for personalized greeting
-        user_profile = await self.db_manager.get_user_profile(user_id)
-        user_name = user_profile.get("first_name", "") if user_profile else ""
+        # Get user profile for personalized greeting; entering the module always reads it fresh
+        self._profile_cache.pop(user_id, None)
+        user_profile = await self._get_user_profile(user_id)
+        user_name = (user_profile.first_name or "") if user_profile else ""
         
         # Update user state to goal collection
         await self.db_manager.set_user_state(user_id, "option_selection", {"step": "goal_collection"})
@@ -84,33 +413,34 @@ class OptionModule:
     
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle messages during option selection"""
-        user_id = update.effective_user.id
-        message_text = update.message.text
-        user_state_data = await self.db_manager.get_user_state_data(user_id)
-        current_step = user_state_data.get("step", "goal_collection")
-        
-        if current_step == "goal_collection":
-            # Store user's goal and move to plan selection
-            await self._process_goal_input(update, context, message_text)
-        elif current_step == "plan_selection":
-            # Handle plan selection
-            message_text_lower = message_text.lower()
-            if any(plan in message_text_lower for plan in ["extreme", "экстремальный", "2week", "2-week", "2-недельный", "двухнедельный", "regular", "basic", "обычный", "стандартный"]):
-                if "extreme" in message_text_lower or "экстремальный" in message_text_lower:
-                    await self._select_plan(update, context, "extreme")
-                elif "2week" in message_text_lower or "2-week" in message_text_lower or "2-недельный" in message_text_lower or "двухнедельный" in message_text_lower:
-                    await self._select_plan(update, context, "2week")
-                elif "regular" in message_text_lower or "basic" in message_text_lower or "обычный" in message_text_lower or "стандартный" in message_text_lower:
-                    await self._select_plan(update, context, "regular")
-            else:
-                # Show help message
-                await self._show_help_message(update, context)
-        elif current_step == "goal_validation":
-            # Handle goal validation response
-            await self._process_goal_validation(update, context, message_text)
-        elif current_step == "intermediate_goal_collection":
-            # Handle intermediate goal input
-            await self._process_intermediate_goal(update, context, message_text)
+        async with self._chat_locks.hold(update.effective_chat.id):
+            user_id = update.effective_user.id
+            message_text = update.message.text
+            user_state_data = await self.db_manager.get_user_state_data(user_id)
+            current_step = user_state_data.get("step", "goal_collection")
+            
+            if current_step == "goal_collection":
+                # Store user's goal and move to plan selection
+                await self._process_goal_input(update, context, message_text)
+            elif current_step == "plan_selection":
+                # Handle plan selection
+                message_text_lower = message_text.lower()
+                if any(plan in message_text_lower for plan in ["extreme", "экстремальный", "2week", "2-week", "2-недельный", "двухнедельный", "regular", "basic", "обычный", "стандартный"]):
+                    if "extreme" in message_text_lower or "экстремальный" in message_text_lower:
+                        await self._select_plan(update, context, "extreme")
+                    elif "2week" in message_text_lower or "2-week" in message_text_lower or "2-недельный" in message_text_lower or "двухнедельный" in message_text_lower:
+                        await self._select_plan(update, context, "2week")
+                    elif "regular" in message_text_lower or "basic" in message_text_lower or "обычный" in message_text_lower or "стандартный" in message_text_lower:
+                        await self._select_plan(update, context, "regular")
+                else:
+                    # Show help message
+                    await self._show_help_message(update, context)
+            elif current_step == "goal_validation":
+                # Handle goal validation response
+                await self._process_goal_validation(update, context, message_text)
+            elif current_step == "intermediate_goal_collection":
+                # Handle intermediate goal input
+                await self._process_intermediate_goal(update, context, message_text)
     
     async def _show_plan_overview(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_name: str = ""):
         """Show overview of all available plans"""
@@ -148,219 +478,127 @@ class OptionModule:
 Давай посмотрим детальное сравнение! 👇
         """
         
-        keyboard = [
-            [InlineKeyboardButton("📊 Сравнить планы", callback_data="compare_plans")],
-            [InlineKeyboardButton("🚀 Экстремальный", callback_data="plan_extreme")],
-            [InlineKeyboardButton("⚡ 2-недельный", callback_data="plan_2week")],
-            [InlineKeyboardButton("📝 Обычный", callback_data="plan_regular")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(overview_text, parse_mode='Markdown', reply_markup=reply_markup)
+        await update.message.reply_text(overview_text, parse_mode='Markdown', reply_markup=_PLAN_OVERVIEW_MARKUP)
     
     async def _show_plan_details(self, update: Update, context: ContextTypes.DEFAULT_TYPE, plan_key: str):
         """Show detailed information about a specific plan"""
-        plan = self.subscription_plans[plan_key]
-        
-        features_text = "\n".join([f"✅ {feature}" for feature in plan["features"]])
-        
-        details_text = f"""
-🎯 **{plan['name']}**
-
-💰 **Цена:** {plan['price']} на {plan['duration']}
-
-📋 **Описание:**
-{plan['description']}
-
-✨ **Что включено:**
-{features_text}
-
-Готов выбрать этот план? 🚀
-        """
+        details_text = _PLAN_DETAILS_TEXT[plan_key]
         
-        keyboard = [
-            [InlineKeyboardButton(f"✅ Выбрать {plan['name']}", callback_data=f"select_{plan_key}")],
-            [InlineKeyboardButton("🔙 Назад к планам", callback_data="back_to_plans")],
-            [InlineKeyboardButton("❓ Задать вопросы", callback_data="ask_plan_questions")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.callback_query.edit_message_text(details_text, parse_mode='Markdown', reply_markup=reply_markup)
+        await update.callback_query.edit_message_text(details_text, parse_mode='Markdown', reply_markup=_PLAN_DETAILS_MARKUP[plan_key])
     
     async def _show_plan_comparison(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show detailed comparison of all plans"""
-        comparison_text = """
-📊 **Сравнение планов**
-
-| Характеристика | Обычный | 2-недельный | Экстремальный |
-|----------------|---------|-------------|---------------|
-| **Цена** | ₽990 | ₽2,490 | ₽4,990 |
-| **Длительность** | 7 дней | 14 дней | 30 дней |
-| **Частота** | Еженедельно | Каждые 2 дня | Ежедневно |
-| **Поддержка** | Базовая | Стандартная | Приоритетная |
-| **Правки** | 1 на контент | 3 на контент | Без ограничений |
-| **Шаблоны** | Базовые | Стандартные | Премиум |
-
-**💡 Рекомендации:**
-• **Обычный**: Идеально для начинающих и мягкого старта
-• **2-недельный**: Отлично для стабильных изменений
-• **Экстремальный**: Для тех, кто готов к кардинальным переменам
-
-Какой план тебя больше интересует? 🎯
-        """
+        comparison_text = _PLAN_COMPARISON_TEXT
         
-        keyboard = [
-            [InlineKeyboardButton("📝 Обычный план", callback_data="plan_regular")],
-            [InlineKeyboardButton("⚡ 2-недельный план", callback_data="plan_2week")],
-            [InlineKeyboardButton("🚀 Экстремальный план", callback_data="plan_extreme")],
-            [InlineKeyboardButton("🔙 Назад к обзору", callback_data="back_to_overview")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.callback_query.edit_message_text(comparison_text, parse_mode='Markdown', reply_markup=reply_markup)
+        await update.callback_query.edit_message_text(comparison_text, parse_mode='Markdown', reply_markup=_PLAN_COMPARISON_MARKUP)
     
     async def _select_plan(self, update: Update, context: ContextTypes.DEFAULT_TYPE, plan_key: str):
         """Handle plan selection"""
         user_id = update.effective_user.id
         plan = self.subscription_plans[plan_key]
-        user_state_data = await self.db_manager.get_user_state_data(user_id)
         
-        user_goal = user_state_data.get("user_goal", "")
-        order_id = user_state_data.get("current_order_id", "")
-        
-        # Update user state with selected plan
-        await self.db_manager.update_user_state_data(user_id, {
+        # Update user state with selected plan, reading the goal in the same round-trip
+        user_state_data = await self.db_manager.merge_user_state_data(user_id, {
             "selected_plan": plan_key,
-            "plan_details": plan
+            "plan_details": dict(plan)
         })
         
+        user_goal = user_state_data.get("user_goal", "")
+        display_goal = user_state_data.get("display_goal") or truncate(user_goal, 80)
+        order_id = user_state_data.get("current_order_id", "")
+        
         # For Extreme and 2-week plans, validate goal realism
         if plan_key in ["extreme", "2week"]:
-            await self._validate_goal_realism(update, context, user_goal, plan_key, order_id)
+            await self._validate_goal_realism(update, context, display_goal, plan_key, order_id)
         elif plan_key == "regular":
             # For Regular plan, show development notice
-            await self._handle_regular_development(update, context, user_goal, order_id)
+            await self._handle_regular_development(update, context, order_id, display_goal)
         else:
             # For other plans, proceed directly to confirmation
-            await self._show_plan_confirmation(update, context, user_goal, plan_key, order_id)
+            await self._show_plan_confirmation(update, context, display_goal, plan_key, order_id)
     
-    async def _validate_goal_realism(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_goal: str, plan_key: str, order_id: str):
+    async def _validate_goal_realism(self, update: Update, context: ContextTypes.DEFAULT_TYPE, display_goal: str, plan_key: str, order_id: str):
         """Validate if the goal is realistic for the selected plan"""
         user_id = update.effective_user.id
-        plan = self.subscription_plans[plan_key]
         
-        # Truncate goal for display
-        display_goal = user_goal[:80] + "..." if len(user_goal) > 80 else user_goal
-        
-        validation_text = f"""
-🤔 **Важный вопрос о твоей цели**
-
-**Заказ №{order_id}**
-🎯 **Твоя цель:** "{display_goal}"
-📋 **Выбранный план:** {plan['name']} - {plan['result_time']}
-
-**Скажи честно:** Ты действительно веришь, что эта цель может быть достигнута в нашей вселенной за указанное время?
-
-Если твоя цель кажется слишком амбициозной или нереалистичной, я предлагаю:
-
-**🎯 Установить промежуточную цель** - серьезный шаг к твоей мечте, который:
-• Реально достижим за выбранное время
-• Даст тебе ощущение реального прогресса
-• Приблизит к основной цели
-• Покажет, что ты действительно движешься вперед
-
-**Примеры промежуточных целей:**
-• Вместо "стать миллионером" → "заработать первые 100,000 рублей"
-• Вместо "найти любовь всей жизни" → "пойти на 3 свидания"
-• Вместо "стать знаменитым" → "создать контент, который понравится 1000 людям"
-
-**Что ты выберешь?**
-1️⃣ Оставить текущую цель
-2️⃣ Установить промежуточную цель
-        """
-        
-        keyboard = [
-            [InlineKeyboardButton("✅ Оставить текущую цель", callback_data="keep_original_goal")],
-            [InlineKeyboardButton("🎯 Установить промежуточную", callback_data="set_intermediate_goal")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        validation_text = "".join((
+            _VALIDATION_HEADER, order_id, _VALIDATION_GOAL_LABEL, display_goal, _VALIDATION_PLAN_TEXT[plan_key]
+        ))
         
         # Update state to goal validation
         await self.db_manager.update_user_state_data(user_id, {"step": "goal_validation"})
         
-        await update.message.reply_text(validation_text, parse_mode='Markdown', reply_markup=reply_markup)
+        await update.message.reply_text(validation_text, parse_mode='Markdown', reply_markup=_GOAL_VALIDATION_MARKUP)
     
-    async def _show_plan_confirmation(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_goal: str, plan_key: str, order_id: str):
+    async def _show_plan_confirmation(self, update: Update, context: ContextTypes.DEFAULT_TYPE, display_goal: str, plan_key: str, order_id: str):
         """Show plan confirmation"""
         user_id = update.effective_user.id
-        plan = self.subscription_plans[plan_key]
         
-        # Truncate goal for display
-        display_goal = user_goal[:80] + "..." if len(user_goal) > 80 else user_goal
+        confirmation_text = "".join((
+            _CONFIRMATION_HEADER, order_id, _CONFIRMATION_GOAL_LABEL, display_goal, _CONFIRMATION_PLAN_TEXT[plan_key]
+        ))
         
-        confirmation_text = f"""
-🎉 **Отличный выбор!**
-
-**Заказ №{order_id}**
-🎯 **Цель:** "{display_goal}"
-📋 **План:** {plan['name']} - {plan['price']}
-⏱️ **Подход:** {plan['approach']}
-🎯 **Результат:** {plan['result_time']}
-
-**Что дальше:**
-1️⃣ Обработаю платеж безопасно
-2️⃣ Начну работать с твоей целью
-3️⃣ Буду доставлять персональный контент
-4️⃣ Помогу достичь результата!
-
-Готов оплатить и начать работу над целью? 🚀
-        """
-        
-        keyboard = [
-            [InlineKeyboardButton("💳 Оплатить и начать", callback_data="confirm_plan")],
-            [InlineKeyboardButton("🔙 Изменить план", callback_data="back_to_plans")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(confirmation_text, parse_mode='Markdown', reply_markup=reply_markup)
+        await update.message.reply_text(confirmation_text, parse_mode='Markdown', reply_markup=_PLAN_CONFIRMATION_MARKUP)
     
     async def _confirm_plan_selection(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Confirm plan selection and move to payment"""
-        user_id = update.effective_user.id
-        user_state_data = await self.db_manager.get_user_state_data(user_id)
-        
-        # Use final target goal (could be original or intermediate)
-        final_target_goal = user_state_data.get("final_target_goal", user_state_data.get("user_goal", ""))
-        order_id = user_state_data.get("current_order_id", "")
-        selected_plan = user_state_data.get("selected_plan", "")
-        plan_details = user_state_data.get("plan_details", {})
-        
-        # Create subscription in database with final target goal
-        subscription_created = await self.db_manager.create_subscription(
-            user_id=user_id,
-            order_id=order_id,
-            user_goal=final_target_goal,
-            subscription_type=selected_plan,
-            plan_details=plan_details
-        )
-        
-        if not subscription_created:
-            await update.callback_query.edit_message_text(
-                "❌ Произошла ошибка при создании заказа. Попробуйте еще раз.",
-                parse_mode='Markdown'
-            )
+        """Confirm plan selection, creating the order in the background"""
+        chat_id = update.effective_chat.id
+        task = self._confirmation_tasks.get(chat_id)
+        if task is not None and not task.done():
+            # The order from an earlier press is still being created
             return
         
-        # Move to payment phase
-        await self.db_manager.set_user_state(user_id, "payment", {
-            "order_id": order_id,
-            "user_goal": final_target_goal,
-            "original_goal": user_state_data.get("original_goal", ""),
-            "selected_plan": selected_plan,
-            "plan_details": plan_details
-        })
-        
-        confirmation_text = f"""
+        # The callback returns right away; the message is edited once the order exists
+        task = asyncio.create_task(self._finish_plan_confirmation(update, context))
+        self._confirmation_tasks[chat_id] = task
+        task.add_done_callback(partial(self._forget_confirmation, chat_id))
+    
+    def _forget_confirmation(self, chat_id: int, task: asyncio.Task):
+        """Drop a finished confirmation task unless a newer one replaced it"""
+        if self._confirmation_tasks.get(chat_id) is task:
+            del self._confirmation_tasks[chat_id]
+    
+    async def _finish_plan_confirmation(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Create the subscription, move the user to payment and edit the confirmation message"""
+        user_id = update.effective_user.id
+        try:
+            async with self._chat_locks.hold(update.effective_chat.id):
+                user_state_data = await self.db_manager.get_user_state_data(user_id)
+                
+                # Use final target goal (could be original or intermediate)
+                user_goal = user_state_data.get("user_goal", "")
+                final_target_goal = user_state_data.get("final_target_goal", user_goal)
+                original_goal = user_goal if final_target_goal != user_goal else ""
+                order_id = user_state_data.get("current_order_id", "")
+                selected_plan = user_state_data.get("selected_plan", "")
+                plan_details = user_state_data.get("plan_details", {})
+                
+                # Create subscription in database with final target goal
+                subscription_created = await self.db_manager.create_subscription(
+                    user_id=user_id,
+                    order_id=order_id,
+                    user_goal=final_target_goal,
+                    subscription_type=selected_plan,
+                    plan_details=plan_details
+                )
+                
+                if not subscription_created:
+                    await update.callback_query.edit_message_text(
+                        "❌ Произошла ошибка при создании заказа. Попробуйте еще раз.",
+                        parse_mode='Markdown'
+                    )
+                    return
+                
+                # Move to payment phase
+                await self.db_manager.set_user_state(user_id, "payment", {
+                    "order_id": order_id,
+                    "user_goal": final_target_goal,
+                    "original_goal": original_goal,
+                    "selected_plan": selected_plan,
+                    "plan_details": plan_details
+                })
+                
+                confirmation_text = f"""
 🎊 **План подтвержден!**
 
 **Заказ №{order_id} готов к оплате!**
@@ -368,14 +606,25 @@ class OptionModule:
 Теперь переходим к безопасной оплате, чтобы начать работу над твоей целью.
 
 После подтверждения платежа я сразу начну создавать персональный контент для достижения твоей цели! ✨
-        """
-        
-        await update.callback_query.edit_message_text(confirmation_text, parse_mode='Markdown')
-        
-        # Import here to avoid circular imports
-        from modules.paying import PayingModule
-        paying_module = PayingModule(self.db_manager, self.state_manager)
-        await paying_module.start_payment(update, context)
+                """
+                
+                await update.callback_query.edit_message_text(confirmation_text, parse_mode='Markdown')
+                
+                await self._get_paying_module().start_payment(update, context)
+        except Exception as e:
+            logger.error(f"Error confirming plan for user {user_id}: {e}")
+    
+    async def _get_user_profile(self, user_id: int) -> Optional[UserProfile]:
+        """Get user profile, reusing a recent read for the same user"""
+        return await self._profile_cache.get_or_load(
+            user_id, lambda: self.db_manager.get_user_profile_record(user_id)
+        )
+    
+    def _get_paying_module(self) -> PayingModule:
+        """Return the payment module, reusing the bot's instance when available"""
+        if self._paying_module is None:
+            self._paying_module = getattr(self.bot_instance, "paying", None) or PayingModule(self.db_manager, self.state_manager)
+        return self._paying_module
     
     async def _show_help_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show help message for plan selection"""
@@ -394,37 +643,43 @@ class OptionModule:
 О каком плане ты хочешь узнать больше? 🤔
         """
         
-        keyboard = [
-            [InlineKeyboardButton("🚀 Экстремальный план", callback_data="plan_extreme")],
-            [InlineKeyboardButton("⚡ 2-недельный план", callback_data="plan_2week")],
-            [InlineKeyboardButton("📝 Обычный план", callback_data="plan_regular")],
-            [InlineKeyboardButton("📊 Сравнить все планы", callback_data="compare_plans")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(help_text, parse_mode='Markdown', reply_markup=reply_markup)
+        await update.message.reply_text(help_text, parse_mode='Markdown', reply_markup=_PLAN_HELP_MARKUP)
     
     async def handle_callback_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle callback queries from inline keyboards"""
         query = update.callback_query
-        await query.answer()
-        
-        if query.data == "compare_plans":
-            await self._show_plan_comparison(update, context)
-        elif query.data == "back_to_plans":
-            await self._show_plan_overview(update, context)
-        elif query.data == "back_to_overview":
-            await self._show_plan_overview(update, context)
-        elif query.data.startswith("plan_"):
-            plan_key = query.data.split("_")[1]
-            await self._show_plan_details(update, context, plan_key)
-        elif query.data.startswith("select_"):
-            plan_key = query.data.split("_")[1]
-            await self._select_plan(update, context, plan_key)
-        elif query.data == "confirm_plan":
-            await self._confirm_plan_selection(update, context)
-        elif query.data == "ask_plan_questions":
-            await self._handle_plan_questions(update, context)
+        
+        # Acknowledge the callback right away so the spinner clears while the
+        # handler below is still doing its DB round-trips
+        ack = asyncio.create_task(query.answer())
+        try:
+            chat_id = update.effective_chat.id
+            data = query.data
+            
+            # A repeated press of the same button while the first one is still
+            # being handled just waits for it instead of redoing the work
+            key = (chat_id, data)
+            inflight = self._inflight_callbacks.get(key)
+            if inflight is not None:
+                await inflight
+                return
+            
+            done = asyncio.get_running_loop().create_future()
+            self._inflight_callbacks[key] = done
+            try:
+                async with self._chat_locks.hold(chat_id):
+                    handler = self._callback_handlers.get(data)
+                    if handler:
+                        await handler(update, context)
+                    elif data[:5] == "plan_":
+                        await self._show_plan_details(update, context, data[5:])
+                    elif data[:7] == "select_":
+                        await self._select_plan(update, context, data[7:])
+            finally:
+                del self._inflight_callbacks[key]
+                done.set_result(None)
+        finally:
+            await ack
     
     async def _handle_plan_questions(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle questions about plans"""
@@ -449,26 +704,18 @@ class OptionModule:
 Готов выбрать план сейчас? 🎯
         """
         
-        keyboard = [
-            [InlineKeyboardButton("🚀 Экстремальный план", callback_data="plan_extreme")],
-            [InlineKeyboardButton("⚡ 2-недельный план", callback_data="plan_2week")],
-            [InlineKeyboardButton("📝 Обычный план", callback_data="plan_regular")],
-            [InlineKeyboardButton("🔙 Назад к планам", callback_data="back_to_plans")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.callback_query.edit_message_text(questions_text, parse_mode='Markdown', reply_markup=reply_markup)
+        await update.callback_query.edit_message_text(questions_text, parse_mode='Markdown', reply_markup=_PLAN_QUESTIONS_MARKUP)
     
     async def _get_personalized_recommendation(self, user_id: int) -> str:
         """Get personalized plan recommendation based on user profile"""
-        user_profile = await self.db_manager.get_user_profile(user_id)
+        user_profile = await self._get_user_profile(user_id)
         user_state_data = await self.db_manager.get_user_state_data(user_id)
         
         if not user_profile:
             return ""
         
         age = user_state_data.get("user_age")
-        city = user_profile.get("city", "")
+        city = user_profile.city
         
         recommendation = ""
         
@@ -481,9 +728,10 @@ class OptionModule:
                 recommendation = "💡 **Рекомендация для твоего возраста:** Экстремальный план поможет максимально эффективно использовать время для кардинальных изменений!"
         
         if city:
-            if "москв" in city.lower() or "спб" in city.lower() or "санкт" in city.lower():
+            city_lower = city.lower()
+            if _METRO_CITY_RE.search(city_lower):
                 recommendation += "\n\n🏙️ **Для жителей больших городов:** Рекомендую более интенсивные планы - в мегаполисе изменения происходят быстрее!"
-            elif "екатеринбург" in city.lower() or "новосибирск" in city.lower() or "красноярск" in city.lower():
+            elif _REGIONAL_CITY_RE.search(city_lower):
                 recommendation += "\n\n🌆 **Для региональных центров:** 2-недельный план обеспечит стабильный прогресс!"
         
         return recommendation
@@ -524,36 +772,37 @@ class OptionModule:
         """Process user's goal input"""
         user_id = update.effective_user.id
         
-        # Store the goal in user state data
-        await self.db_manager.update_user_state_data(user_id, {
+        # Store the goal in user state data, along with its display form so
+        # later steps don't have to truncate it again; the profile for the
+        # greeting comes back in the same round-trip
+        user_profile = await self.db_manager.update_user_state_data_and_get_profile(user_id, {
             "user_goal": goal_text,
+            "display_goal": truncate(goal_text, 80),
             "step": "plan_selection"
         })
+        user_name = (user_profile.first_name or "") if user_profile else ""
         
         # Create a new order/subscription for this goal
         order_id = await self._create_new_order(user_id, goal_text)
         
         # Show plan overview with goal context
-        user_profile = await self.db_manager.get_user_profile(user_id)
-        user_name = user_profile.get("first_name", "") if user_profile else ""
         
         await self._show_plan_overview_with_goal(update, context, user_name, goal_text, order_id)
     
     async def _create_new_order(self, user_id: int, goal_text: str) -> str:
         """Create a new order/subscription for the goal"""
-        import uuid
-        from datetime import datetime
-        
-        order_id = str(uuid.uuid4())[:8]  # Short unique order ID
+        # Short, collision-free order ID from a monotonically increasing counter
+        order_seq = await self.db_manager.next_sequence_value("orders")
+        order_id = _base36(order_seq).rjust(6, "0")
         
         # Store order information in user state data
         await self.db_manager.update_user_state_data(user_id, {
             "current_order_id": order_id,
-            "order_created_at": datetime.now().isoformat(),
+            "order_created_at": int(time.time()),
             "order_status": "pending_payment"
         })
         
-        logger.info(f"Created new order {order_id} for user {user_id} with goal: {goal_text[:50]}...")
+        logger.info("Created new order %s for user %s with goal: %.50s...", order_id, user_id, goal_text)
         return order_id
     
     async def _show_plan_overview_with_goal(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_name: str, goal_text: str, order_id: str):
@@ -569,43 +818,14 @@ class OptionModule:
         recommendation = await self._get_personalized_recommendation(user_id)
         
         # Truncate goal if too long
-        display_goal = goal_text[:100] + "..." if len(goal_text) > 100 else goal_text
+        display_goal = truncate(goal_text, 100)
             
-        overview_text = f"""
-{greeting}🎯 **Твоя цель:** "{display_goal}"
-
-💎 **Выбери план для достижения этой цели:**
-
-Я предлагаю три подхода к работе с твоей целью:
-
-**🚀 Экстремальный план** - ₽4,990
-• 10-15 минут каждые 2-3 часа
-• Результат может быть достигнут в течение недели
-
-**⚡ 2-недельный план** - ₽2,490  
-• 15 минут в день
-• Стабильный прогресс за 2 недели
-
-**📝 Обычный план** - ₽990
-• Раз в день, более детальный подход
-• Устойчивый результат за месяц
-
-**Заказ №{order_id}** - каждый план работает только с одной целью до завершения.
-
-{recommendation}
-
-Какой подход тебе больше подходит? 🎯
-        """
+        overview_text = "".join((
+            "\n", greeting, _GOAL_OVERVIEW_GOAL_LABEL, display_goal, _GOAL_OVERVIEW_PLANS,
+            order_id, _GOAL_OVERVIEW_ORDER_NOTE, recommendation, _GOAL_OVERVIEW_FOOTER
+        ))
         
-        keyboard = [
-            [InlineKeyboardButton("📊 Сравнить планы", callback_data="compare_plans")],
-            [InlineKeyboardButton("🚀 Экстремальный", callback_data="plan_extreme")],
-            [InlineKeyboardButton("⚡ 2-недельный", callback_data="plan_2week")],
-            [InlineKeyboardButton("📝 Обычный", callback_data="plan_regular")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(overview_text, parse_mode='Markdown', reply_markup=reply_markup)
+        await update.message.reply_text(overview_text, parse_mode='Markdown', reply_markup=_PLAN_OVERVIEW_MARKUP)
     async def _process_goal_validation(self, update: Update, context: ContextTypes.DEFAULT_TYPE, response_text: str):
         """Process user's response to goal validation"""
         user_id = update.effective_user.id
@@ -624,27 +844,7 @@ class OptionModule:
         user_state_data = await self.db_manager.get_user_state_data(user_id)
         original_goal = user_state_data.get("user_goal", "")
         
-        intermediate_goal_text = f"""
-🎯 **Отлично! Давай установим промежуточную цель**
-
-**Твоя основная мечта:** "{original_goal}"
-
-Теперь подумай и напиши **промежуточную цель** - серьезный шаг к твоей мечте, который:
-
-✅ **Реально достижим** за выбранное время
-✅ **Даст ощущение прогресса** - ты почувствуешь, что движешься вперед
-✅ **Приблизит к основной цели** - это будет важный шаг к мечте
-✅ **Мотивирует продолжать** - после достижения захочется идти дальше
-
-**Примеры хороших промежуточных целей:**
-• "Найти 3 интересные вакансии и подать заявки"
-• "Пойти на 2 свидания с разными людьми"
-• "Создать первый контент и получить 100 лайков"
-• "Найти 5 способов дополнительного заработка"
-• "Начать заниматься спортом 3 раза в неделю"
-
-**Напиши свою промежуточную цель:**
-        """
+        intermediate_goal_text = "".join((_INTERMEDIATE_GOAL_HEADER, original_goal, _INTERMEDIATE_GOAL_FOOTER))
         
         # Update state to intermediate goal collection
         await self.db_manager.update_user_state_data(user_id, {"step": "intermediate_goal_collection"})
@@ -657,6 +857,7 @@ class OptionModule:
         user_state_data = await self.db_manager.get_user_state_data(user_id)
         
         user_goal = user_state_data.get("user_goal", "")
+        display_goal = user_state_data.get("display_goal") or truncate(user_goal, 80)
         selected_plan = user_state_data.get("selected_plan", "")
         order_id = user_state_data.get("current_order_id", "")
         
@@ -667,77 +868,42 @@ class OptionModule:
         })
         
         # Show plan confirmation
-        await self._show_plan_confirmation(update, context, user_goal, selected_plan, order_id)
+        await self._show_plan_confirmation(update, context, display_goal, selected_plan, order_id)
     
     async def _process_intermediate_goal(self, update: Update, context: ContextTypes.DEFAULT_TYPE, intermediate_goal: str):
         """Process intermediate goal input"""
         user_id = update.effective_user.id
-        user_state_data = await self.db_manager.get_user_state_data(user_id)
-        
-        original_goal = user_state_data.get("user_goal", "")
-        selected_plan = user_state_data.get("selected_plan", "")
-        order_id = user_state_data.get("current_order_id", "")
+        display_target_goal = truncate(intermediate_goal, 80)
         
-        # Store final target goal (intermediate goal becomes the target)
-        await self.db_manager.update_user_state_data(user_id, {
+        # Store final target goal (intermediate goal becomes the target);
+        # the original stays in "user_goal" for reference
+        user_state_data = await self.db_manager.merge_user_state_data(user_id, {
             "final_target_goal": intermediate_goal,
-            "original_goal": original_goal,  # Keep original for reference
+            "display_target_goal": display_target_goal,
             "step": "plan_selection"
         })
         
+        selected_plan = user_state_data.get("selected_plan", "")
+        order_id = user_state_data.get("current_order_id", "")
+        
         # Show plan confirmation with intermediate goal
-        await self._show_plan_confirmation(update, context, intermediate_goal, selected_plan, order_id)
+        await self._show_plan_confirmation(update, context, display_target_goal, selected_plan, order_id)
     
-    async def _handle_regular_development(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_goal: str, order_id: str):
+    async def _handle_regular_development(self, update: Update, context: ContextTypes.DEFAULT_TYPE, order_id: str, display_goal: str):
         """Handle Regular plan development notice"""
         user_id = update.effective_user.id
-        user_profile = await self.db_manager.get_user_profile(user_id)
-        user_name = user_profile.get("first_name", "") if user_profile else ""
-        
-        # Truncate goal for display
-        display_goal = user_goal[:80] + "..." if len(user_goal) > 80 else user_goal
-        
-        development_text = f"""
-🚧 **Обычный план в разработке**
-
-**Заказ №{order_id}**
-🎯 **Твоя цель:** "{display_goal}"
-
-К сожалению, **Обычный план** сейчас находится в процессе разработки и пока недоступен.
-
-**Что это означает:**
-• Мы работаем над созданием более детального и устойчивого подхода
-• План будет включать глубокую работу с твоей целью
-• Ожидаем запуск в ближайшее время
-
-**Твоя заявка сохранена!** 📝
-Мы уведомили администратора о твоем интересе к Обычному плану.
-
-**Пока что предлагаем выбрать один из доступных планов:**
-
-**🚀 Экстремальный план** - ₽4,990
-• 10-15 минут каждые 2-3 часа
-• Результат может быть достигнут в течение недели
-
-**⚡ 2-недельный план** - ₽2,490
-• 15 минут в день
-• Стабильный прогресс за 2 недели
-
-Какой план тебе больше подходит? 🎯
-        """
-        
-        keyboard = [
-            [InlineKeyboardButton("🚀 Экстремальный план", callback_data="plan_extreme")],
-            [InlineKeyboardButton("⚡ 2-недельный план", callback_data="plan_2week")],
-            [InlineKeyboardButton("🔙 Назад к планам", callback_data="back_to_plans")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        # Send notification to admin
-        await admin_notifications.notify_regular_plan_request(user_id, user_name, user_goal, order_id)
-        
-        # Reset to plan selection step
-        await self.db_manager.update_user_state_data(user_id, {"step": "plan_selection"})
+        development_text = _build_regular_development_text(order_id, display_goal)
+        
+        # Reset to plan selection step while the reply is being sent
+        await asyncio.gather(
+            self.db_manager.mark_regular_plan_shown(user_id),
+            # The user is in the chat right now, so skip the push notification
+            update.message.reply_text(
+                development_text, parse_mode=ParseMode.HTML, reply_markup=_REGULAR_DEVELOPMENT_MARKUP,
+                disable_notification=True, allow_sending_without_reply=True
+            )
+        )
         
-        await update.message.reply_text(development_text, parse_mode='Markdown', reply_markup=reply_markup)
+        # Queued for the next admin batch, which resolves the user's name itself
+        admin_notifications.queue_regular_plan_request(user_id, display_goal, order_id)
     
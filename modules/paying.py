@@ -3,39 +3,472 @@ Paying Module
 Handles payment processing and subscription activation.
 """
 
+import asyncio
+import html
 import logging
-import uuid
-from datetime import datetime, timedelta
+import os
+import re
+import secrets
+import time
+from functools import partial
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.constants import ParseMode
 from telegram.ext import ContextTypes
-from typing import Dict, Any
+from types import MappingProxyType
+from typing import Dict, Any, Mapping, Optional
 from modules.admin_notifications import admin_notifications
+from modules.database import UserProfile
+from modules.performance import KeyedLock, TTLCache, send_rate_limiter
 
 logger = logging.getLogger(__name__)
 
+# Keyword scans for free-text replies (substring matches, case-insensitive)
+_DONATION_CONFIRM_RE = re.compile(r"сделан|готов|перевел|отправил|донат", re.IGNORECASE)
+_METHOD_CARD_RE = re.compile(r"card|credit|debit|stripe", re.IGNORECASE)
+_METHOD_PAYPAL_RE = re.compile(r"paypal|pay pal", re.IGNORECASE)
+_METHOD_CRYPTO_RE = re.compile(r"crypto|bitcoin|ethereum|btc|eth", re.IGNORECASE)
+
+# Decorative pause before a simulated payment succeeds (seconds)
+_PAYMENT_PROCESSING_DELAY = 2
+
+# Callbacks whose handlers read the prefetched profile or subscription; the rest skip the DB read
+_PREFETCH_CALLBACKS = frozenset({"donation_made", "check_status"})
+
+def _iso_now() -> str:
+    """Current local time as YYYY-MM-DDTHH:MM:SS, formatted straight from time.localtime()"""
+    t = time.localtime()
+    return f"{t.tm_year:04d}-{t.tm_mon:02d}-{t.tm_mday:02d}T{t.tm_hour:02d}:{t.tm_min:02d}:{t.tm_sec:02d}"
+
+def _ellipsize(s: str, n: int, _suffix: str = "...") -> str:
+    """Cut s to n characters, marking the cut with an ellipsis"""
+    if len(s) <= n:
+        return s
+    return s[:n] + _suffix
+
+_DONATION_HELP_TEXT = """
+❓ <b>Помощь с донатом</b>
+
+<b>Как сделать донат:</b>
+1. Открой приложение Т-Банк
+2. Выбери "Перевести"
+3. Введи номер: <code>+79853659487</code>
+4. Укажи нужную сумму
+5. Добавь комментарий с номером заказа
+6. Подтверди перевод
+
+<b>После перевода:</b>
+• Нажми кнопку "Донат сделан"
+• Или напиши "готов", "сделан", "перевел"
+
+<b>Нужна помощь?</b>
+• Проверь правильность номера
+• Убедись, что сумма указана верно
+• Добавь комментарий с номером заказа
+
+Готов сделать донат? 💳
+        """
+
+_DONATION_QUESTIONS_TEXT = """
+❓ <b>Вопросы о донате:</b>
+
+<b>В: Как сделать донат?</b>
+О: Открой Т-Банк → "Перевести" → введи номер +79853659487 → укажи сумму → добавь комментарий с номером заказа.
+
+<b>В: Безопасно ли это?</b>
+О: Да! Т-Банк - это официальное приложение банка с защитой данных.
+
+<b>В: Что если я ошибся с суммой?</b>
+О: Напиши администратору, и мы решим вопрос индивидуально.
+
+<b>В: Когда начнется работа над целью?</b>
+О: Как только администратор подтвердит получение доната.
+
+<b>В: Можно ли отменить донат?</b>
+О: Если донат еще не подтвержден, можно отменить. После подтверждения - работа начинается.
+
+<b>В: Что если донат не дошел?</b>
+О: Администратор проверит и сообщит. Если донат не получен, можно повторить.
+
+Готов сделать донат? 💳
+        """
+
+_STRIPE_PAYMENT_TEXT = """
+💳 <b>Stripe Payment</b>
+
+You've chosen to pay with a credit or debit card. This is processed securely through Stripe.
+
+<b>Payment Details:</b>
+• Secure SSL encryption
+• PCI DSS compliant
+• No card details stored on our servers
+• Instant payment processing
+
+<b>To proceed:</b>
+1. Click the payment button below
+2. Enter your card details securely
+3. Complete the payment
+4. Your subscription will be activated immediately
+
+Ready to pay? 🚀
+        """
+
+_PAYPAL_PAYMENT_TEXT = """
+🅿️ <b>PayPal Payment</b>
+
+You've chosen to pay with PayPal. This is processed securely through PayPal's platform.
+
+<b>Payment Details:</b>
+• Secure PayPal authentication
+• Buyer protection included
+• No need to share card details
+• Instant payment processing
+
+<b>To proceed:</b>
+1. Click the payment button below
+2. Log in to your PayPal account
+3. Complete the payment
+4. Your subscription will be activated immediately
+
+Ready to pay? 🚀
+        """
+
+_CRYPTO_PAYMENT_TEXT = """
+₿ <b>Cryptocurrency Payment</b>
+
+You've chosen to pay with cryptocurrency. We accept Bitcoin and Ethereum.
+
+<b>Payment Details:</b>
+• Decentralized and secure
+• Lower fees than traditional methods
+• Privacy-focused
+• Instant blockchain confirmation
+
+<b>To proceed:</b>
+1. Click the payment button below
+2. Choose your cryptocurrency
+3. Send payment to the provided address
+4. Your subscription will be activated after confirmation
+
+Ready to pay? 🚀
+        """
+
+_PAYMENT_PROCESSING_TEMPLATE = """
+⏳ <b>Processing Payment...</b>
+
+Please wait while we process your payment. This usually takes a few seconds.
+
+<b>Status:</b> Processing...
+<b>Method:</b> {payment_method}
+<b>Time:</b> {current_time}
+
+Do not close this chat or navigate away during processing.
+        """
+
+_PAYMENT_HELP_TEXT = """
+❓ <b>Payment Help</b>
+
+I'm here to help you complete your payment! Here's what you can do:
+
+<b>Payment Methods:</b>
+• 💳 Credit/Debit Card (Stripe)
+• 🅿️ PayPal
+• ₿ Cryptocurrency
+
+<b>Common Issues:</b>
+• Check your card details
+• Ensure sufficient funds
+• Verify your PayPal account
+• Check cryptocurrency balance
+
+<b>Need Support?</b>
+Contact our support team for assistance with payment issues.
+
+Use the buttons below or type your payment method! 💳
+        """
+
+_PAYMENT_METHOD_HELP_TEXT = """
+💳 <b>Payment Method Help</b>
+
+Please choose one of the following payment methods:
+
+<b>Type or click:</b>
+• "Card" or "💳" for Credit/Debit Card
+• "PayPal" or "🅿️" for PayPal
+• "Crypto" or "₿" for Cryptocurrency
+
+<b>Or use the buttons below to select your preferred method!</b>
+
+Which payment method would you like to use? 🤔
+        """
+
+_MISSING_PLAN_TEXT = """
+❌ <b>No Plan Selected</b>
+
+It looks like you haven't selected a subscription plan yet. Let's go back and choose a plan first.
+
+<b>Available Plans:</b>
+• 🚀 Extreme Plan - $99/month
+• ⚡ 2-Week Plan - $49/month
+• 📝 Regular Plan - $19/month
+
+Let's select your plan! 🎯
+        """
+
+_PAYMENT_QUESTIONS_TEXT = """
+❓ <b>Payment Questions &amp; Answers:</b>
+
+<b>Q: Is my payment secure?</b>
+A: Yes! All payments are processed through secure, encrypted channels.
+
+<b>Q: What payment methods do you accept?</b>
+A: We accept credit/debit cards, PayPal, and major cryptocurrencies.
+
+<b>Q: When will my subscription start?</b>
+A: Your subscription starts immediately after successful payment.
+
+<b>Q: Can I get a refund?</b>
+A: Yes, we offer a 7-day money-back guarantee.
+
+<b>Q: How often will I be charged?</b>
+A: Subscriptions are billed monthly and auto-renew unless cancelled.
+
+<b>Q: Can I change my plan later?</b>
+A: Yes! You can upgrade or downgrade your plan at any time.
+
+Ready to proceed with payment? 💳
+        """
+
+_SUPPORT_CONTACT_TEXT = """
+🆘 <b>Contact Support</b>
+
+Need help with your payment? Our support team is here to assist you!
+
+<b>Contact Methods:</b>
+• 📧 Email: support@yourbot.com
+• 💬 Live Chat: Available 24/7
+• 📞 Phone: +1 (555) 123-4567
+• 🕒 Hours: Monday-Friday, 9 AM - 6 PM EST
+
+<b>Common Issues:</b>
+• Payment declined
+• Subscription not activated
+• Billing questions
+• Technical problems
+
+<b>Response Time:</b>
+• Email: Within 24 hours
+• Live Chat: Immediate
+• Phone: Immediate during business hours
+
+We're here to help! 🤝
+        """
+
+_CONTENT_DELIVERY_TEXT = """
+🎯 <b>Content Delivery Started!</b>
+
+Great! I'm now analyzing your key texts and preferences to create personalized content for you.
+
+<b>What's Happening:</b>
+• 🔍 Analyzing your writing style
+• 🎨 Creating personalized content
+• ⏰ Scheduling delivery according to your plan
+• ✨ Optimizing for your preferences
+
+<b>Your First Content:</b>
+You'll receive your first personalized content within the next few hours!
+
+<b>Stay Tuned:</b>
+• Check your messages regularly
+• Provide feedback to improve content
+• Use /status to check your subscription
+
+Welcome to your personalized content journey! 🚀
+        """
+
+_INACTIVE_STATUS_TEXT = """
+📊 <b>Your Status</b>
+
+<b>Subscription:</b> No active subscription
+<b>Status:</b> ❌ Inactive
+
+<b>To activate:</b>
+• Complete the payment process
+• Choose a subscription plan
+• Set up your preferences
+
+Let's get you started! 🚀
+            """
+
+_HELP_TEXT = """
+❓ <b>Help &amp; Support</b>
+
+<b>Available Commands:</b>
+• /start - Begin the bot setup
+• /help - Show this help message
+• /status - Check your subscription status
+
+<b>Bot Features:</b>
+• Personalized content creation
+• Multiple subscription plans
+• Secure payment processing
+• 24/7 support
+
+<b>Need More Help?</b>
+• Contact support for technical issues
+• Check our FAQ for common questions
+• Use the buttons below for quick actions
+
+How can I help you today? 🤔
+        """
+
+_DONATION_REQUEST_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("✅ Донат сделан", callback_data="donation_made")],
+    [InlineKeyboardButton("❓ Вопросы о донате", callback_data="donation_questions")],
+    [InlineKeyboardButton("🔙 Изменить план", callback_data="change_plan")]
+])
+
+_DONATION_HELP_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("✅ Донат сделан", callback_data="donation_made")],
+    [InlineKeyboardButton("❓ Вопросы о донате", callback_data="donation_questions")]
+])
+
+_DONATION_QUESTIONS_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("✅ Донат сделан", callback_data="donation_made")],
+    [InlineKeyboardButton("🔙 Назад к донату", callback_data="back_to_donation")]
+])
+
+_PAYMENT_OVERVIEW_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("💳 Pay with Card", callback_data="pay_stripe")],
+    [InlineKeyboardButton("🅿️ Pay with PayPal", callback_data="pay_paypal")],
+    [InlineKeyboardButton("₿ Pay with Crypto", callback_data="pay_crypto")],
+    [InlineKeyboardButton("❓ Payment Questions", callback_data="payment_questions")],
+    [InlineKeyboardButton("🔙 Change Plan", callback_data="change_plan")]
+])
+
+_STRIPE_PAYMENT_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("💳 Pay Now with Stripe", callback_data="process_stripe_payment")],
+    [InlineKeyboardButton("🔙 Choose Different Method", callback_data="back_to_payment_methods")]
+])
+
+_PAYPAL_PAYMENT_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🅿️ Pay Now with PayPal", callback_data="process_paypal_payment")],
+    [InlineKeyboardButton("🔙 Choose Different Method", callback_data="back_to_payment_methods")]
+])
+
+_CRYPTO_PAYMENT_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("₿ Pay with Bitcoin", callback_data="process_btc_payment")],
+    [InlineKeyboardButton("Ξ Pay with Ethereum", callback_data="process_eth_payment")],
+    [InlineKeyboardButton("🔙 Choose Different Method", callback_data="back_to_payment_methods")]
+])
+
+_PAYMENT_SUCCESS_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🎯 Start Receiving Content", callback_data="start_content")],
+    [InlineKeyboardButton("📊 Check Status", callback_data="check_status")],
+    [InlineKeyboardButton("❓ Get Help", callback_data="get_help")]
+])
+
+_PAYMENT_FAILURE_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔄 Try Again", callback_data="retry_payment")],
+    [InlineKeyboardButton("💳 Different Method", callback_data="back_to_payment_methods")],
+    [InlineKeyboardButton("🆘 Contact Support", callback_data="contact_support")]
+])
+
+_PAYMENT_HELP_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("💳 Pay with Card", callback_data="pay_stripe")],
+    [InlineKeyboardButton("🅿️ Pay with PayPal", callback_data="pay_paypal")],
+    [InlineKeyboardButton("₿ Pay with Crypto", callback_data="pay_crypto")],
+    [InlineKeyboardButton("🆘 Contact Support", callback_data="contact_support")]
+])
+
+_PAYMENT_METHOD_HELP_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("💳 Credit/Debit Card", callback_data="pay_stripe")],
+    [InlineKeyboardButton("🅿️ PayPal", callback_data="pay_paypal")],
+    [InlineKeyboardButton("₿ Cryptocurrency", callback_data="pay_crypto")]
+])
+
+_MISSING_PLAN_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🚀 Extreme Plan", callback_data="select_extreme")],
+    [InlineKeyboardButton("⚡ 2-Week Plan", callback_data="select_2week")],
+    [InlineKeyboardButton("📝 Regular Plan", callback_data="select_regular")],
+    [InlineKeyboardButton("🔙 Back to Plans", callback_data="back_to_plans")]
+])
+
+_PAYMENT_QUESTIONS_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("💳 Pay with Card", callback_data="pay_stripe")],
+    [InlineKeyboardButton("🅿️ Pay with PayPal", callback_data="pay_paypal")],
+    [InlineKeyboardButton("₿ Pay with Crypto", callback_data="pay_crypto")],
+    [InlineKeyboardButton("🔙 Back to Payment", callback_data="back_to_payment_methods")]
+])
+
+_SUPPORT_CONTACT_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("💬 Start Live Chat", callback_data="start_live_chat")],
+    [InlineKeyboardButton("📧 Send Email", callback_data="send_email")],
+    [InlineKeyboardButton("🔙 Back to Payment", callback_data="back_to_payment_methods")]
+])
+
+_HELP_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📊 Check Status", callback_data="check_status")],
+    [InlineKeyboardButton("🆘 Contact Support", callback_data="contact_support")],
+    [InlineKeyboardButton("❓ FAQ", callback_data="show_faq")]
+])
+
 class PayingModule:
+    # Payment methods (simplified for demo), shared by all instances
+    _PAYMENT_METHODS: Mapping[str, Mapping[str, str]] = MappingProxyType({
+        "stripe": MappingProxyType({
+            "name": "Credit/Debit Card",
+            "description": "Pay securely with Stripe",
+            "icon": "💳"
+        }),
+        "paypal": MappingProxyType({
+            "name": "PayPal",
+            "description": "Pay with your PayPal account",
+            "icon": "🅿️"
+        }),
+        "crypto": MappingProxyType({
+            "name": "Cryptocurrency",
+            "description": "Pay with Bitcoin or Ethereum",
+            "icon": "₿"
+        })
+    })
+    
     def __init__(self, db_manager, state_manager, bot_instance=None):
         self.db_manager = db_manager
         self.state_manager = state_manager
         self.bot_instance = bot_instance
         
-        # Payment methods (simplified for demo)
-        self.payment_methods = {
-            "stripe": {
-                "name": "Credit/Debit Card",
-                "description": "Pay securely with Stripe",
-                "icon": "💳"
-            },
-            "paypal": {
-                "name": "PayPal",
-                "description": "Pay with your PayPal account",
-                "icon": "🅿️"
-            },
-            "crypto": {
-                "name": "Cryptocurrency",
-                "description": "Pay with Bitcoin or Ethereum",
-                "icon": "₿"
-            }
+        # Payment updates are serialized per user
+        self._user_locks = KeyedLock()
+        
+        # Short-lived profile cache keyed by user_id
+        self._profile_cache = TTLCache(ttl=30)
+        
+        # Strong references to in-flight payment completions
+        self._background_tasks = set()
+        
+        # Bound on payment handlers doing DB and network work at once, across all users
+        self.max_concurrency = int(os.getenv("PAYING_CONCURRENCY", "64"))
+        self._worker_semaphore = None
+        
+        # Callback data -> handler taking (update, context)
+        show_overview = partial(self._show_payment_overview, plan_key="selected_plan", plan_details={})
+        self._callback_handlers = {
+            "donation_made": self._handle_donation_confirmation,
+            "donation_questions": self._show_donation_questions,
+            "pay_stripe": self._start_stripe_payment,
+            "pay_paypal": self._start_paypal_payment,
+            "pay_crypto": self._start_crypto_payment,
+            "process_stripe_payment": partial(self._process_payment, payment_method="stripe"),
+            "process_paypal_payment": partial(self._process_payment, payment_method="paypal"),
+            "process_btc_payment": partial(self._process_payment, payment_method="bitcoin"),
+            "process_eth_payment": partial(self._process_payment, payment_method="ethereum"),
+            "back_to_payment_methods": show_overview,
+            "retry_payment": show_overview,
+            "payment_questions": self._show_payment_questions,
+            "contact_support": self._show_support_contact,
+            "start_content": self._start_content_delivery,
+            "check_status": self._check_user_status,
+            "get_help": self._show_help
         }
     
     async def start_payment(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -63,36 +496,36 @@ class PayingModule:
         user_id = update.effective_user.id
         
         # Truncate goal for display
-        display_goal = target_goal[:100] + "..." if len(target_goal) > 100 else target_goal
+        display_goal = html.escape(_ellipsize(target_goal, 100))
         
         donation_text = f"""
-💳 **Поддержка проекта HackReality**
+💳 <b>Поддержка проекта HackReality</b>
 
-**Заказ №{order_id}**
-🎯 **Твоя цель:** "{display_goal}"
-📋 **Выбранный план:** {plan_details.get('name', 'Unknown Plan')}
-💰 **Сумма:** {plan_details.get('price', 'Unknown')}
+<b>Заказ №{order_id}</b>
+🎯 <b>Твоя цель:</b> "{display_goal}"
+📋 <b>Выбранный план:</b> {html.escape(plan_details.get('name', 'Unknown Plan'))}
+💰 <b>Сумма:</b> {html.escape(plan_details.get('price', 'Unknown'))}
 
-**Для достижения твоей цели мне нужна твоя поддержка!**
+<b>Для достижения твоей цели мне нужна твоя поддержка!</b>
 
-🤖 **Как это работает:**
+🤖 <b>Как это работает:</b>
 • Ты делаешь донат на указанный номер
 • Я получаю уведомление о поддержке
 • Сразу начинаю работать с твоей целью
 • Помогаю тебе достичь результата!
 
-**📱 Способ поддержки:**
-**Т-Банк на номер:** `+79853659487`
+<b>📱 Способ поддержки:</b>
+<b>Т-Банк на номер:</b> <code>+79853659487</code>
 
-**💡 Инструкция:**
+<b>💡 Инструкция:</b>
 1. Открой приложение Т-Банк
 2. Выбери "Перевести"
-3. Введи номер: `+79853659487`
-4. Укажи сумму: {plan_details.get('price', 'согласно выбранному плану')}
+3. Введи номер: <code>+79853659487</code>
+4. Укажи сумму: {html.escape(plan_details.get('price', 'согласно выбранному плану'))}
 5. Добавь комментарий: "Заказ {order_id}"
 6. Подтверди перевод
 
-**После перевода:**
+<b>После перевода:</b>
 • Нажми кнопку "Донат сделан" ниже
 • Я проверю получение поддержки
 • Начну работать с твоей целью!
@@ -100,13 +533,6 @@ class PayingModule:
 Готов поддержать проект? 🚀
         """
         
-        keyboard = [
-            [InlineKeyboardButton("✅ Донат сделан", callback_data="donation_made")],
-            [InlineKeyboardButton("❓ Вопросы о донате", callback_data="donation_questions")],
-            [InlineKeyboardButton("🔙 Изменить план", callback_data="change_plan")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
         # Update payment state
         await self.db_manager.update_user_state_data(user_id, {
             "payment_state": "donation_requested",
@@ -116,138 +542,82 @@ class PayingModule:
             "order_id": order_id
         })
         
-        await update.message.reply_text(donation_text, parse_mode='Markdown', reply_markup=reply_markup)
+        await self._reply(update, donation_text, parse_mode=ParseMode.HTML, reply_markup=_DONATION_REQUEST_MARKUP)
     
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle messages during donation process"""
         user_id = update.effective_user.id
-        message_text = update.message.text.lower()
-        
-        # Get current payment state
-        state_data = await self.db_manager.get_user_state_data(user_id)
-        payment_state = state_data.get("payment_state", "overview")
-        
-        if payment_state == "donation_requested":
-            # Check if user is confirming donation
-            if any(word in message_text for word in ["сделан", "готов", "перевел", "отправил", "донат"]):
-                await self._handle_donation_confirmation(update, context)
+        message_text = update.message.text
+        
+        async with self._user_locks.hold(user_id), self._workers():
+            # Get current payment state
+            state_data = await self.db_manager.get_user_state_data(user_id)
+            payment_state = state_data.get("payment_state", "overview")
+            
+            if payment_state == "donation_requested":
+                # Check if user is confirming donation
+                if _DONATION_CONFIRM_RE.search(message_text):
+                    await self._handle_donation_confirmation(update, context)
+                else:
+                    await self._show_donation_help(update, context)
             else:
                 await self._show_donation_help(update, context)
-        else:
-            await self._show_donation_help(update, context)
     
     async def _handle_donation_confirmation(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle user's donation confirmation"""
         user_id = update.effective_user.id
-        user_profile = await self.db_manager.get_user_profile(user_id)
-        user_name = user_profile.get("first_name", "") if user_profile else ""
+        prefetched = self._get_prefetched(context)
+        user_profile = prefetched["profile"] if prefetched else await self._get_user_profile(user_id)
+        user_name = (user_profile.first_name or "") if user_profile else ""
         
-        # Get order details
-        state_data = await self.db_manager.get_user_state_data(user_id)
+        # Update payment state, reading the order details in the same round-trip
+        state_data = await self.db_manager.merge_user_state_data(user_id, {
+            "payment_state": "donation_confirmed",
+            "donation_confirmed_at": _iso_now()
+        })
         order_id = state_data.get("order_id", "")
         target_goal = state_data.get("target_goal", "")
         plan_details = state_data.get("plan_details", {})
         
-        # Update payment state
-        await self.db_manager.update_user_state_data(user_id, {
-            "payment_state": "donation_confirmed",
-            "donation_confirmed_at": datetime.now().isoformat()
-        })
-        
-        # Send admin notification
-        await admin_notifications.notify_donation_confirmation(user_id, user_name, order_id, target_goal, plan_details)
-        
         # Show waiting message to user
         waiting_text = f"""
-⏳ **Проверяем получение поддержки...**
+⏳ <b>Проверяем получение поддержки...</b>
 
-**Заказ №{order_id}**
+<b>Заказ №{order_id}</b>
 
 Спасибо за подтверждение! Я уведомил администратора о твоем донате.
 
-**Что происходит сейчас:**
+<b>Что происходит сейчас:</b>
 • 📤 Отправлено уведомление администратору
 • 🔍 Проверяется получение поддержки
 • ⏰ Ожидаем подтверждение
 
-**Обычно это занимает несколько минут.**
+<b>Обычно это занимает несколько минут.</b>
 
 Как только администратор подтвердит получение поддержки, я сразу начну работать с твоей целью!
 
-**Твоя цель:** "{target_goal[:80]}{'...' if len(target_goal) > 80 else ''}"
+<b>Твоя цель:</b> "{html.escape(_ellipsize(target_goal, 80))}"
 
 Ожидай подтверждения... 🤖
         """
         
-        await update.message.reply_text(waiting_text, parse_mode='Markdown')
+        # Goes out with the next admin batch, at most a second from now
+        admin_notifications.queue_donation_confirmation(user_id, user_name, order_id, target_goal, plan_details)
+        
+        await self._reply(update, waiting_text, parse_mode=ParseMode.HTML)
     
     
     async def _show_donation_help(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show donation help"""
-        help_text = """
-❓ **Помощь с донатом**
-
-**Как сделать донат:**
-1. Открой приложение Т-Банк
-2. Выбери "Перевести"
-3. Введи номер: `+79853659487`
-4. Укажи нужную сумму
-5. Добавь комментарий с номером заказа
-6. Подтверди перевод
-
-**После перевода:**
-• Нажми кнопку "Донат сделан"
-• Или напиши "готов", "сделан", "перевел"
-
-**Нужна помощь?**
-• Проверь правильность номера
-• Убедись, что сумма указана верно
-• Добавь комментарий с номером заказа
-
-Готов сделать донат? 💳
-        """
-        
-        keyboard = [
-            [InlineKeyboardButton("✅ Донат сделан", callback_data="donation_made")],
-            [InlineKeyboardButton("❓ Вопросы о донате", callback_data="donation_questions")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        help_text = _DONATION_HELP_TEXT
         
-        await update.message.reply_text(help_text, parse_mode='Markdown', reply_markup=reply_markup)
+        await self._reply(update, help_text, parse_mode=ParseMode.HTML, reply_markup=_DONATION_HELP_MARKUP)
     
     async def _show_donation_questions(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show donation questions and answers"""
-        questions_text = """
-❓ **Вопросы о донате:**
-
-**В: Как сделать донат?**
-О: Открой Т-Банк → "Перевести" → введи номер +79853659487 → укажи сумму → добавь комментарий с номером заказа.
-
-**В: Безопасно ли это?**
-О: Да! Т-Банк - это официальное приложение банка с защитой данных.
-
-**В: Что если я ошибся с суммой?**
-О: Напиши администратору, и мы решим вопрос индивидуально.
-
-**В: Когда начнется работа над целью?**
-О: Как только администратор подтвердит получение доната.
-
-**В: Можно ли отменить донат?**
-О: Если донат еще не подтвержден, можно отменить. После подтверждения - работа начинается.
-
-**В: Что если донат не дошел?**
-О: Администратор проверит и сообщит. Если донат не получен, можно повторить.
-
-Готов сделать донат? 💳
-        """
+        questions_text = _DONATION_QUESTIONS_TEXT
         
-        keyboard = [
-            [InlineKeyboardButton("✅ Донат сделан", callback_data="donation_made")],
-            [InlineKeyboardButton("🔙 Назад к донату", callback_data="back_to_donation")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.callback_query.edit_message_text(questions_text, parse_mode='Markdown', reply_markup=reply_markup)
+        await self._edit(update, questions_text, parse_mode=ParseMode.HTML, reply_markup=_DONATION_QUESTIONS_MARKUP)
     
     async def _show_payment_overview(self, update: Update, context: ContextTypes.DEFAULT_TYPE, plan_key: str, plan_details: Dict[str, Any]):
         """Show payment overview"""
@@ -260,17 +630,18 @@ class PayingModule:
             "plan_details": plan_details
         })
         
+        features_text = "\n".join(["✅ " + feature for feature in plan_details.get('features', ())])
         overview_text = f"""
-💳 **Payment Overview**
+💳 <b>Payment Overview</b>
 
-**Selected Plan:** {plan_details.get('name', 'Unknown Plan')}
-**Duration:** {plan_details.get('duration', 'Unknown')}
-**Price:** {plan_details.get('price', 'Unknown')}
+<b>Selected Plan:</b> {html.escape(plan_details.get('name', 'Unknown Plan'))}
+<b>Duration:</b> {html.escape(plan_details.get('duration', 'Unknown'))}
+<b>Price:</b> {html.escape(plan_details.get('price', 'Unknown'))}
 
-**What's Included:**
-{chr(10).join([f"✅ {feature}" for feature in plan_details.get('features', [])])}
+<b>What's Included:</b>
+{features_text}
 
-**Payment Methods Available:**
+<b>Payment Methods Available:</b>
 • 💳 Credit/Debit Card (Stripe)
 • 🅿️ PayPal
 • ₿ Cryptocurrency
@@ -278,27 +649,18 @@ class PayingModule:
 Ready to proceed with payment? 🚀
         """
         
-        keyboard = [
-            [InlineKeyboardButton("💳 Pay with Card", callback_data="pay_stripe")],
-            [InlineKeyboardButton("🅿️ Pay with PayPal", callback_data="pay_paypal")],
-            [InlineKeyboardButton("₿ Pay with Crypto", callback_data="pay_crypto")],
-            [InlineKeyboardButton("❓ Payment Questions", callback_data="payment_questions")],
-            [InlineKeyboardButton("🔙 Change Plan", callback_data="change_plan")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(overview_text, parse_mode='Markdown', reply_markup=reply_markup)
+        await self._reply(update, overview_text, parse_mode=ParseMode.HTML, reply_markup=_PAYMENT_OVERVIEW_MARKUP)
     
     async def _process_payment_method_selection(self, update: Update, context: ContextTypes.DEFAULT_TYPE, message_text: str):
         """Process payment method selection"""
         user_id = update.effective_user.id
         
         # Simple keyword-based payment method detection
-        if any(word in message_text for word in ["card", "credit", "debit", "stripe"]):
+        if _METHOD_CARD_RE.search(message_text):
             await self._start_stripe_payment(update, context)
-        elif any(word in message_text for word in ["paypal", "pay pal"]):
+        elif _METHOD_PAYPAL_RE.search(message_text):
             await self._start_paypal_payment(update, context)
-        elif any(word in message_text for word in ["crypto", "bitcoin", "ethereum", "btc", "eth"]):
+        elif _METHOD_CRYPTO_RE.search(message_text):
             await self._start_crypto_payment(update, context)
         else:
             await self._show_payment_method_help(update, context)
@@ -313,33 +675,9 @@ Ready to proceed with payment? 🚀
             "payment_method": "stripe"
         })
         
-        stripe_text = """
-💳 **Stripe Payment**
-
-You've chosen to pay with a credit or debit card. This is processed securely through Stripe.
-
-**Payment Details:**
-• Secure SSL encryption
-• PCI DSS compliant
-• No card details stored on our servers
-• Instant payment processing
-
-**To proceed:**
-1. Click the payment button below
-2. Enter your card details securely
-3. Complete the payment
-4. Your subscription will be activated immediately
-
-Ready to pay? 🚀
-        """
-        
-        keyboard = [
-            [InlineKeyboardButton("💳 Pay Now with Stripe", callback_data="process_stripe_payment")],
-            [InlineKeyboardButton("🔙 Choose Different Method", callback_data="back_to_payment_methods")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        stripe_text = _STRIPE_PAYMENT_TEXT
         
-        await update.message.reply_text(stripe_text, parse_mode='Markdown', reply_markup=reply_markup)
+        await self._reply(update, stripe_text, parse_mode=ParseMode.HTML, reply_markup=_STRIPE_PAYMENT_MARKUP)
     
     async def _start_paypal_payment(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Start PayPal payment process"""
@@ -351,33 +689,9 @@ Ready to pay? 🚀
             "payment_method": "paypal"
         })
         
-        paypal_text = """
-🅿️ **PayPal Payment**
-
-You've chosen to pay with PayPal. This is processed securely through PayPal's platform.
-
-**Payment Details:**
-• Secure PayPal authentication
-• Buyer protection included
-• No need to share card details
-• Instant payment processing
-
-**To proceed:**
-1. Click the payment button below
-2. Log in to your PayPal account
-3. Complete the payment
-4. Your subscription will be activated immediately
-
-Ready to pay? 🚀
-        """
-        
-        keyboard = [
-            [InlineKeyboardButton("🅿️ Pay Now with PayPal", callback_data="process_paypal_payment")],
-            [InlineKeyboardButton("🔙 Choose Different Method", callback_data="back_to_payment_methods")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        paypal_text = _PAYPAL_PAYMENT_TEXT
         
-        await update.message.reply_text(paypal_text, parse_mode='Markdown', reply_markup=reply_markup)
+        await self._reply(update, paypal_text, parse_mode=ParseMode.HTML, reply_markup=_PAYPAL_PAYMENT_MARKUP)
     
     async def _start_crypto_payment(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Start cryptocurrency payment process"""
@@ -389,34 +703,9 @@ Ready to pay? 🚀
             "payment_method": "crypto"
         })
         
-        crypto_text = """
-₿ **Cryptocurrency Payment**
-
-You've chosen to pay with cryptocurrency. We accept Bitcoin and Ethereum.
-
-**Payment Details:**
-• Decentralized and secure
-• Lower fees than traditional methods
-• Privacy-focused
-• Instant blockchain confirmation
-
-**To proceed:**
-1. Click the payment button below
-2. Choose your cryptocurrency
-3. Send payment to the provided address
-4. Your subscription will be activated after confirmation
-
-Ready to pay? 🚀
-        """
-        
-        keyboard = [
-            [InlineKeyboardButton("₿ Pay with Bitcoin", callback_data="process_btc_payment")],
-            [InlineKeyboardButton("Ξ Pay with Ethereum", callback_data="process_eth_payment")],
-            [InlineKeyboardButton("🔙 Choose Different Method", callback_data="back_to_payment_methods")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        crypto_text = _CRYPTO_PAYMENT_TEXT
         
-        await update.message.reply_text(crypto_text, parse_mode='Markdown', reply_markup=reply_markup)
+        await self._reply(update, crypto_text, parse_mode=ParseMode.HTML, reply_markup=_CRYPTO_PAYMENT_MARKUP)
     
     async def _process_payment(self, update: Update, context: ContextTypes.DEFAULT_TYPE, payment_method: str):
         """Process the actual payment (simulated)"""
@@ -429,41 +718,45 @@ Ready to pay? 🚀
         })
         
         # Simulate payment processing
-        processing_text = """
-⏳ **Processing Payment...**
-
-Please wait while we process your payment. This usually takes a few seconds.
-
-**Status:** Processing...
-**Method:** {payment_method}
-**Time:** {current_time}
-
-Do not close this chat or navigate away during processing.
-        """.format(
+        processing_text = _PAYMENT_PROCESSING_TEMPLATE.format(
             payment_method=payment_method.title(),
-            current_time=datetime.now().strftime("%H:%M:%S")
+            current_time=_iso_now()[11:]
         )
         
-        await update.callback_query.edit_message_text(processing_text, parse_mode='Markdown')
+        await self._edit(update, processing_text, parse_mode=ParseMode.HTML)
+        
+        # Finish in the background so the user's lock isn't held during the delay
+        task = asyncio.create_task(
+            self._finish_payment_after_delay(update, context, payment_method, _PAYMENT_PROCESSING_DELAY)
+        )
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    async def _finish_payment_after_delay(self, update: Update, context: ContextTypes.DEFAULT_TYPE, payment_method: str, delay: float):
+        """Complete a simulated payment once the processing delay has passed"""
+        user_id = update.effective_user.id
         
         # Simulate payment processing delay
-        import asyncio
-        await asyncio.sleep(2)
+        await asyncio.sleep(delay)
         
         # Simulate successful payment
-        await self._handle_payment_success(update, context, payment_method)
+        try:
+            async with self._user_locks.hold(user_id), self._workers():
+                await self._handle_payment_success(update, context, payment_method)
+        except Exception as e:
+            logger.error(f"Error finishing payment for user {user_id}: {e}")
     
     async def _handle_payment_success(self, update: Update, context: ContextTypes.DEFAULT_TYPE, payment_method: str):
         """Handle successful payment"""
         user_id = update.effective_user.id
         
-        # Get plan details
+        # Get plan details; this runs from the background task, after the callback's prefetch was dropped
         state_data = await self.db_manager.get_user_state_data(user_id)
         selected_plan = state_data.get("selected_plan")
         plan_details = state_data.get("plan_details", {})
         
-        # Generate payment ID
-        payment_id = str(uuid.uuid4())
+        # Generate payment ID (opaque key, only shown truncated)
+        payment_id = secrets.token_hex(12)
         
         # Create subscription
         subscription_id = await self.db_manager.create_subscription(
@@ -478,19 +771,19 @@ Do not close this chat or navigate away during processing.
         })
         
         success_text = f"""
-🎉 **Payment Successful!**
+🎉 <b>Payment Successful!</b>
 
-**Payment Details:**
+<b>Payment Details:</b>
 • Method: {payment_method.title()}
-• Plan: {plan_details.get('name', 'Unknown')}
+• Plan: {html.escape(plan_details.get('name', 'Unknown'))}
 • Payment ID: {payment_id[:8]}...
 • Status: ✅ Confirmed
 
-**Your subscription is now active!** 🚀
+<b>Your subscription is now active!</b> 🚀
 
 I'll start creating personalized content for you based on your preferences and key texts. You'll receive your first content soon!
 
-**What's Next:**
+<b>What's Next:</b>
 • Your subscription is active
 • I'll analyze your key texts
 • Content will be delivered according to your plan
@@ -499,14 +792,7 @@ I'll start creating personalized content for you based on your preferences and k
 Welcome to your personalized content journey! ✨
         """
         
-        keyboard = [
-            [InlineKeyboardButton("🎯 Start Receiving Content", callback_data="start_content")],
-            [InlineKeyboardButton("📊 Check Status", callback_data="check_status")],
-            [InlineKeyboardButton("❓ Get Help", callback_data="get_help")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.callback_query.edit_message_text(success_text, parse_mode='Markdown', reply_markup=reply_markup)
+        await self._edit(update, success_text, parse_mode=ParseMode.HTML, reply_markup=_PAYMENT_SUCCESS_MARKUP)
     
     async def _handle_payment_failure(self, update: Update, context: ContextTypes.DEFAULT_TYPE, error_message: str):
         """Handle payment failure"""
@@ -519,13 +805,13 @@ Welcome to your personalized content journey! ✨
         })
         
         failure_text = f"""
-❌ **Payment Failed**
+❌ <b>Payment Failed</b>
 
 We encountered an issue processing your payment:
 
-**Error:** {error_message}
+<b>Error:</b> {html.escape(error_message)}
 
-**What you can do:**
+<b>What you can do:</b>
 • Try a different payment method
 • Check your payment details
 • Contact support if the problem persists
@@ -533,254 +819,113 @@ We encountered an issue processing your payment:
 Let's try again! 🔄
         """
         
-        keyboard = [
-            [InlineKeyboardButton("🔄 Try Again", callback_data="retry_payment")],
-            [InlineKeyboardButton("💳 Different Method", callback_data="back_to_payment_methods")],
-            [InlineKeyboardButton("🆘 Contact Support", callback_data="contact_support")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.callback_query.edit_message_text(failure_text, parse_mode='Markdown', reply_markup=reply_markup)
+        await self._edit(update, failure_text, parse_mode=ParseMode.HTML, reply_markup=_PAYMENT_FAILURE_MARKUP)
     
     async def _show_payment_help(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show payment help"""
-        help_text = """
-❓ **Payment Help**
-
-I'm here to help you complete your payment! Here's what you can do:
-
-**Payment Methods:**
-• 💳 Credit/Debit Card (Stripe)
-• 🅿️ PayPal
-• ₿ Cryptocurrency
-
-**Common Issues:**
-• Check your card details
-• Ensure sufficient funds
-• Verify your PayPal account
-• Check cryptocurrency balance
-
-**Need Support?**
-Contact our support team for assistance with payment issues.
-
-Use the buttons below or type your payment method! 💳
-        """
-        
-        keyboard = [
-            [InlineKeyboardButton("💳 Pay with Card", callback_data="pay_stripe")],
-            [InlineKeyboardButton("🅿️ Pay with PayPal", callback_data="pay_paypal")],
-            [InlineKeyboardButton("₿ Pay with Crypto", callback_data="pay_crypto")],
-            [InlineKeyboardButton("🆘 Contact Support", callback_data="contact_support")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        help_text = _PAYMENT_HELP_TEXT
         
-        await update.message.reply_text(help_text, parse_mode='Markdown', reply_markup=reply_markup)
+        await self._reply(update, help_text, parse_mode=ParseMode.HTML, reply_markup=_PAYMENT_HELP_MARKUP)
     
     async def _show_payment_method_help(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show payment method help"""
-        help_text = """
-💳 **Payment Method Help**
-
-Please choose one of the following payment methods:
-
-**Type or click:**
-• "Card" or "💳" for Credit/Debit Card
-• "PayPal" or "🅿️" for PayPal
-• "Crypto" or "₿" for Cryptocurrency
-
-**Or use the buttons below to select your preferred method!**
-
-Which payment method would you like to use? 🤔
-        """
-        
-        keyboard = [
-            [InlineKeyboardButton("💳 Credit/Debit Card", callback_data="pay_stripe")],
-            [InlineKeyboardButton("🅿️ PayPal", callback_data="pay_paypal")],
-            [InlineKeyboardButton("₿ Cryptocurrency", callback_data="pay_crypto")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        help_text = _PAYMENT_METHOD_HELP_TEXT
         
-        await update.message.reply_text(help_text, parse_mode='Markdown', reply_markup=reply_markup)
+        await self._reply(update, help_text, parse_mode=ParseMode.HTML, reply_markup=_PAYMENT_METHOD_HELP_MARKUP)
     
     async def _handle_missing_plan(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle case where no plan is selected"""
-        missing_plan_text = """
-❌ **No Plan Selected**
-
-It looks like you haven't selected a subscription plan yet. Let's go back and choose a plan first.
-
-**Available Plans:**
-• 🚀 Extreme Plan - $99/month
-• ⚡ 2-Week Plan - $49/month
-• 📝 Regular Plan - $19/month
-
-Let's select your plan! 🎯
-        """
-        
-        keyboard = [
-            [InlineKeyboardButton("🚀 Extreme Plan", callback_data="select_extreme")],
-            [InlineKeyboardButton("⚡ 2-Week Plan", callback_data="select_2week")],
-            [InlineKeyboardButton("📝 Regular Plan", callback_data="select_regular")],
-            [InlineKeyboardButton("🔙 Back to Plans", callback_data="back_to_plans")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        missing_plan_text = _MISSING_PLAN_TEXT
         
-        await update.message.reply_text(missing_plan_text, parse_mode='Markdown', reply_markup=reply_markup)
+        await self._reply(update, missing_plan_text, parse_mode=ParseMode.HTML, reply_markup=_MISSING_PLAN_MARKUP)
+    
+    async def _reply(self, update: Update, text: str, **kwargs):
+        """Reply to the user's message within the bot-wide send rate"""
+        await send_rate_limiter.acquire()
+        return await update.message.reply_text(text, **kwargs)
+    
+    async def _edit(self, update: Update, text: str, **kwargs):
+        """Edit the callback's message within the bot-wide send rate"""
+        await send_rate_limiter.acquire()
+        return await update.callback_query.edit_message_text(text, **kwargs)
+    
+    async def _get_user_profile(self, user_id: int) -> Optional[UserProfile]:
+        """Get user profile, reusing a recent read for the same user"""
+        return await self._profile_cache.get_or_load(
+            user_id, lambda: self.db_manager.get_user_profile_record(user_id)
+        )
+    
+    def _workers(self) -> asyncio.Semaphore:
+        """Return the shared worker semaphore, created inside the running event loop"""
+        if self._worker_semaphore is None:
+            self._worker_semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._worker_semaphore
+    
+    def _get_prefetched(self, context: ContextTypes.DEFAULT_TYPE) -> Optional[Dict[str, Any]]:
+        """Return the user context prefetched for the current callback, if any"""
+        return context.user_data.get("_prefetched") if context.user_data else None
     
     async def handle_callback_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle callback queries from inline keyboards"""
         query = update.callback_query
         await query.answer()
         
-        if query.data == "donation_made":
-            await self._handle_donation_confirmation(update, context)
-        elif query.data == "donation_questions":
-            await self._show_donation_questions(update, context)
-        elif query.data == "pay_stripe":
-            await self._start_stripe_payment(update, context)
-        elif query.data == "pay_paypal":
-            await self._start_paypal_payment(update, context)
-        elif query.data == "pay_crypto":
-            await self._start_crypto_payment(update, context)
-        elif query.data == "process_stripe_payment":
-            await self._process_payment(update, context, "stripe")
-        elif query.data == "process_paypal_payment":
-            await self._process_payment(update, context, "paypal")
-        elif query.data == "process_btc_payment":
-            await self._process_payment(update, context, "bitcoin")
-        elif query.data == "process_eth_payment":
-            await self._process_payment(update, context, "ethereum")
-        elif query.data == "back_to_payment_methods":
-            await self._show_payment_overview(update, context, "selected_plan", {})
-        elif query.data == "retry_payment":
-            await self._show_payment_overview(update, context, "selected_plan", {})
-        elif query.data == "payment_questions":
-            await self._show_payment_questions(update, context)
-        elif query.data == "contact_support":
-            await self._show_support_contact(update, context)
-        elif query.data == "start_content":
-            await self._start_content_delivery(update, context)
-        elif query.data == "check_status":
-            await self._check_user_status(update, context)
-        elif query.data == "get_help":
-            await self._show_help(update, context)
+        handler = self._callback_handlers.get(query.data)
+        if not handler:
+            return
+        
+        user_id = update.effective_user.id
+        async with self._user_locks.hold(user_id), self._workers():
+            if query.data not in _PREFETCH_CALLBACKS:
+                await handler(update, context)
+                return
+            
+            # Load profile and subscription together for the handler;
+            # dropped afterwards so the next update never sees stale data
+            context.user_data["_prefetched"] = await self.db_manager.prefetch_user_context(user_id)
+            try:
+                await handler(update, context)
+            finally:
+                context.user_data.pop("_prefetched", None)
     
     async def _show_payment_questions(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show payment questions and answers"""
-        questions_text = """
-❓ **Payment Questions & Answers:**
-
-**Q: Is my payment secure?**
-A: Yes! All payments are processed through secure, encrypted channels.
-
-**Q: What payment methods do you accept?**
-A: We accept credit/debit cards, PayPal, and major cryptocurrencies.
-
-**Q: When will my subscription start?**
-A: Your subscription starts immediately after successful payment.
-
-**Q: Can I get a refund?**
-A: Yes, we offer a 7-day money-back guarantee.
-
-**Q: How often will I be charged?**
-A: Subscriptions are billed monthly and auto-renew unless cancelled.
-
-**Q: Can I change my plan later?**
-A: Yes! You can upgrade or downgrade your plan at any time.
-
-Ready to proceed with payment? 💳
-        """
-        
-        keyboard = [
-            [InlineKeyboardButton("💳 Pay with Card", callback_data="pay_stripe")],
-            [InlineKeyboardButton("🅿️ Pay with PayPal", callback_data="pay_paypal")],
-            [InlineKeyboardButton("₿ Pay with Crypto", callback_data="pay_crypto")],
-            [InlineKeyboardButton("🔙 Back to Payment", callback_data="back_to_payment_methods")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        questions_text = _PAYMENT_QUESTIONS_TEXT
         
-        await update.callback_query.edit_message_text(questions_text, parse_mode='Markdown', reply_markup=reply_markup)
+        await self._edit(update, questions_text, parse_mode=ParseMode.HTML, reply_markup=_PAYMENT_QUESTIONS_MARKUP)
     
     async def _show_support_contact(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show support contact information"""
-        support_text = """
-🆘 **Contact Support**
-
-Need help with your payment? Our support team is here to assist you!
-
-**Contact Methods:**
-• 📧 Email: support@yourbot.com
-• 💬 Live Chat: Available 24/7
-• 📞 Phone: +1 (555) 123-4567
-• 🕒 Hours: Monday-Friday, 9 AM - 6 PM EST
-
-**Common Issues:**
-• Payment declined
-• Subscription not activated
-• Billing questions
-• Technical problems
-
-**Response Time:**
-• Email: Within 24 hours
-• Live Chat: Immediate
-• Phone: Immediate during business hours
-
-We're here to help! 🤝
-        """
+        support_text = _SUPPORT_CONTACT_TEXT
         
-        keyboard = [
-            [InlineKeyboardButton("💬 Start Live Chat", callback_data="start_live_chat")],
-            [InlineKeyboardButton("📧 Send Email", callback_data="send_email")],
-            [InlineKeyboardButton("🔙 Back to Payment", callback_data="back_to_payment_methods")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.callback_query.edit_message_text(support_text, parse_mode='Markdown', reply_markup=reply_markup)
+        await self._edit(update, support_text, parse_mode=ParseMode.HTML, reply_markup=_SUPPORT_CONTACT_MARKUP)
     
     async def _start_content_delivery(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Start content delivery process"""
-        start_text = """
-🎯 **Content Delivery Started!**
-
-Great! I'm now analyzing your key texts and preferences to create personalized content for you.
-
-**What's Happening:**
-• 🔍 Analyzing your writing style
-• 🎨 Creating personalized content
-• ⏰ Scheduling delivery according to your plan
-• ✨ Optimizing for your preferences
-
-**Your First Content:**
-You'll receive your first personalized content within the next few hours!
-
-**Stay Tuned:**
-• Check your messages regularly
-• Provide feedback to improve content
-• Use /status to check your subscription
-
-Welcome to your personalized content journey! 🚀
-        """
+        start_text = _CONTENT_DELIVERY_TEXT
         
-        await update.callback_query.edit_message_text(start_text, parse_mode='Markdown')
+        await self._edit(update, start_text, parse_mode=ParseMode.HTML)
     
     async def _check_user_status(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Check user status"""
         user_id = update.effective_user.id
         
-        # Get user's active subscription
-        subscription = await self.db_manager.get_active_subscription(user_id)
+        # Check for an active subscription first; the full row is only needed to render it
+        prefetched = self._get_prefetched(context)
+        active = prefetched["subscription"] if prefetched else await self.db_manager.has_active_subscription(user_id)
+        subscription = await self.db_manager.get_subscription(active.id) if active else None
         
         if subscription:
             status_text = f"""
-📊 **Your Status**
+📊 <b>Your Status</b>
 
-**Subscription:** {subscription['subscription_type'].title()} Plan
-**Status:** ✅ Active
-**Start Date:** {subscription['start_date']}
-**End Date:** {subscription['end_date']}
-**Payment Method:** {subscription.get('payment_id', 'Unknown')}
+<b>Subscription:</b> {html.escape(subscription['subscription_type'].title())} Plan
+<b>Status:</b> ✅ Active
+<b>Start Date:</b> {html.escape(str(subscription['start_date']))}
+<b>End Date:</b> {html.escape(str(subscription['end_date']))}
+<b>Payment Method:</b> {html.escape(str(subscription.get('payment_id', 'Unknown')))}
 
-**Next Steps:**
+<b>Next Steps:</b>
 • Content delivery is active
 • Check your messages for new content
 • Provide feedback to improve quality
@@ -788,51 +933,12 @@ Welcome to your personalized content journey! 🚀
 Everything looks great! 🎉
             """
         else:
-            status_text = """
-📊 **Your Status**
-
-**Subscription:** No active subscription
-**Status:** ❌ Inactive
-
-**To activate:**
-• Complete the payment process
-• Choose a subscription plan
-• Set up your preferences
-
-Let's get you started! 🚀
-            """
+            status_text = _INACTIVE_STATUS_TEXT
         
-        await update.callback_query.edit_message_text(status_text, parse_mode='Markdown')
+        await self._edit(update, status_text, parse_mode=ParseMode.HTML)
     
     async def _show_help(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show help information"""
-        help_text = """
-❓ **Help & Support**
-
-**Available Commands:**
-• /start - Begin the bot setup
-• /help - Show this help message
-• /status - Check your subscription status
-
-**Bot Features:**
-• Personalized content creation
-• Multiple subscription plans
-• Secure payment processing
-• 24/7 support
-
-**Need More Help?**
-• Contact support for technical issues
-• Check our FAQ for common questions
-• Use the buttons below for quick actions
-
-How can I help you today? 🤔
-        """
-        
-        keyboard = [
-            [InlineKeyboardButton("📊 Check Status", callback_data="check_status")],
-            [InlineKeyboardButton("🆘 Contact Support", callback_data="contact_support")],
-            [InlineKeyboardButton("❓ FAQ", callback_data="show_faq")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        help_text = _HELP_TEXT
         
-        await update.callback_query.edit_message_text(help_text, parse_mode='Markdown', reply_markup=reply_markup)
+        await self._edit(update, help_text, parse_mode=ParseMode.HTML, reply_markup=_HELP_MARKUP)
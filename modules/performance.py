@@ -4,22 +4,131 @@ Provides performance optimization and caching for the Telegram bot.
 """
 
 import asyncio
+import gc
+import heapq
+import math
 import time
 import logging
+from collections import OrderedDict
 from typing import Dict, Any, Optional, List
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from functools import lru_cache, wraps
+from functools import lru_cache, partial, wraps
 import sqlite3
 
 logger = logging.getLogger(__name__)
 
+# Miss marker for cache lookups where None is a valid cached value
+_MISSING = object()
+
+class KeyedLock:
+    """Per-key asyncio locks: updates for one key run in order, different keys run concurrently"""
+    
+    def __init__(self):
+        # key -> [asyncio.Lock, number of holders and waiters]
+        self._locks = {}
+    
+    def __len__(self) -> int:
+        return len(self._locks)
+    
+    @asynccontextmanager
+    async def hold(self, key):
+        """Hold the lock for key; it is dropped once nobody holds or awaits it"""
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+class TTLCache:
+    """Small keyed cache whose entries expire ttl seconds after they are stored
+    
+    Holds at most max_size entries; when full, the oldest entry is evicted even if it is still fresh.
+    """
+    
+    def __init__(self, ttl: float, max_size: int = 1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        # key -> (expires_at, value), oldest first; every entry has the same ttl, so this is also expiry order
+        self._entries = OrderedDict()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def pop(self, key, default=None):
+        entry = self._entries.pop(key, None)
+        return entry[1] if entry else default
+    
+    async def get_or_load(self, key, load):
+        """Return the cached value for key, awaiting load() on a miss or after expiry"""
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry and entry[0] > now:
+            return entry[1]
+        
+        value = await load()
+        self._entries.pop(key, None)
+        # Drop expired entries from the front, then the oldest fresh ones while still full
+        while self._entries:
+            oldest_expiry = next(iter(self._entries.values()))[0]
+            if oldest_expiry > now and len(self._entries) < self.max_size:
+                break
+            self._entries.popitem(last=False)
+        self._entries[key] = (now + self.ttl, value)
+        return value
+
+class SendRateLimiter:
+    """Shapes outbound Telegram sends to a steady rate instead of bursting into 429s
+    
+    Uses the GCRA form of a token bucket: each send reserves the next slot on a
+    theoretical schedule and sleeps until it is due, so callers are served in
+    arrival order without a worker task or lock.
+    """
+    
+    def __init__(self, rate: float = 25.0, burst: int = 25):
+        self.rate = rate
+        self.burst = burst
+        self._interval = 1.0 / rate
+        self._next_slot = 0.0
+    
+    async def acquire(self):
+        """Wait until the caller may send one message"""
+        now = time.monotonic()
+        slot = max(self._next_slot, now)
+        self._next_slot = slot + self._interval
+        delay = slot - now - (self.burst - 1) * self._interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+# Bot-wide limiter; Telegram allows about 30 messages per second per bot
+send_rate_limiter = SendRateLimiter()
+
 class PerformanceManager:
     """Centralized performance management and optimization"""
     
     def __init__(self, db_manager):
         self.db_manager = db_manager
-        self.cache = {}
-        self.cache_ttl = {}
+        # key -> (fresh_until, expires_at, value), least recently used first; between the
+        # two times an entry is stale: still served while a background refresh runs
+        self.cache = OrderedDict()
+        self.max_entries = 10_000
+        self.stale_grace_seconds = 60
+        # (expires_at, key) for every write; entries whose key was rewritten or evicted are skipped on pop
+        self._expiry_heap = []
+        # key -> in-flight refresh task, so each key refreshes at most once at a time
+        self._refreshing = {}
+        # Hit counts per key stretch the TTL of hot keys up to max_ttl_seconds; the
+        # counts are halved every frequency_decay_seconds so old popularity fades
+        self.max_ttl_seconds = 3600
+        self.frequency_decay_seconds = 300
+        self._access_counts = {}
+        self._last_frequency_decay = time.time()
         self.performance_metrics = {
             "db_queries": 0,
             "cache_hits": 0,
@@ -28,39 +137,101 @@ class PerformanceManager:
             "average_response_time": 0.0
         }
         self.slow_query_threshold = 1.0  # seconds
+        # Running totals behind average_response_time
+        self._response_count = 0
+        self._response_time_total = 0.0
+        
+        # Drop cached entries whenever the database reports a write for the user
+        db_manager.subscribe("user_updated", self.invalidate_user_cache)
+        db_manager.subscribe("subscription_updated", self._invalidate_subscription_cache)
     
     def cache_result(self, key: str, value: Any, ttl_seconds: int = 300):
-        """Cache a result with TTL"""
-        try:
-            self.cache[key] = value
-            self.cache_ttl[key] = time.time() + ttl_seconds
-        except Exception as e:
-            logger.error(f"Error caching result: {e}")
+        """Cache a result with TTL, extended for frequently read keys"""
+        current_time = time.time()
+        if current_time - self._last_frequency_decay >= self.frequency_decay_seconds:
+            self._decay_access_counts(current_time)
+        
+        hits = self._access_counts.get(key, 0)
+        if hits:
+            ttl_seconds = min(ttl_seconds * (1 + math.log1p(hits)), max(ttl_seconds, self.max_ttl_seconds))
+        
+        fresh_until = current_time + ttl_seconds
+        expires_at = fresh_until + self.stale_grace_seconds
+        self.cache.pop(key, None)
+        self.cache[key] = (fresh_until, expires_at, value)
+        if len(self.cache) > self.max_entries:
+            self.cache.popitem(last=False)
+        
+        heapq.heappush(self._expiry_heap, (expires_at, key))
+        if len(self._expiry_heap) > 2 * self.max_entries:
+            # Too many stale index entries from rewrites; rebuild from the live cache
+            self._expiry_heap = [(entry[1], k) for k, entry in self.cache.items()]
+            heapq.heapify(self._expiry_heap)
     
-    def get_cached_result(self, key: str) -> Optional[Any]:
-        """Get cached result if still valid"""
-        try:
-            if key in self.cache:
-                if time.time() < self.cache_ttl.get(key, 0):
-                    self.performance_metrics["cache_hits"] += 1
-                    return self.cache[key]
-                else:
-                    # Expired, remove from cache
-                    del self.cache[key]
-                    del self.cache_ttl[key]
-            
-            self.performance_metrics["cache_misses"] += 1
-            return None
-            
-        except Exception as e:
-            logger.error(f"Error getting cached result: {e}")
-            return None
+    def get_cached_result(self, key: str, refresh=None, default=None) -> Optional[Any]:
+        """Get cached result if still valid, otherwise default
+        
+        With a refresh coroutine function, a stale entry is returned as-is and
+        refresh() is scheduled in the background to replace it.
+        """
+        entry = self.cache.get(key)
+        if entry is not None:
+            current_time = time.time()
+            if current_time < entry[0] or (refresh is not None and current_time < entry[1]):
+                if current_time >= entry[0]:
+                    self._schedule_refresh(key, refresh)
+                self.cache.move_to_end(key)
+                self._access_counts[key] = self._access_counts.get(key, 0) + 1
+                self.performance_metrics["cache_hits"] += 1
+                return entry[2]
+            elif current_time >= entry[1]:
+                # Expired, remove from cache
+                del self.cache[key]
+        
+        self.performance_metrics["cache_misses"] += 1
+        return default
+    
+    def _decay_access_counts(self, current_time: float):
+        """Halve every hit count, forgetting keys that drop to zero"""
+        self._access_counts = {key: hits // 2 for key, hits in self._access_counts.items() if hits > 1}
+        self._last_frequency_decay = current_time
+    
+    def _schedule_refresh(self, key: str, refresh):
+        """Run refresh() for key in the background unless one is already running"""
+        if key in self._refreshing:
+            return
+        task = asyncio.create_task(refresh())
+        self._refreshing[key] = task
+        task.add_done_callback(partial(self._refresh_done, key))
+    
+    def _refresh_done(self, key: str, task: asyncio.Task):
+        if self._refreshing.get(key) is task:
+            del self._refreshing[key]
+        if not task.cancelled() and task.exception():
+            logger.error(f"Error refreshing cache entry {key}: {task.exception()}")
+    
+    async def _reload(self, key: str, load, ttl_seconds: int) -> Any:
+        """Load a fresh value for key and cache it"""
+        value = await load()
+        self.cache_result(key, value, ttl_seconds)
+        return value
+    
+    def _drop_cache_entry(self, key: str):
+        """Remove key from the cache and cancel any refresh that would re-add it"""
+        self.cache.pop(key, None)
+        task = self._refreshing.pop(key, None)
+        if task:
+            task.cancel()
     
     def clear_cache(self):
         """Clear all cached data"""
         try:
             self.cache.clear()
-            self.cache_ttl.clear()
+            self._expiry_heap.clear()
+            for task in self._refreshing.values():
+                task.cancel()
+            self._refreshing.clear()
+            self._access_counts.clear()
             logger.info("Cache cleared")
         except Exception as e:
             logger.error(f"Error clearing cache: {e}")
@@ -76,8 +247,10 @@ class PerformanceManager:
                     execution_time = time.time() - start_time
                     
                     # Update performance metrics
+                    self._response_count += 1
+                    self._response_time_total += execution_time
                     self.performance_metrics["average_response_time"] = (
-                        (self.performance_metrics["average_response_time"] + execution_time) / 2
+                        self._response_time_total / self._response_count
                     )
                     
                     if execution_time > self.slow_query_threshold:
@@ -113,40 +286,40 @@ class PerformanceManager:
     async def optimize_database(self):
         """Optimize database performance"""
         try:
-            with sqlite3.connect(self.db_manager.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Analyze database for query optimization
-                cursor.execute("ANALYZE")
-                
-                # Vacuum database to reclaim space
-                cursor.execute("VACUUM")
-                
-                # Update statistics
-                cursor.execute("PRAGMA optimize")
-                
-                conn.commit()
-                logger.info("Database optimization completed")
+            # ANALYZE/VACUUM can take seconds, so they run in a worker thread; shielded
+            # so a cancelled caller doesn't abandon the pass halfway through
+            await asyncio.shield(asyncio.to_thread(self._optimize_database_sync))
+            logger.info("Database optimization completed")
                 
         except Exception as e:
             logger.error(f"Error optimizing database: {e}")
     
+    def _optimize_database_sync(self):
+        """Run the blocking optimization statements on a dedicated connection
+        
+        VACUUM rebuilds the file, so it gets its own short-lived connection rather
+        than one borrowed from the shared pool.
+        """
+        with sqlite3.connect(self.db_manager.db_path) as conn:
+            # Analyze database for query optimization and update statistics
+            conn.executescript("ANALYZE; PRAGMA optimize;")
+            
+            # Vacuum database to reclaim space
+            conn.execute("VACUUM")
+    
     async def get_cached_user_state(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Get user state with caching"""
         try:
             cache_key = f"user_state_{user_id}"
-            cached_result = self.get_cached_result(cache_key)
+            # Cache for 5 minutes
+            reload = partial(self._reload, cache_key, partial(self.db_manager.get_user_state_data, user_id), 300)
+            cached_result = self.get_cached_result(cache_key, refresh=reload)
             
             if cached_result is not None:
                 return cached_result
             
             # Get from database
-            state_data = await self.db_manager.get_user_state_data(user_id)
-            
-            # Cache for 5 minutes
-            self.cache_result(cache_key, state_data, 300)
-            
-            return state_data
+            return await reload()
             
         except Exception as e:
             logger.error(f"Error getting cached user state: {e}")
@@ -156,18 +329,15 @@ class PerformanceManager:
         """Get user profile with caching"""
         try:
             cache_key = f"user_profile_{user_id}"
-            cached_result = self.get_cached_result(cache_key)
+            # Cache for 10 minutes
+            reload = partial(self._reload, cache_key, partial(self.db_manager.get_user_profile, user_id), 600)
+            cached_result = self.get_cached_result(cache_key, refresh=reload)
             
             if cached_result is not None:
                 return cached_result
             
             # Get from database
-            profile = await self.db_manager.get_user_profile(user_id)
-            
-            # Cache for 10 minutes
-            self.cache_result(cache_key, profile, 600)
-            
-            return profile
+            return await reload()
             
         except Exception as e:
             logger.error(f"Error getting cached user profile: {e}")
@@ -177,23 +347,43 @@ class PerformanceManager:
         """Get user subscription with caching"""
         try:
             cache_key = f"subscription_{user_id}"
-            cached_result = self.get_cached_result(cache_key)
+            # Cache for 5 minutes
+            reload = partial(self._reload, cache_key, partial(self.db_manager.get_active_subscription, user_id), 300)
+            cached_result = self.get_cached_result(cache_key, refresh=reload)
             
             if cached_result is not None:
                 return cached_result
             
             # Get from database
-            subscription = await self.db_manager.get_active_subscription(user_id)
-            
-            # Cache for 5 minutes
-            self.cache_result(cache_key, subscription, 300)
-            
-            return subscription
+            return await reload()
             
         except Exception as e:
             logger.error(f"Error getting cached subscription: {e}")
             return None
     
+    async def get_cached_user_bundle(self, user_id: int) -> Dict[str, Any]:
+        """Get user state, profile and subscription with caching, loading all three together on a miss"""
+        try:
+            # A user without an active subscription has a cached None, which is still a hit
+            state_data = self.get_cached_result(f"user_state_{user_id}", default=_MISSING)
+            profile = self.get_cached_result(f"user_profile_{user_id}", default=_MISSING)
+            subscription = self.get_cached_result(f"subscription_{user_id}", default=_MISSING)
+            
+            if _MISSING in (state_data, profile, subscription):
+                bundle = await self.db_manager.get_user_bundle(user_id)
+                state_data, profile, subscription = bundle["state"], bundle["profile"], bundle["subscription"]
+                
+                # Same TTLs as the single-value helpers
+                self.cache_result(f"user_state_{user_id}", state_data, 300)
+                self.cache_result(f"user_profile_{user_id}", profile, 600)
+                self.cache_result(f"subscription_{user_id}", subscription, 300)
+            
+            return {"state": state_data, "profile": profile, "subscription": subscription}
+            
+        except Exception as e:
+            logger.error(f"Error getting cached user bundle: {e}")
+            return {"state": None, "profile": None, "subscription": None}
+    
     def invalidate_user_cache(self, user_id: int):
         """Invalidate all cached data for a user"""
         try:
@@ -204,43 +394,44 @@ class PerformanceManager:
             ]
             
             for key in cache_keys_to_remove:
-                if key in self.cache:
-                    del self.cache[key]
-                if key in self.cache_ttl:
-                    del self.cache_ttl[key]
+                self._drop_cache_entry(key)
             
             logger.debug(f"Cache invalidated for user {user_id}")
             
         except Exception as e:
             logger.error(f"Error invalidating user cache: {e}")
     
+    def _invalidate_subscription_cache(self, user_id: int):
+        """Invalidate the cached subscription for a user"""
+        self._drop_cache_entry(f"subscription_{user_id}")
+    
     async def batch_process_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Process multiple messages in batch for better performance"""
         try:
             if not messages:
                 return []
             
-            # Group messages by user_id for batch processing
+            # Group messages by user_id for batch processing (users in first-seen order)
             user_messages = {}
             for message in messages:
                 user_id = message.get('user_id')
                 if user_id:
-                    if user_id not in user_messages:
-                        user_messages[user_id] = []
-                    user_messages[user_id].append(message)
+                    user_messages.setdefault(user_id, []).append(message)
             
-            # Process each user's messages
-            results = []
-            for user_id, user_msg_list in user_messages.items():
+            async def process_user_messages(user_id, user_msg_list):
                 # Get user state once for all messages
                 user_state = await self.get_cached_user_state(user_id)
                 
-                for message in user_msg_list:
-                    # Process message with cached state
-                    result = await self._process_single_message(message, user_state)
-                    results.append(result)
+                # Process messages with cached state
+                return await asyncio.gather(
+                    *(self._process_single_message(message, user_state) for message in user_msg_list)
+                )
             
-            return results
+            # Users are processed concurrently; gather keeps results in the grouped order
+            grouped_results = await asyncio.gather(
+                *(process_user_messages(user_id, user_msg_list) for user_id, user_msg_list in user_messages.items())
+            )
+            return [result for user_results in grouped_results for result in user_results]
             
         except Exception as e:
             logger.error(f"Error batch processing messages: {e}")
@@ -291,20 +482,18 @@ class PerformanceManager:
         """Clean up expired cache entries"""
         try:
             current_time = time.time()
-            expired_keys = []
-            
-            for key, expiry_time in self.cache_ttl.items():
-                if current_time >= expiry_time:
-                    expired_keys.append(key)
+            removed = 0
             
-            for key in expired_keys:
-                if key in self.cache:
+            # Only the expired head of the heap is visited
+            while self._expiry_heap and self._expiry_heap[0][0] <= current_time:
+                expiry_time, key = heapq.heappop(self._expiry_heap)
+                entry = self.cache.get(key)
+                if entry is not None and entry[1] == expiry_time:
                     del self.cache[key]
-                if key in self.cache_ttl:
-                    del self.cache_ttl[key]
+                    removed += 1
             
-            if expired_keys:
-                logger.info(f"Cleaned up {len(expired_keys)} expired cache entries")
+            if removed:
+                logger.info(f"Cleaned up {removed} expired cache entries")
                 
         except Exception as e:
             logger.error(f"Error cleaning up old cache: {e}")
@@ -328,43 +517,67 @@ class PerformanceManager:
             # Clear old cache entries
             asyncio.create_task(self.cleanup_old_cache())
             
-            # Force garbage collection
-            import gc
-            gc.collect()
+            # Collect only the young generation: a full collection pauses the event
+            # loop for time proportional to the whole heap
+            collected = gc.collect(0)
             
-            logger.info("Memory optimization completed")
+            logger.info(f"Memory optimization completed, {collected} objects collected")
             
         except Exception as e:
             logger.error(f"Error optimizing memory usage: {e}")
     
-    async def get_database_stats(self) -> Dict[str, Any]:
-        """Get database performance statistics"""
+    async def get_database_stats(self, exact_counts: bool = False) -> Dict[str, Any]:
+        """Get database performance statistics
+        
+        Row counts and sizes come from the dbstat virtual table when SQLite has it;
+        otherwise rows are only counted (with full scans) when exact_counts is set.
+        """
         try:
-            with sqlite3.connect(self.db_manager.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Get database size
-                cursor.execute("SELECT page_count * page_size as size FROM pragma_page_count(), pragma_page_size()")
-                db_size = cursor.fetchone()[0]
-                
-                # Get table sizes
-                cursor.execute("""
-                    SELECT name, 
-                           (SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name=m.name) as row_count
-                    FROM sqlite_master m 
-                    WHERE type='table' AND name NOT LIKE 'sqlite_%'
-                """)
-                table_stats = cursor.fetchall()
-                
-                stats = {
-                    "database_size_bytes": db_size,
-                    "database_size_mb": db_size / (1024 * 1024),
-                    "table_count": len(table_stats),
-                    "tables": [{"name": name, "rows": row_count} for name, row_count in table_stats]
-                }
-                
-                return stats
+            return await asyncio.to_thread(self._read_database_stats, exact_counts)
                 
         except Exception as e:
             logger.error(f"Error getting database stats: {e}")
             return {"error": str(e)}
+    
+    def _read_database_stats(self, exact_counts: bool = False) -> Dict[str, Any]:
+        """Read database statistics with blocking sqlite3 calls"""
+        # Pooled connection: reuses a warm page cache instead of reopening the file
+        with self.db_manager.pooled_connection() as conn:
+            cursor = conn.cursor()
+            
+            # Get database size
+            cursor.execute("SELECT page_count * page_size as size FROM pragma_page_count(), pragma_page_size()")
+            db_size = cursor.fetchone()[0]
+            
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")
+            table_names = [row[0] for row in cursor.fetchall()]
+            
+            cursor.execute("PRAGMA compile_options")
+            has_dbstat = any(row[0] == "ENABLE_DBSTAT_VTAB" for row in cursor.fetchall())
+            
+            # Get table sizes
+            tables = []
+            for name in table_names:
+                table = {"name": name, "rows": None}
+                if has_dbstat:
+                    # Leaf cells are the table's rows; no table scan needed
+                    cursor.execute(
+                        "SELECT SUM(CASE WHEN pagetype = 'leaf' THEN ncell ELSE 0 END), SUM(pgsize) "
+                        "FROM dbstat WHERE name = ?", (name,)
+                    )
+                    rows, size = cursor.fetchone()
+                    table["rows"] = rows or 0
+                    table["size_bytes"] = size or 0
+                elif exact_counts:
+                    cursor.execute(f'SELECT COUNT(*) FROM "{name}"')
+                    table["rows"] = cursor.fetchone()[0]
+                tables.append(table)
+            
+            stats = {
+                "database_size_bytes": db_size,
+                "database_size_mb": db_size / (1024 * 1024),
+                "table_count": len(tables),
+                "tables": tables
+            }
+            
+            return stats
@@ -3,63 +3,101 @@ Security Module
 Provides security utilities and rate limiting for the Telegram bot.
 """
 
+import re
 import time
 import hashlib
 import secrets
 import logging
-from typing import Dict, List, Optional, Tuple
-from datetime import datetime, timedelta
-from collections import defaultdict, deque
+from typing import Dict, Iterable, List, Optional, Tuple
+from datetime import datetime
+from collections import deque
 
 logger = logging.getLogger(__name__)
 
+# Content checks, compiled once into one alternation per category so each is a single scan
+_DANGEROUS_PATTERNS = (
+    '<script', 'javascript:', 'data:', 'vbscript:',
+    'onload=', 'onerror=', 'onclick=', 'onmouseover=',
+    'eval(', 'document.cookie', 'window.location'
+)
+_SQL_PATTERNS = (
+    'union select', 'drop table', 'delete from', 'insert into',
+    'update set', 'alter table', 'create table'
+)
+_SPAM_PATTERNS = (
+    'http://', 'https://', 'www.', '.com', '.ru', '.org',
+    'bitcoin', 'crypto', 'investment', 'earn money'
+)
+
+def _alternation(patterns) -> str:
+    return "|".join(map(re.escape, patterns))
+
+_DANGEROUS_RE = re.compile(_alternation(_DANGEROUS_PATTERNS))
+_SQL_RE = re.compile(_alternation(_SQL_PATTERNS))
+# Zero-width lookahead so overlapping spam markers (e.g. "www.com") are all seen
+_SPAM_RE = re.compile(f"(?=({_alternation(_SPAM_PATTERNS)}))")
+
+# Characters not allowed in filenames, each mapped to '_'
+_FILENAME_TRANSLATION = str.maketrans({char: '_' for char in '/\\:*?"<>|'})
+
 class SecurityManager:
     """Centralized security management"""
     
     def __init__(self):
-        self.rate_limits = defaultdict(lambda: deque())
+        # Per-user entries are only created when something is recorded for the user,
+        # so lookups for unknown users don't leave empty deques behind
+        self.rate_limits: Dict[int, deque] = {}
         self.blocked_users = set()
-        self.suspicious_activities = defaultdict(list)
         self.max_requests_per_minute = 30
         self.max_requests_per_hour = 200
         self.block_duration_minutes = 60
+        # Oldest entries drop off once a user has this many recorded activities
+        self.max_activities_per_user = 200
+        self.suspicious_activities: Dict[int, deque] = {}
+        # Last hour of each user's activities as (timestamp, is_failure), with a running
+        # failure count, so detection reads counters instead of rescanning the history
+        self._recent_activities: Dict[int, deque] = {}
+        self._recent_failed_counts: Dict[int, int] = {}
         
     def check_rate_limit(self, user_id: int) -> Tuple[bool, str]:
         """Check if user is within rate limits"""
-        try:
-            current_time = time.time()
-            user_requests = self.rate_limits[user_id]
-            
-            # Remove old requests (older than 1 hour)
-            while user_requests and user_requests[0] < current_time - 3600:
-                user_requests.popleft()
-            
-            # Check hourly limit
-            if len(user_requests) >= self.max_requests_per_hour:
-                self._block_user(user_id, "Hourly rate limit exceeded")
-                return False, "Rate limit exceeded. Please try again later."
-            
-            # Check minute limit
-            recent_requests = [req for req in user_requests if req > current_time - 60]
-            if len(recent_requests) >= self.max_requests_per_minute:
-                self._block_user(user_id, "Minute rate limit exceeded")
-                return False, "Too many requests. Please slow down."
-            
-            # Add current request
-            user_requests.append(current_time)
-            
-            return True, "OK"
-            
-        except Exception as e:
-            logger.error(f"Error checking rate limit for user {user_id}: {e}")
-            return False, "Rate limit check failed"
+        # Monotonic clock: wall-clock jumps must not free or lock out users
+        current_time = time.monotonic()
+        user_requests = self.rate_limits.get(user_id)
+        if user_requests is None:
+            user_requests = self.rate_limits[user_id] = deque()
+        
+        # Remove old requests (older than 1 hour)
+        while user_requests and user_requests[0] < current_time - 3600:
+            user_requests.popleft()
+        
+        # Check hourly limit
+        if len(user_requests) >= self.max_requests_per_hour:
+            self._block_user(user_id, "Hourly rate limit exceeded")
+            return False, "Rate limit exceeded. Please try again later."
+        
+        # Check minute limit (requests are in time order, so count back from the newest)
+        minute_ago = current_time - 60
+        recent_count = 0
+        for request_time in reversed(user_requests):
+            if request_time <= minute_ago:
+                break
+            recent_count += 1
+        if recent_count >= self.max_requests_per_minute:
+            self._block_user(user_id, "Minute rate limit exceeded")
+            return False, "Too many requests. Please slow down."
+        
+        # Add current request
+        user_requests.append(current_time)
+        
+        return True, "OK"
     
     def _block_user(self, user_id: int, reason: str):
         """Block user temporarily"""
         try:
             self.blocked_users.add(user_id)
-            self.suspicious_activities[user_id].append({
-                "timestamp": datetime.now().isoformat(),
+            self._record_activity(user_id, {
+                "timestamp": time.time(),
                 "reason": reason,
                 "action": "blocked"
             })
@@ -72,6 +110,42 @@ class SecurityManager:
         except Exception as e:
             logger.error(f"Error blocking user {user_id}: {e}")
     
+    def _record_activity(self, user_id: int, activity: Dict):
+        """Append an activity to the user's history and last-hour counters"""
+        activities = self.suspicious_activities.get(user_id)
+        if activities is None:
+            activities = self.suspicious_activities[user_id] = deque(maxlen=self.max_activities_per_user)
+        activities.append(activity)
+        
+        window = self._recent_activities.get(user_id)
+        if window is None:
+            window = self._recent_activities[user_id] = deque()
+            self._recent_failed_counts[user_id] = 0
+        if len(window) >= self.max_activities_per_user:
+            # Mirror the history's cap so the counters describe the same entries
+            _, was_failure = window.popleft()
+            self._recent_failed_counts[user_id] -= was_failure
+        is_failure = "failed" in activity.get("reason", "").lower()
+        window.append((activity["timestamp"], is_failure))
+        self._recent_failed_counts[user_id] += is_failure
+    
+    def _recent_activity_counts(self, user_id: int, current_time: float) -> Tuple[int, int]:
+        """Return (activities, failed attempts) recorded for the user in the last hour"""
+        window = self._recent_activities.get(user_id)
+        if not window:
+            return 0, 0
+        
+        hour_ago = current_time - 3600
+        while window and window[0][0] <= hour_ago:
+            _, was_failure = window.popleft()
+            self._recent_failed_counts[user_id] -= was_failure
+        
+        if not window:
+            del self._recent_activities[user_id]
+            self._recent_failed_counts.pop(user_id, None)
+            return 0, 0
+        return len(window), self._recent_failed_counts[user_id]
+    
     def _schedule_unblock(self, user_id: int):
         """Schedule user unblock after block duration"""
         try:
@@ -96,26 +170,22 @@ class SecurityManager:
     def detect_suspicious_activity(self, user_id: int, activity_type: str, details: Dict) -> bool:
         """Detect suspicious user activity"""
         try:
-            current_time = datetime.now()
+            current_time = time.time()
             
-            # Get recent activities for this user
-            recent_activities = [
-                activity for activity in self.suspicious_activities[user_id]
-                if datetime.fromisoformat(activity["timestamp"]) > current_time - timedelta(hours=1)
-            ]
+            # Count recent activities for this user
+            recent_count, failed_count = self._recent_activity_counts(user_id, current_time)
             
             # Check for patterns
             suspicious = False
             reason = ""
             
             # Pattern 1: Too many failed attempts
-            failed_attempts = [a for a in recent_activities if "failed" in a.get("reason", "").lower()]
-            if len(failed_attempts) >= 5:
+            if failed_count >= 5:
                 suspicious = True
                 reason = "Multiple failed attempts detected"
             
             # Pattern 2: Rapid repeated actions
-            if len(recent_activities) >= 20:
+            if recent_count >= 20:
                 suspicious = True
                 reason = "Excessive activity detected"
             
@@ -125,8 +195,8 @@ class SecurityManager:
                 reason = "Unusually long message detected"
             
             if suspicious:
-                self.suspicious_activities[user_id].append({
-                    "timestamp": current_time.isoformat(),
+                self._record_activity(user_id, {
+                    "timestamp": current_time,
                     "reason": reason,
                     "activity_type": activity_type,
                     "details": details
@@ -135,7 +205,7 @@ class SecurityManager:
                 logger.warning(f"Suspicious activity detected for user {user_id}: {reason}")
                 
                 # Block user if too many suspicious activities
-                if len(recent_activities) >= 10:
+                if recent_count >= 10:
                     self._block_user(user_id, f"Multiple suspicious activities: {reason}")
                 
                 return True
@@ -156,35 +226,20 @@ class SecurityManager:
             if len(message) > 4000:
                 return False, "Message too long"
             
-            # Check for potential XSS
-            dangerous_patterns = [
-                '<script', 'javascript:', 'data:', 'vbscript:',
-                'onload=', 'onerror=', 'onclick=', 'onmouseover=',
-                'eval(', 'document.cookie', 'window.location'
-            ]
-            
             message_lower = message.lower()
-            for pattern in dangerous_patterns:
-                if pattern in message_lower:
-                    return False, f"Potentially dangerous content detected: {pattern}"
+            
+            # Check for potential XSS
+            match = _DANGEROUS_RE.search(message_lower)
+            if match:
+                return False, f"Potentially dangerous content detected: {match.group()}"
             
             # Check for SQL injection patterns
-            sql_patterns = [
-                'union select', 'drop table', 'delete from', 'insert into',
-                'update set', 'alter table', 'create table'
-            ]
-            
-            for pattern in sql_patterns:
-                if pattern in message_lower:
-                    return False, f"Potential SQL injection detected: {pattern}"
-            
-            # Check for spam patterns
-            spam_patterns = [
-                'http://', 'https://', 'www.', '.com', '.ru', '.org',
-                'bitcoin', 'crypto', 'investment', 'earn money'
-            ]
-            
-            spam_count = sum(1 for pattern in spam_patterns if pattern in message_lower)
+            match = _SQL_RE.search(message_lower)
+            if match:
+                return False, f"Potential SQL injection detected: {match.group()}"
+            
+            # Check for spam patterns (each distinct pattern counts once)
+            spam_count = len({match.group(1) for match in _SPAM_RE.finditer(message_lower)})
             if spam_count >= 3:
                 return False, "Potential spam detected"
             
@@ -200,22 +255,11 @@ class SecurityManager:
             if not filename:
                 return "unnamed"
             
-            # Remove dangerous characters
-            dangerous_chars = ['/', '\\', ':', '*', '?', '"', '<', '>', '|']
-            sanitized = filename
-            
-            for char in dangerous_chars:
-                sanitized = sanitized.replace(char, '_')
-            
-            # Limit length
-            if len(sanitized) > 100:
-                sanitized = sanitized[:100]
+            # Replace dangerous characters in one pass and limit length
+            sanitized = filename.translate(_FILENAME_TRANSLATION)[:100].strip()
             
             # Ensure it's not empty
-            if not sanitized.strip():
-                sanitized = "unnamed"
-            
-            return sanitized.strip()
+            return sanitized or "unnamed"
             
         except Exception as e:
             logger.error(f"Error sanitizing filename: {e}")
@@ -237,6 +281,23 @@ class SecurityManager:
             logger.error(f"Error hashing sensitive data: {e}")
             return ""
     
+    def hash_bytes(self, data: bytes) -> str:
+        """Hash sensitive data that is already bytes, skipping the encode step"""
+        try:
+            return hashlib.sha256(data).hexdigest()
+        except Exception as e:
+            logger.error(f"Error hashing sensitive data: {e}")
+            return ""
+    
+    def hash_many(self, items: Iterable[str]) -> List[str]:
+        """Hash many values at once, with lookups hoisted out of the loop"""
+        try:
+            sha256 = hashlib.sha256
+            return [sha256(item.encode()).hexdigest() for item in items]
+        except Exception as e:
+            logger.error(f"Error hashing sensitive data: {e}")
+            return []
+    
     def verify_admin_access(self, user_id: int, admin_ids: List[int]) -> bool:
         """Verify if user has admin access"""
         try:
@@ -250,24 +311,20 @@ class SecurityManager:
         try:
             current_time = time.time()
             
-            # Count active rate limits
-            active_rate_limits = 0
-            for user_requests in self.rate_limits.values():
-                recent_requests = [req for req in user_requests if req > current_time - 3600]
-                if recent_requests:
-                    active_rate_limits += 1
+            # Count active rate limits (a user is active if their newest request is within the hour)
+            hour_ago = time.monotonic() - 3600
+            active_rate_limits = sum(
+                1 for user_requests in self.rate_limits.values()
+                if user_requests and user_requests[-1] > hour_ago
+            )
             
             # Count blocked users
             blocked_count = len(self.blocked_users)
             
             # Count suspicious activities in last hour
             recent_suspicious = 0
-            for activities in self.suspicious_activities.values():
-                recent_activities = [
-                    activity for activity in activities
-                    if datetime.fromisoformat(activity["timestamp"]) > datetime.now() - timedelta(hours=1)
-                ]
-                recent_suspicious += len(recent_activities)
+            for user_id in list(self._recent_activities):
+                recent_suspicious += self._recent_activity_counts(user_id, current_time)[0]
             
             report = {
                 "timestamp": datetime.now().isoformat(),
@@ -287,7 +344,7 @@ class SecurityManager:
         """Clean up old rate limit and activity data"""
         try:
             current_time = time.time()
-            cutoff_time = current_time - 86400  # 24 hours ago
+            cutoff_time = time.monotonic() - 86400  # 24 hours ago, on the rate limiter's clock
             
             # Clean up rate limits
             for user_id in list(self.rate_limits.keys()):
@@ -301,19 +358,21 @@ class SecurityManager:
                     del self.rate_limits[user_id]
             
             # Clean up suspicious activities
-            cutoff_datetime = datetime.now() - timedelta(days=7)
+            activity_cutoff = current_time - 7 * 86400  # 7 days ago
             for user_id in list(self.suspicious_activities.keys()):
                 activities = self.suspicious_activities[user_id]
-                # Remove old activities
-                self.suspicious_activities[user_id] = [
-                    activity for activity in activities
-                    if datetime.fromisoformat(activity["timestamp"]) > cutoff_datetime
-                ]
+                # Remove old activities (appended in time order, so they are at the head)
+                while activities and activities[0]["timestamp"] <= activity_cutoff:
+                    activities.popleft()
                 
                 # Remove empty activity lists
-                if not self.suspicious_activities[user_id]:
+                if not activities:
                     del self.suspicious_activities[user_id]
             
+            # Expire last-hour counters
+            for user_id in list(self._recent_activities):
+                self._recent_activity_counts(user_id, current_time)
+            
             logger.info("Security data cleanup completed")
             
         except Exception as e:
@@ -5,52 +5,254 @@ Handles the setup process to collect key texts and preferences from the client.
 
 import logging
 import asyncio
+import time
+from types import MappingProxyType
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.constants import ParseMode
 from telegram.ext import ContextTypes
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Mapping, Tuple
 from modules.admin_notifications import admin_notifications
+from modules.text_utils import truncate
 
 logger = logging.getLogger(__name__)
 
+# Words that advance the setup flow instead of being recorded as answers
+_FLOW_CONTROL_CMDS = frozenset({"готов", "дальше", "готово", "продолжить", "далее"})
+
+# Collection limits by plan; Express and 2-week plans use the defaults
+_MAX_POSITIVE_BY_PLAN = MappingProxyType({"regular": 7})
+_DEFAULT_MAX_POSITIVE = 5
+_MAX_TASKS_PER_FOCUS_BY_PLAN = MappingProxyType({"regular": 3})
+_DEFAULT_MAX_TASKS_PER_FOCUS = 1
+
+# Collection prompts only vary by counts, so they are formatted from fixed templates.
+# Sent as HTML: the templates carry no user text, so nothing needs escaping.
+_MIN_POSITIVE_TEXT = """
+⚠️ <b>Нужно еще {remaining} положительных чувств</b>
+
+У меня есть только {current_count} положительных чувств, а нужно минимум 3 для создания качественных фокус-утверждений.
+
+<b>Поделись еще {remaining} чувствами, которые ты испытаешь, когда достигнешь цели.</b>
+
+<b>Примеры:</b>
+• "Я буду чувствовать..."
+• "Я почувствую..."
+• "Мне будет..."
+
+Это поможет мне лучше понять твою мотивацию! 😊
+        """
+
+_MIN_NERVOUS_TEXT = """
+⚠️ <b>Нужно еще {remaining} беспокойств</b>
+
+У меня есть только {current_count} беспокойств, а нужно минимум 2 для работы с твоими страхами.
+
+<b>Поделись еще {remaining} беспокойствами или страхами, связанными с твоей целью.</b>
+
+<b>Примеры:</b>
+• "Я боюсь..."
+• "Меня беспокоит..."
+• "Я нервничаю из-за..."
+
+Это поможет мне превратить твои страхи в мотивацию! 😰
+        """
+
+_MIN_OPTIONS_TEXT = """
+⚠️ <b>Нужно еще {remaining} возможностей</b>
+
+У меня есть только {current_count} возможностей, а нужно минимум 2 для понимания твоих целей.
+
+<b>Поделись еще {remaining} возможностями, которые у тебя появятся после достижения цели.</b>
+
+<b>Примеры:</b>
+• "Я смогу..."
+• "У меня будет..."
+• "Я буду..."
+
+Это поможет мне понять, что тебя мотивирует! 🚀
+        """
+
+_MORE_POSITIVE_TEXT = """
+✅ <b>Отлично! Я записал это чувство.</b>
+
+У меня уже есть {current_count} положительных чувств. Можешь поделиться еще {remaining} чувствами, которые ты испытаешь, когда достигнешь цели.
+
+<b>Примеры:</b>
+• "Я буду чувствовать..."
+• "Я почувствую..."
+• "Мне будет..."
+
+Что еще ты будешь чувствовать? 😊
+            """
+
+_LAST_POSITIVE_TEXT = """
+✅ <b>Превосходно! Нужно еще одно чувство.</b>
+
+У меня уже есть {current_count} положительных чувств. Поделись еще одним чувством, которое ты испытаешь, когда достигнешь цели.
+
+Это может быть:
+• Последнее важное чувство
+• Самое сильное переживание
+• То, что тебя больше всего мотивирует
+
+Какое твое последнее чувство? 🎯
+            """
+
+_FINISHED_POSITIVE_TEXT = """
+✅ <b>Отлично! У меня есть {current_count} положительных чувств.</b>
+
+Ты можешь поделиться еще несколькими, если хочешь, или мы можем перейти к следующему вопросу.
+
+<b>Что ты хочешь сделать?</b>
+• Поделиться еще положительными чувствами
+• Перейти к следующему вопросу
+
+Напиши "готов" или "дальше", если хочешь продолжить, или поделись еще одним чувством.
+        """
+
+_MORE_NERVOUS_TEXT = """
+✅ <b>Понял, я записал это беспокойство.</b>
+
+У меня уже есть {current_count} беспокойств. Поделись еще тем, что тебя беспокоит или вызывает тревогу.
+
+<b>Примеры:</b>
+• "Я боюсь..."
+• "Меня беспокоит..."
+• "Я нервничаю из-за..."
+
+Что еще тебя беспокоит? 😰
+        """
+
+_FINISHED_NERVOUS_TEXT = """
+✅ <b>Хорошо! У меня есть {current_count} беспокойств.</b>
+
+Ты можешь поделиться еще несколькими, если хочешь, или мы можем перейти к следующему вопросу.
+
+<b>Что ты хочешь сделать?</b>
+• Поделиться еще беспокойствами
+• Перейти к следующему вопросу
+
+Напиши "готов" или "дальше", если хочешь продолжить, или поделись еще одним беспокойством.
+        """
+
+_MORE_OPTIONS_TEXT = """
+✅ <b>Отлично! Я записал эту возможность.</b>
+
+У меня уже есть {current_count} возможностей. Поделись еще тем, какие возможности у тебя появятся.
+
+<b>Примеры:</b>
+• "Я смогу..."
+• "У меня будет..."
+• "Я буду..."
+
+Какие еще возможности у тебя появятся? 🚀
+        """
+
+_FINISHED_OPTIONS_TEXT = """
+✅ <b>Хорошо! У меня есть {current_count} возможностей.</b>
+
+Ты можешь поделиться еще одной, если хочешь, или мы можем перейти к следующему этапу.
+
+<b>Что ты хочешь сделать?</b>
+• Поделиться еще одной возможностью
+• Перейти к следующему этапу
+
+Напиши "готов" или "дальше", если хочешь продолжить, или поделись еще одной возможностью.
+        """
+
+_WELCOME_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Начнем! 🚀", callback_data="start_key_texts")],
+    [InlineKeyboardButton("Что от меня нужно? ❓", callback_data="setup_explanation")]
+])
+
+_POSITIVE_FEELINGS_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Понял! Начинаю! 😊", callback_data="ready_for_positive")],
+    [InlineKeyboardButton("Нужны примеры? 💡", callback_data="positive_examples")]
+])
+
+_NERVOUS_FEELINGS_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Понял! Начинаю! 😰", callback_data="ready_for_nervous")],
+    [InlineKeyboardButton("Нужны примеры? 💡", callback_data="nervous_examples")]
+])
+
+_AVAILABLE_OPTIONS_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Понял! Начинаю! 🚀", callback_data="ready_for_options")],
+    [InlineKeyboardButton("Нужны примеры? 💡", callback_data="options_examples")]
+])
+
+_TRANSFORMATION_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Начинаем трансформацию! 🔄", callback_data="start_transformation")],
+    [InlineKeyboardButton("Показать мои беспокойства 📋", callback_data="show_nervous")]
+])
+
+_FOCUS_STATEMENTS_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Создать материал! 🚀", callback_data="create_material")],
+    [InlineKeyboardButton("Посмотреть все утверждения 📋", callback_data="view_all_statements")]
+])
+
+_FOCUS_TASKS_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Начинаю! 📝", callback_data="start_tasks")],
+    [InlineKeyboardButton("Нужны примеры? 💡", callback_data="task_examples")]
+])
+
 class SettingUpModule:
+    # Setup steps for emotional state collection, shared by all instances
+    _SETUP_STEPS: Tuple[str, ...] = (
+        "welcome",
+        "collect_positive_feelings",
+        "collect_nervous_feelings",
+        "collect_available_options",
+        "transform_negative_feelings",
+        "create_focus_statements",
+        "complete_setup"
+    )
+    
+    # Key text categories
+    _KEY_TEXT_CATEGORIES: Mapping[str, Mapping[str, Any]] = MappingProxyType({
+        "writing_style": MappingProxyType({
+            "name": "Writing Style Examples",
+            "description": "Share examples of your preferred writing style",
+            "examples": ("Blog posts", "Social media posts", "Emails", "Articles")
+        }),
+        "tone_voice": MappingProxyType({
+            "name": "Tone & Voice",
+            "description": "Describe your preferred tone and voice",
+            "examples": ("Professional", "Casual", "Friendly", "Authoritative", "Humorous")
+        }),
+        "content_types": MappingProxyType({
+            "name": "Content Types",
+            "description": "What types of content do you need?",
+            "examples": ("Educational", "Promotional", "Entertainment", "News", "How-to guides")
+        }),
+        "target_audience": MappingProxyType({
+            "name": "Target Audience",
+            "description": "Who is your target audience?",
+            "examples": ("Young professionals", "Students", "Business owners", "General public")
+        })
+    })
+    
     def __init__(self, db_manager, state_manager, bot_instance=None):
         self.db_manager = db_manager
         self.state_manager = state_manager
         self.bot_instance = bot_instance
         
-        # Setup steps for emotional state collection
-        self.setup_steps = [
-            "welcome",
-            "collect_positive_feelings",
-            "collect_nervous_feelings", 
-            "collect_available_options",
-            "transform_negative_feelings",
-            "create_focus_statements",
-            "complete_setup"
-        ]
+        # Message handlers by current setup question type
+        self._question_type_handlers = {
+            "positive_feelings": self._process_positive_feeling_input,
+            "nervous_feelings": self._process_nervous_feeling_input,
+            "available_options": self._process_available_option_input,
+            "transform_negative": self._process_negative_transformation_input,
+            "task_generation": self._process_task_input,
+            "task_selection": self._process_task_selection_input,
+            "task_response_collection": self._process_task_response,
+            "task_feelings_collection": self._process_task_feelings
+        }
         
-        # Key text categories
-        self.key_text_categories = {
-            "writing_style": {
-                "name": "Writing Style Examples",
-                "description": "Share examples of your preferred writing style",
-                "examples": ["Blog posts", "Social media posts", "Emails", "Articles"]
-            },
-            "tone_voice": {
-                "name": "Tone & Voice",
-                "description": "Describe your preferred tone and voice",
-                "examples": ["Professional", "Casual", "Friendly", "Authoritative", "Humorous"]
-            },
-            "content_types": {
-                "name": "Content Types",
-                "description": "What types of content do you need?",
-                "examples": ["Educational", "Promotional", "Entertainment", "News", "How-to guides"]
-            },
-            "target_audience": {
-                "name": "Target Audience",
-                "description": "Who is your target audience?",
-                "examples": ["Young professionals", "Students", "Business owners", "General public"]
-            }
+        # Collection steps: question type -> (minimum entries, next stage, prompt for more)
+        self._collection_steps = {
+            "positive_feelings": (3, self._move_to_nervous_feelings, self._ask_for_minimum_positive),
+            "nervous_feelings": (2, self._move_to_available_options, self._ask_for_minimum_nervous),
+            "available_options": (2, self._move_to_negative_transformation, self._ask_for_minimum_options)
         }
     
     async def start_setup(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -81,7 +283,7 @@ class SettingUpModule:
             "statements_collected": 0
         })
         
-        await self._welcome_to_setup(update, context, final_target_goal, order_id)
+        await self._welcome_to_setup(update, context, truncate(final_target_goal, 80), order_id)
     
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle messages during emotional state setup"""
@@ -90,57 +292,63 @@ class SettingUpModule:
         
         # Get current setup state
         state_data = await self.db_manager.get_user_state_data(user_id)
+        context.user_data["_state_cache"] = state_data
         current_question_type = state_data.get("current_question_type", "positive_feelings")
         
+        try:
+            await self._dispatch_message(update, context, message_text, current_question_type)
+        finally:
+            # The cached state is only valid for this update; drop it before the
+            # commit so a failed write can't leave it for later callback handlers
+            context.user_data.pop("_state_cache", None)
+            await self._commit_state(user_id, context)
+    
+    async def _dispatch_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE, message_text: str, current_question_type: str):
+        """Route a setup message to the handler for the current question type"""
         # Check for flow control commands
-        if message_text.lower() in ["готов", "дальше", "готово", "продолжить", "далее"]:
+        if message_text.casefold() in _FLOW_CONTROL_CMDS:
             await self._handle_flow_control(update, context, current_question_type)
             return
         
-        if current_question_type == "positive_feelings":
-            await self._process_positive_feeling_input(update, context, message_text)
-        elif current_question_type == "nervous_feelings":
-            await self._process_nervous_feeling_input(update, context, message_text)
-        elif current_question_type == "available_options":
-            await self._process_available_option_input(update, context, message_text)
-        elif current_question_type == "transform_negative":
-            await self._process_negative_transformation_input(update, context, message_text)
-        elif current_question_type == "task_generation":
-            await self._process_task_input(update, context, message_text)
-        elif current_question_type == "task_selection":
-            await self._process_task_selection_input(update, context, message_text)
-        elif current_question_type == "task_response_collection":
-            await self._process_task_response(update, context, message_text)
-        elif current_question_type == "task_feelings_collection":
-            await self._process_task_feelings(update, context, message_text)
-        else:
+        handler = self._question_type_handlers.get(current_question_type)
+        if handler is None:
             await self._show_setup_help(update, context)
+        else:
+            await handler(update, context, message_text)
+    
+    async def _load_state(self, user_id: int, context: ContextTypes.DEFAULT_TYPE) -> Dict[str, Any]:
+        """Return the user's state data, using the copy loaded by handle_message when there is one"""
+        state_data = context.user_data.get("_state_cache")
+        if state_data is None:
+            state_data = await self.db_manager.get_user_state_data(user_id)
+        return state_data
+    
+    async def _stage_state(self, user_id: int, context: ContextTypes.DEFAULT_TYPE, patch: Dict[str, Any]):
+        """Apply a state patch, deferring the write to the end of handle_message when possible"""
+        state_data = context.user_data.get("_state_cache")
+        if state_data is None:
+            await self.db_manager.update_user_state_data(user_id, patch)
+            return
+        state_data.update(patch)
+        context.user_data.setdefault("_state_pending", {}).update(patch)
+    
+    async def _commit_state(self, user_id: int, context: ContextTypes.DEFAULT_TYPE):
+        """Write all state patches staged during this update in one call"""
+        pending = context.user_data.pop("_state_pending", None)
+        if pending:
+            await self.db_manager.update_user_state_data(user_id, pending)
     
     async def _handle_flow_control(self, update: Update, context: ContextTypes.DEFAULT_TYPE, current_question_type: str):
         """Handle flow control commands (готов, дальше, etc.)"""
-        user_id = update.effective_user.id
-        state_data = await self.db_manager.get_user_state_data(user_id)
-        
-        if current_question_type == "positive_feelings":
-            positive_count = len(state_data.get("positive_feelings", []))
-            if positive_count >= 3:  # Minimum 3 positive feelings
-                await self._move_to_nervous_feelings(update, context)
-            else:
-                await self._ask_for_minimum_positive(update, context, positive_count)
-        
-        elif current_question_type == "nervous_feelings":
-            nervous_count = len(state_data.get("nervous_feelings", []))
-            if nervous_count >= 2:  # Minimum 2 nervous feelings
-                await self._move_to_available_options(update, context)
-            else:
-                await self._ask_for_minimum_nervous(update, context, nervous_count)
-        
-        elif current_question_type == "available_options":
-            options_count = len(state_data.get("available_options", []))
-            if options_count >= 2:  # Minimum 2 options
-                await self._move_to_negative_transformation(update, context)
+        collection_step = self._collection_steps.get(current_question_type)
+        if collection_step:
+            minimum, move_to_next, ask_for_minimum = collection_step
+            state_data = await self._load_state(update.effective_user.id, context)
+            collected = len(state_data.get(current_question_type, []))
+            if collected >= minimum:
+                await move_to_next(update, context)
             else:
-                await self._ask_for_minimum_options(update, context, options_count)
+                await ask_for_minimum(update, context, collected)
         
         elif current_question_type == "transform_negative":
             await self._create_focus_statements(update, context)
@@ -151,65 +359,23 @@ class SettingUpModule:
     async def _ask_for_minimum_positive(self, update: Update, context: ContextTypes.DEFAULT_TYPE, current_count: int):
         """Ask for minimum positive feelings"""
         remaining = 3 - current_count
-        text = f"""
-⚠️ **Нужно еще {remaining} положительных чувств**
-
-У меня есть только {current_count} положительных чувств, а нужно минимум 3 для создания качественных фокус-утверждений.
-
-**Поделись еще {remaining} чувствами, которые ты испытаешь, когда достигнешь цели.**
-
-**Примеры:**
-• "Я буду чувствовать..."
-• "Я почувствую..."
-• "Мне будет..."
-
-Это поможет мне лучше понять твою мотивацию! 😊
-        """
-        await update.message.reply_text(text, parse_mode='Markdown')
+        text = _MIN_POSITIVE_TEXT.format_map({"remaining": remaining, "current_count": current_count})
+        await update.message.reply_text(text, parse_mode=ParseMode.HTML)
     
     async def _ask_for_minimum_nervous(self, update: Update, context: ContextTypes.DEFAULT_TYPE, current_count: int):
         """Ask for minimum nervous feelings"""
         remaining = 2 - current_count
-        text = f"""
-⚠️ **Нужно еще {remaining} беспокойств**
-
-У меня есть только {current_count} беспокойств, а нужно минимум 2 для работы с твоими страхами.
-
-**Поделись еще {remaining} беспокойствами или страхами, связанными с твоей целью.**
-
-**Примеры:**
-• "Я боюсь..."
-• "Меня беспокоит..."
-• "Я нервничаю из-за..."
-
-Это поможет мне превратить твои страхи в мотивацию! 😰
-        """
-        await update.message.reply_text(text, parse_mode='Markdown')
+        text = _MIN_NERVOUS_TEXT.format_map({"remaining": remaining, "current_count": current_count})
+        await update.message.reply_text(text, parse_mode=ParseMode.HTML)
     
     async def _ask_for_minimum_options(self, update: Update, context: ContextTypes.DEFAULT_TYPE, current_count: int):
         """Ask for minimum available options"""
         remaining = 2 - current_count
-        text = f"""
-⚠️ **Нужно еще {remaining} возможностей**
-
-У меня есть только {current_count} возможностей, а нужно минимум 2 для понимания твоих целей.
-
-**Поделись еще {remaining} возможностями, которые у тебя появятся после достижения цели.**
-
-**Примеры:**
-• "Я смогу..."
-• "У меня будет..."
-• "Я буду..."
-
-Это поможет мне понять, что тебя мотивирует! 🚀
-        """
-        await update.message.reply_text(text, parse_mode='Markdown')
+        text = _MIN_OPTIONS_TEXT.format_map({"remaining": remaining, "current_count": current_count})
+        await update.message.reply_text(text, parse_mode=ParseMode.HTML)
     
-    async def _welcome_to_setup(self, update: Update, context: ContextTypes.DEFAULT_TYPE, target_goal: str, order_id: str):
+    async def _welcome_to_setup(self, update: Update, context: ContextTypes.DEFAULT_TYPE, display_goal: str, order_id: str):
         """Welcome user to setup process"""
-        # Truncate goal for display
-        display_goal = target_goal[:80] + "..." if len(target_goal) > 80 else target_goal
-        
         welcome_text = f"""
 🎉 **Отлично! Донат подтвержден!**
 
@@ -229,13 +395,7 @@ class SettingUpModule:
 Готов начать? Давай начнем с изучения твоих чувств!
         """
         
-        keyboard = [
-            [InlineKeyboardButton("Начнем! 🚀", callback_data="start_key_texts")],
-            [InlineKeyboardButton("Что от меня нужно? ❓", callback_data="setup_explanation")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(welcome_text, parse_mode='Markdown', reply_markup=reply_markup)
+        await update.message.reply_text(welcome_text, parse_mode='Markdown', reply_markup=_WELCOME_MARKUP)
     
     async def _start_positive_feelings_collection(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Start collecting positive feelings when goal is achieved"""
@@ -271,20 +431,14 @@ class SettingUpModule:
 Начни с первого чувства... 💭
         """
         
-        keyboard = [
-            [InlineKeyboardButton("Понял! Начинаю! 😊", callback_data="ready_for_positive")],
-            [InlineKeyboardButton("Нужны примеры? 💡", callback_data="positive_examples")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.callback_query.edit_message_text(positive_feelings_text, parse_mode='Markdown', reply_markup=reply_markup)
+        await update.callback_query.edit_message_text(positive_feelings_text, parse_mode='Markdown', reply_markup=_POSITIVE_FEELINGS_MARKUP)
     
     async def _process_positive_feeling_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE, message_text: str):
         """Process positive feeling input from user"""
         user_id = update.effective_user.id
         
         # Get current positive feelings
-        state_data = await self.db_manager.get_user_state_data(user_id)
+        state_data = await self._load_state(user_id, context)
         positive_feelings = state_data.get("positive_feelings", [])
         
         # Check for duplicates
@@ -297,24 +451,18 @@ class SettingUpModule:
         # Add new feeling
         positive_feelings.append({
             "statement": message_text,
-            "timestamp": context.bot_data.get("current_time", "unknown")
+            "timestamp": int(time.time()),
+            "_tokens": self._tokenize(message_text)
         })
         
         # Update state
-        await self.db_manager.update_user_state_data(user_id, {
+        await self._stage_state(user_id, context, {
             "positive_feelings": positive_feelings,
             "statements_collected": len(positive_feelings)
         })
         
-        # Get plan type to determine limits
-        state_data = await self.db_manager.get_user_state_data(user_id)
-        selected_plan = state_data.get("selected_plan", "")
-        
         # Set limits based on plan type
-        if selected_plan == "regular":
-            max_positive = 7  # Extended for Regular plan
-        else:
-            max_positive = 5  # Optimized for Express and 2-week plans
+        max_positive = _MAX_POSITIVE_BY_PLAN.get(state_data.get("selected_plan", ""), _DEFAULT_MAX_POSITIVE)
         
         # Check if we have enough positive feelings
         if len(positive_feelings) >= max_positive:
@@ -327,37 +475,17 @@ class SettingUpModule:
         remaining = max_positive - current_count
         
         if remaining > 1:
-            text = f"""
-✅ **Отлично! Я записал это чувство.**
-
-У меня уже есть {current_count} положительных чувств. Можешь поделиться еще {remaining} чувствами, которые ты испытаешь, когда достигнешь цели.
-
-**Примеры:**
-• "Я буду чувствовать..."
-• "Я почувствую..."
-• "Мне будет..."
-
-Что еще ты будешь чувствовать? 😊
-            """
+            text = _MORE_POSITIVE_TEXT.format_map({"current_count": current_count, "remaining": remaining})
         else:
-            text = f"""
-✅ **Превосходно! Нужно еще одно чувство.**
-
-У меня уже есть {current_count} положительных чувств. Поделись еще одним чувством, которое ты испытаешь, когда достигнешь цели.
-
-Это может быть:
-• Последнее важное чувство
-• Самое сильное переживание
-• То, что тебя больше всего мотивирует
-
-Какое твое последнее чувство? 🎯
-            """
+            text = _LAST_POSITIVE_TEXT.format_map({"current_count": current_count})
         
-        await update.message.reply_text(text, parse_mode='Markdown')
+        await update.message.reply_text(text, parse_mode=ParseMode.HTML)
     
     async def _check_duplicate_statement(self, new_statement: str, existing_statements: list) -> bool:
         """Check if statement is duplicate or very similar"""
         new_lower = new_statement.lower().strip()
+        new_words = frozenset(new_lower.split())
+        new_count = len(new_words)
         
         for existing in existing_statements:
             existing_lower = existing["statement"].lower().strip()
@@ -366,32 +494,47 @@ class SettingUpModule:
             if new_lower == existing_lower:
                 return True
             
+            # Statements saved before tokens were stored get tokenized here
+            existing_words = existing.get("_tokens")
+            if existing_words is None:
+                existing_words = self._tokenize(existing_lower)
+            
+            # Jaccard similarity is at most smaller/larger word count, so
+            # sets whose sizes differ by 20% or more can't be 80% similar
+            smaller, larger = sorted((new_count, len(existing_words)))
+            if larger and 5 * smaller <= 4 * larger:
+                continue
+            
             # Check for very similar statements (80% similarity)
-            if self._calculate_similarity(new_lower, existing_lower) > 0.8:
+            if self._word_set_similarity(new_words, frozenset(existing_words)) > 0.8:
                 return True
         
         return False
     
+    @staticmethod
+    def _tokenize(text: str) -> List[str]:
+        """Return the sorted unique lowercase words of a statement (JSON-serializable)"""
+        return sorted(set(text.lower().split()))
+    
     def _calculate_similarity(self, text1: str, text2: str) -> float:
         """Calculate similarity between two texts"""
         # Simple word-based similarity
-        words1 = set(text1.split())
-        words2 = set(text2.split())
-        
+        return self._word_set_similarity(frozenset(text1.split()), frozenset(text2.split()))
+    
+    @staticmethod
+    def _word_set_similarity(words1: frozenset, words2: frozenset) -> float:
+        """Jaccard similarity between two word sets"""
         if not words1 and not words2:
             return 1.0
         if not words1 or not words2:
             return 0.0
         
-        intersection = words1.intersection(words2)
-        union = words1.union(words2)
-        
-        return len(intersection) / len(union)
+        return len(words1 & words2) / len(words1 | words2)
     
     async def _handle_duplicate_statement(self, update: Update, context: ContextTypes.DEFAULT_TYPE, statement: str, question_type: str):
         """Handle duplicate statement detection"""
         user_id = update.effective_user.id
-        state_data = await self.db_manager.get_user_state_data(user_id)
+        state_data = await self._load_state(user_id, context)
         
         # Get current count based on question type
         if question_type == "positive_feelings":
@@ -436,31 +579,21 @@ class SettingUpModule:
     
     async def _ask_if_finished_positive(self, update: Update, context: ContextTypes.DEFAULT_TYPE, current_count: int):
         """Ask if user is finished with positive feelings"""
-        text = f"""
-✅ **Отлично! У меня есть {current_count} положительных чувств.**
-
-Ты можешь поделиться еще несколькими, если хочешь, или мы можем перейти к следующему вопросу.
-
-**Что ты хочешь сделать?**
-• Поделиться еще положительными чувствами
-• Перейти к следующему вопросу
-
-Напиши "готов" или "дальше", если хочешь продолжить, или поделись еще одним чувством.
-        """
+        text = _FINISHED_POSITIVE_TEXT.format_map({"current_count": current_count})
         
-        await update.message.reply_text(text, parse_mode='Markdown')
+        await update.message.reply_text(text, parse_mode=ParseMode.HTML)
     
     async def _move_to_nervous_feelings(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Move to nervous feelings collection"""
         user_id = update.effective_user.id
         
         # Get user's goal for context
-        state_data = await self.db_manager.get_user_state_data(user_id)
+        state_data = await self._load_state(user_id, context)
         target_goal = state_data.get("final_target_goal", "")
         positive_count = len(state_data.get("positive_feelings", []))
         
         # Update question type
-        await self.db_manager.update_user_state_data(user_id, {
+        await self._stage_state(user_id, context, {
             "current_question_type": "nervous_feelings",
             "statements_collected": 0
         })
@@ -484,20 +617,14 @@ class SettingUpModule:
 Начни с первого беспокойства... 😰
         """
         
-        keyboard = [
-            [InlineKeyboardButton("Понял! Начинаю! 😰", callback_data="ready_for_nervous")],
-            [InlineKeyboardButton("Нужны примеры? 💡", callback_data="nervous_examples")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(nervous_feelings_text, parse_mode='Markdown', reply_markup=reply_markup)
+        await update.message.reply_text(nervous_feelings_text, parse_mode='Markdown', reply_markup=_NERVOUS_FEELINGS_MARKUP)
     
     async def _process_nervous_feeling_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE, message_text: str):
         """Process nervous feeling input from user"""
         user_id = update.effective_user.id
         
         # Get current nervous feelings
-        state_data = await self.db_manager.get_user_state_data(user_id)
+        state_data = await self._load_state(user_id, context)
         nervous_feelings = state_data.get("nervous_feelings", [])
         
         # Check for duplicates
@@ -510,11 +637,12 @@ class SettingUpModule:
         # Add new nervous feeling
         nervous_feelings.append({
             "statement": message_text,
-            "timestamp": context.bot_data.get("current_time", "unknown")
+            "timestamp": int(time.time()),
+            "_tokens": self._tokenize(message_text)
         })
         
         # Update state
-        await self.db_manager.update_user_state_data(user_id, {
+        await self._stage_state(user_id, context, {
             "nervous_feelings": nervous_feelings,
             "statements_collected": len(nervous_feelings)
         })
@@ -527,48 +655,27 @@ class SettingUpModule:
     
     async def _ask_for_more_nervous_feelings(self, update: Update, context: ContextTypes.DEFAULT_TYPE, current_count: int):
         """Ask for more nervous feelings"""
-        text = f"""
-✅ **Понял, я записал это беспокойство.**
-
-У меня уже есть {current_count} беспокойств. Поделись еще тем, что тебя беспокоит или вызывает тревогу.
-
-**Примеры:**
-• "Я боюсь..."
-• "Меня беспокоит..."
-• "Я нервничаю из-за..."
-
-Что еще тебя беспокоит? 😰
-        """
+        text = _MORE_NERVOUS_TEXT.format_map({"current_count": current_count})
         
-        await update.message.reply_text(text, parse_mode='Markdown')
+        await update.message.reply_text(text, parse_mode=ParseMode.HTML)
     
     async def _ask_if_finished_nervous(self, update: Update, context: ContextTypes.DEFAULT_TYPE, current_count: int):
         """Ask if user is finished with nervous feelings"""
-        text = f"""
-✅ **Хорошо! У меня есть {current_count} беспокойств.**
-
-Ты можешь поделиться еще несколькими, если хочешь, или мы можем перейти к следующему вопросу.
-
-**Что ты хочешь сделать?**
-• Поделиться еще беспокойствами
-• Перейти к следующему вопросу
-
-Напиши "готов" или "дальше", если хочешь продолжить, или поделись еще одним беспокойством.
-        """
+        text = _FINISHED_NERVOUS_TEXT.format_map({"current_count": current_count})
         
-        await update.message.reply_text(text, parse_mode='Markdown')
+        await update.message.reply_text(text, parse_mode=ParseMode.HTML)
     
     async def _move_to_available_options(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Move to available options collection"""
         user_id = update.effective_user.id
         
         # Get user's goal for context
-        state_data = await self.db_manager.get_user_state_data(user_id)
+        state_data = await self._load_state(user_id, context)
         target_goal = state_data.get("final_target_goal", "")
         nervous_count = len(state_data.get("nervous_feelings", []))
         
         # Update question type
-        await self.db_manager.update_user_state_data(user_id, {
+        await self._stage_state(user_id, context, {
             "current_question_type": "available_options",
             "statements_collected": 0
         })
@@ -592,20 +699,14 @@ class SettingUpModule:
 Начни с первой возможности... 🚀
         """
         
-        keyboard = [
-            [InlineKeyboardButton("Понял! Начинаю! 🚀", callback_data="ready_for_options")],
-            [InlineKeyboardButton("Нужны примеры? 💡", callback_data="options_examples")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(available_options_text, parse_mode='Markdown', reply_markup=reply_markup)
+        await update.message.reply_text(available_options_text, parse_mode='Markdown', reply_markup=_AVAILABLE_OPTIONS_MARKUP)
     
     async def _process_available_option_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE, message_text: str):
         """Process available option input from user"""
         user_id = update.effective_user.id
         
         # Get current available options
-        state_data = await self.db_manager.get_user_state_data(user_id)
+        state_data = await self._load_state(user_id, context)
         available_options = state_data.get("available_options", [])
         
         # Check for duplicates
@@ -618,11 +719,12 @@ class SettingUpModule:
         # Add new option
         available_options.append({
             "statement": message_text,
-            "timestamp": context.bot_data.get("current_time", "unknown")
+            "timestamp": int(time.time()),
+            "_tokens": self._tokenize(message_text)
         })
         
         # Update state
-        await self.db_manager.update_user_state_data(user_id, {
+        await self._stage_state(user_id, context, {
             "available_options": available_options,
             "statements_collected": len(available_options)
         })
@@ -635,50 +737,29 @@ class SettingUpModule:
     
     async def _ask_for_more_options(self, update: Update, context: ContextTypes.DEFAULT_TYPE, current_count: int):
         """Ask for more available options"""
-        text = f"""
-✅ **Отлично! Я записал эту возможность.**
-
-У меня уже есть {current_count} возможностей. Поделись еще тем, какие возможности у тебя появятся.
-
-**Примеры:**
-• "Я смогу..."
-• "У меня будет..."
-• "Я буду..."
-
-Какие еще возможности у тебя появятся? 🚀
-        """
+        text = _MORE_OPTIONS_TEXT.format_map({"current_count": current_count})
         
-        await update.message.reply_text(text, parse_mode='Markdown')
+        await update.message.reply_text(text, parse_mode=ParseMode.HTML)
     
     async def _ask_if_finished_options(self, update: Update, context: ContextTypes.DEFAULT_TYPE, current_count: int):
         """Ask if user is finished with available options"""
-        text = f"""
-✅ **Хорошо! У меня есть {current_count} возможностей.**
-
-Ты можешь поделиться еще одной, если хочешь, или мы можем перейти к следующему этапу.
-
-**Что ты хочешь сделать?**
-• Поделиться еще одной возможностью
-• Перейти к следующему этапу
-
-Напиши "готов" или "дальше", если хочешь продолжить, или поделись еще одной возможностью.
-        """
+        text = _FINISHED_OPTIONS_TEXT.format_map({"current_count": current_count})
         
-        await update.message.reply_text(text, parse_mode='Markdown')
+        await update.message.reply_text(text, parse_mode=ParseMode.HTML)
     
     async def _move_to_negative_transformation(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Move to negative transformation phase"""
         user_id = update.effective_user.id
         
         # Get user's data
-        state_data = await self.db_manager.get_user_state_data(user_id)
+        state_data = await self._load_state(user_id, context)
         target_goal = state_data.get("final_target_goal", "")
         positive_count = len(state_data.get("positive_feelings", []))
         nervous_count = len(state_data.get("nervous_feelings", []))
         options_count = len(state_data.get("available_options", []))
         
         # Update question type
-        await self.db_manager.update_user_state_data(user_id, {
+        await self._stage_state(user_id, context, {
             "current_question_type": "transform_negative",
             "statements_collected": 0
         })
@@ -702,20 +783,14 @@ class SettingUpModule:
 Давай начнем с первого беспокойства... 🔄
         """
         
-        keyboard = [
-            [InlineKeyboardButton("Начинаем трансформацию! 🔄", callback_data="start_transformation")],
-            [InlineKeyboardButton("Показать мои беспокойства 📋", callback_data="show_nervous")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(transformation_text, parse_mode='Markdown', reply_markup=reply_markup)
+        await update.message.reply_text(transformation_text, parse_mode='Markdown', reply_markup=_TRANSFORMATION_MARKUP)
     
     async def _process_negative_transformation_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE, message_text: str):
         """Process negative transformation input from user"""
         user_id = update.effective_user.id
         
         # Get current data
-        state_data = await self.db_manager.get_user_state_data(user_id)
+        state_data = await self._load_state(user_id, context)
         nervous_feelings = state_data.get("nervous_feelings", [])
         transformed_negatives = state_data.get("transformed_negatives", [])
         current_index = state_data.get("current_transformation_index", 0)
@@ -728,11 +803,11 @@ class SettingUpModule:
             transformed_negatives.append({
                 "original_nervous": current_nervous["statement"],
                 "positive_transformation": message_text,
-                "timestamp": context.bot_data.get("current_time", "unknown")
+                "timestamp": int(time.time())
             })
             
             # Update state
-            await self.db_manager.update_user_state_data(user_id, {
+            await self._stage_state(user_id, context, {
                 "transformed_negatives": transformed_negatives,
                 "current_transformation_index": current_index + 1
             })
@@ -773,7 +848,7 @@ class SettingUpModule:
         user_id = update.effective_user.id
         
         # Get all data
-        state_data = await self.db_manager.get_user_state_data(user_id)
+        state_data = await self._load_state(user_id, context)
         positive_feelings = state_data.get("positive_feelings", [])
         available_options = state_data.get("available_options", [])
         transformed_negatives = state_data.get("transformed_negatives", [])
@@ -794,7 +869,7 @@ class SettingUpModule:
             focus_statements.append(transformation["positive_transformation"])
         
         # Update state
-        await self.db_manager.update_user_state_data(user_id, {
+        await self._stage_state(user_id, context, {
             "focus_statements": focus_statements,
             "current_question_type": "complete_setup"
         })
@@ -805,7 +880,7 @@ class SettingUpModule:
     async def _show_final_focus_statements(self, update: Update, context: ContextTypes.DEFAULT_TYPE, focus_statements: list):
         """Show final focus statements"""
         user_id = update.effective_user.id
-        state_data = await self.db_manager.get_user_state_data(user_id)
+        state_data = await self._load_state(user_id, context)
         target_goal = state_data.get("final_target_goal", "")
         
         statements_text = f"""
@@ -835,13 +910,7 @@ class SettingUpModule:
 Готов продолжить создание материала? 🚀
         """
         
-        keyboard = [
-            [InlineKeyboardButton("Создать материал! 🚀", callback_data="create_material")],
-            [InlineKeyboardButton("Посмотреть все утверждения 📋", callback_data="view_all_statements")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(statements_text, parse_mode='Markdown', reply_markup=reply_markup)
+        await update.message.reply_text(statements_text, parse_mode='Markdown', reply_markup=_FOCUS_STATEMENTS_MARKUP)
     
     async def _start_material_creation(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Start material creation phase"""
@@ -912,7 +981,7 @@ class SettingUpModule:
     async def _explain_material_creation(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Explain material creation process"""
         user_id = update.effective_user.id
-        state_data = await self.db_manager.get_user_state_data(user_id)
+        state_data = await self.db_manager.get_user_state_fields(user_id, ("selected_plan",))
         selected_plan = state_data.get("selected_plan", "")
         
         explanation_text = f"""
@@ -1030,16 +1099,22 @@ class SettingUpModule:
             return
         
         # Get plan type to determine task limits
-        state_data = await self.db_manager.get_user_state_data(user_id)
+        state_data = await self.db_manager.get_user_state_fields(user_id, ("selected_plan",))
         selected_plan = state_data.get("selected_plan", "")
+        task_generation_text = self._focus_statement_tasks_text(focus_index, focus_statements, selected_plan)
         
-        # Set task limits based on plan type
+        if update.callback_query:
+            await update.callback_query.edit_message_text(task_generation_text, parse_mode='Markdown', reply_markup=_FOCUS_TASKS_MARKUP)
+        else:
+            await update.message.reply_text(task_generation_text, parse_mode='Markdown', reply_markup=_FOCUS_TASKS_MARKUP)
+    
+    def _focus_statement_tasks_text(self, focus_index: int, focus_statements: list, selected_plan: str) -> str:
+        """Build the prompt asking for tasks for one focus statement"""
+        # Describe task limits based on plan type
         if selected_plan == "regular":
-            max_tasks_per_focus = 3  # Extended for Regular plan
-            task_text = "2-3 конкретными задачами"
+            task_text = "2-3 конкретными задачами"  # Extended for Regular plan
         else:
-            max_tasks_per_focus = 1  # Optimized for Express and 2-week plans
-            task_text = "1 конкретной задачей"
+            task_text = "1 конкретной задачей"  # Optimized for Express and 2-week plans
         
         current_statement = focus_statements[focus_index]
         progress = focus_index + 1
@@ -1065,14 +1140,7 @@ class SettingUpModule:
 
 Начни с задачи... 📝
         """
-        
-        keyboard = [
-            [InlineKeyboardButton("Начинаю! 📝", callback_data="start_tasks")],
-            [InlineKeyboardButton("Нужны примеры? 💡", callback_data="task_examples")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.callback_query.edit_message_text(task_generation_text, parse_mode='Markdown', reply_markup=reply_markup)
+        return task_generation_text
     
     async def _process_task_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE, message_text: str):
         """Process task input for current focus statement"""
@@ -1100,7 +1168,7 @@ class SettingUpModule:
             "focus_statement": current_statement,
             "task_number": task_id,
             "task_text": message_text,
-            "timestamp": context.bot_data.get("current_time", "unknown")
+            "timestamp": int(time.time())
         }
         
         current_focus_tasks.append(new_task)
@@ -1111,15 +1179,8 @@ class SettingUpModule:
             "generated_tasks": generated_tasks
         })
         
-        # Get plan type to determine task limits
-        state_data = await self.db_manager.get_user_state_data(user_id)
-        selected_plan = state_data.get("selected_plan", "")
-        
         # Set task limits based on plan type
-        if selected_plan == "regular":
-            max_tasks_per_focus = 3  # Extended for Regular plan
-        else:
-            max_tasks_per_focus = 1  # Optimized for Express and 2-week plans
+        max_tasks_per_focus = _MAX_TASKS_PER_FOCUS_BY_PLAN.get(state_data.get("selected_plan", ""), _DEFAULT_MAX_TASKS_PER_FOCUS)
         
         # Check if we have enough tasks for this focus statement
         if len(current_focus_tasks) >= max_tasks_per_focus:
@@ -1162,7 +1223,7 @@ class SettingUpModule:
     async def _ask_if_finished_focus_tasks(self, update: Update, context: ContextTypes.DEFAULT_TYPE, focus_index: int, focus_statements: list, current_tasks: list):
         """Ask if user is finished with current focus statement tasks"""
         user_id = update.effective_user.id
-        state_data = await self.db_manager.get_user_state_data(user_id)
+        state_data = await self.db_manager.get_user_state_fields(user_id, ("selected_plan",))
         selected_plan = state_data.get("selected_plan", "")
         
         current_statement = focus_statements[focus_index]
@@ -1180,6 +1241,16 @@ class SettingUpModule:
 
 Переходим к следующему фокус-утверждению... ⏭️
             """
+            next_index = focus_index + 1
+            if next_index < total:
+                # Acknowledge and ask about the next statement in a single message
+                await self.db_manager.update_user_state_data(user_id, {
+                    "current_focus_index": next_index
+                })
+                text += self._focus_statement_tasks_text(next_index, focus_statements, selected_plan)
+                await update.message.reply_text(text, parse_mode='Markdown', reply_markup=_FOCUS_TASKS_MARKUP)
+                return
+            
             await update.message.reply_text(text, parse_mode='Markdown')
             
             # Automatically move to next focus statement
@@ -1441,7 +1512,7 @@ class SettingUpModule:
             "available_options": [f["statement"] for f in available_options],
             "selected_tasks": selected_tasks,
             "total_tasks": len(selected_tasks),
-            "created_at": context.bot_data.get("current_time", "unknown"),
+            "created_at": int(time.time()),
             "material_type": "personalized_goal_achievement_with_selected_tasks"
         }
         
@@ -1469,7 +1540,7 @@ class SettingUpModule:
             "available_options": [f["statement"] for f in available_options],
             "generated_tasks": generated_tasks,
             "total_tasks": sum(len(tasks) for tasks in generated_tasks.values()),
-            "created_at": context.bot_data.get("current_time", "unknown"),
+            "created_at": int(time.time()),
             "material_type": "personalized_goal_achievement_with_tasks"
         }
         
@@ -1494,7 +1565,7 @@ class SettingUpModule:
             "positive_feelings": [f["statement"] for f in positive_feelings],
             "nervous_feelings": [f["statement"] for f in nervous_feelings],
             "available_options": [f["statement"] for f in available_options],
-            "created_at": context.bot_data.get("current_time", "unknown"),
+            "created_at": int(time.time()),
             "material_type": "personalized_goal_achievement"
         }
         
@@ -1602,12 +1673,16 @@ class SettingUpModule:
             await update.callback_query.edit_message_text(text)
             return
         
+        # Creation time is stored as epoch seconds
+        created_at = material.get('created_at')
+        created_text = time.strftime('%d.%m.%Y %H:%M', time.localtime(created_at)) if isinstance(created_at, int) else 'Не указано'
+        
         material_text = f"""
 📋 **Твой персонализированный материал**
 
 **🎯 Цель:** "{material.get('target_goal', 'Не указана')}"
 **📋 План:** {material.get('selected_plan', 'Не указан').upper()}
-**📅 Создан:** {material.get('created_at', 'Не указано')}
+**📅 Создан:** {created_text}
 
 **📝 Фокус-утверждения ({len(material.get('focus_statements', []))}):**
         """
@@ -1707,7 +1782,7 @@ class SettingUpModule:
         # Add new text
         key_texts.append({
             "text": message_text,
-            "timestamp": context.bot_data.get("current_time", "unknown")
+            "timestamp": int(time.time())
         })
         
         # Update state
@@ -1790,7 +1865,7 @@ class SettingUpModule:
     async def _start_preferences_collection(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Start collecting user preferences"""
         user_id = update.effective_user.id
-        state_data = await self.db_manager.get_user_state_data(user_id)
+        state_data = await self.db_manager.get_user_state_fields(user_id, ("final_target_goal", "selected_plan"))
         target_goal = state_data.get("final_target_goal", "")
         selected_plan = state_data.get("selected_plan", "")
         
@@ -2225,7 +2300,7 @@ class SettingUpModule:
                 "focus_statement": focus_statement,
                 "task_id": first_task.get("task_id", "first_task") if selected_plan in ["extreme", "2week"] else "first_task",
                 "order_id": order_id,
-                "started_at": context.bot_data.get("current_time", "unknown")
+                "started_at": int(time.time())
             }
         })
         
@@ -2310,7 +2385,7 @@ class SettingUpModule:
         # Store user response and feelings
         task_response = {
             "user_response": message_text,
-            "timestamp": context.bot_data.get("current_time", "unknown"),
+            "timestamp": int(time.time()),
             "task_id": active_task.get("task_id", "first_task"),
             "order_id": active_task.get("order_id", "")
         }
@@ -2356,7 +2431,7 @@ class SettingUpModule:
         # Store feelings
         task_feelings = {
             "feelings": message_text,
-            "timestamp": context.bot_data.get("current_time", "unknown")
+            "timestamp": int(time.time())
         }
         
         # Complete task data
@@ -2364,7 +2439,7 @@ class SettingUpModule:
             "task_response": task_response,
             "task_feelings": task_feelings,
             "active_task": active_task,
-            "completed_at": context.bot_data.get("current_time", "unknown")
+            "completed_at": int(time.time())
         }
         
         # Save complete task data
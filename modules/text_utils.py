@@ -0,0 +1,8 @@
+"""
+Text Utilities Module
+Shared helpers for formatting user text in bot and admin messages.
+"""
+
+def truncate(text: str, limit: int) -> str:
+    """Shorten text for display, appending an ellipsis when it was cut"""
+    return text if len(text) <= limit else text[:limit] + "…"
@@ -4,6 +4,7 @@ Simplified Admin Notifications Tests
 Tests the AdminNotificationService functionality
 """
 
+import asyncio
 import pytest
 from unittest.mock import Mock, AsyncMock
 from modules.admin_notifications import AdminNotificationService
@@ -77,3 +78,138 @@ class TestAdminNotificationsSimple:
         
         assert result is True
         admin_notifications.send_notification.assert_called_with(message, "special_test")
+    
+    @pytest.mark.asyncio
+    async def test_regular_plan_requests_are_batched(self, admin_notifications):
+        """Test that queued Regular plan requests go out as one notification."""
+        admin_notifications.send_notification = AsyncMock(return_value=True)
+        admin_notifications.batch_flush_interval = 60
+        
+        admin_notifications.db_manager = Mock()
+        admin_notifications.db_manager.get_user_profile = AsyncMock(side_effect=[{"first_name": "Anna"}, None])
+        
+        admin_notifications.queue_regular_plan_request(1, "Goal one", "000001")
+        admin_notifications.queue_regular_plan_request(2, "Goal two", "000002")
+        result = await admin_notifications.flush_regular_plan_requests()
+        admin_notifications._flush_task.cancel()
+        
+        assert result is True
+        admin_notifications.send_notification.assert_called_once()
+        message, notification_type = admin_notifications.send_notification.call_args[0]
+        assert notification_type == "regular_plan_requests"
+        assert "Goal one" in message and "Goal two" in message
+        assert "Anna (ID: 1)" in message
+        assert await admin_notifications.flush_regular_plan_requests() is False
+    
+    @pytest.mark.asyncio
+    async def test_regular_plan_request_queued_during_send_is_flushed(self, admin_notifications):
+        """Test that a request queued while a flush is sending gets its own flush."""
+        admin_notifications.batch_flush_interval = 0.01
+        sent = []
+        
+        async def send_notification(message, notification_type, parse_mode=None):
+            if not sent:
+                admin_notifications.queue_regular_plan_request(2, "Goal two", "000002")
+            sent.append(message)
+            return True
+        
+        admin_notifications.send_notification = send_notification
+        admin_notifications.queue_regular_plan_request(1, "Goal one", "000001")
+        await asyncio.sleep(0.1)
+        
+        assert len(sent) == 2
+        assert "Goal one" in sent[0] and "Goal two" in sent[1]
+        assert not admin_notifications._pending_regular_plan_requests
+        assert not admin_notifications._flush_tasks
+    
+    @pytest.mark.asyncio
+    async def test_regular_plan_requests_requeued_when_send_fails(self, admin_notifications):
+        """Test that a failed batch send puts the requests and dropped count back in the queue."""
+        admin_notifications.send_notification = AsyncMock(return_value=False)
+        admin_notifications.batch_flush_interval = 60
+        admin_notifications.batch_buffer_limit = 2
+        
+        for user_id in range(1, 4):
+            admin_notifications.queue_regular_plan_request(user_id, f"Goal {user_id}", f"00000{user_id}")
+        assert await admin_notifications.flush_regular_plan_requests() is False
+        admin_notifications._flush_task.cancel()
+        
+        assert [request["user_id"] for request in admin_notifications._pending_regular_plan_requests] == [2, 3]
+        assert admin_notifications._dropped_regular_plan_requests == 1
+    
+    @pytest.mark.asyncio
+    async def test_regular_plan_batches_fit_message_limit(self, admin_notifications):
+        """Test that large batches are split under Telegram's limit with goals escaped and shortened."""
+        admin_notifications.send_notification = AsyncMock(return_value=True)
+        admin_notifications.batch_flush_interval = 60
+        admin_notifications.batch_max_size = 200
+        
+        for user_id in range(60):
+            admin_notifications.queue_regular_plan_request(user_id, "<b>snake_case *goal*</b> " * 10, f"{user_id:06d}")
+        assert await admin_notifications.flush_regular_plan_requests() is True
+        admin_notifications._flush_task.cancel()
+        
+        messages = [call[0][0] for call in admin_notifications.send_notification.call_args_list]
+        assert len(messages) > 1
+        assert all(len(message) <= 4096 for message in messages)
+        assert sum(message.count("(ID: ") for message in messages) == 60
+        assert "<b>snake" not in "".join(messages)
+        assert "&lt;b&gt;snake_case *goal*" in messages[0]
+        assert "…" in messages[0]
+    
+    @pytest.mark.asyncio
+    async def test_donation_confirmations_are_batched(self, admin_notifications):
+        """Test that queued donation confirmations go out as one notification."""
+        admin_notifications.send_notification = AsyncMock(return_value=True)
+        admin_notifications.donation_flush_interval = 60
+        
+        admin_notifications.queue_donation_confirmation(1, "Anna", "000001", "Goal one", {"name": "Extreme", "price": "₽4,990"})
+        admin_notifications.queue_donation_confirmation(2, "Boris", "000002", "Goal two", {})
+        result = await admin_notifications.flush_donation_confirmations()
+        admin_notifications._donation_flush_task.cancel()
+        
+        assert result is True
+        admin_notifications.send_notification.assert_called_once()
+        message, notification_type = admin_notifications.send_notification.call_args[0]
+        assert notification_type == "payments"
+        assert "ДОНАТОВ: 2" in message
+        assert "Anna (ID: 1)" in message and "Boris (ID: 2)" in message
+        assert "₽4,990" in message
+        assert await admin_notifications.flush_donation_confirmations() is False
+    
+    @pytest.mark.asyncio
+    async def test_donation_confirmations_requeued_when_send_fails(self, admin_notifications):
+        """Test that confirmations from a failed send are retried instead of dropped."""
+        admin_notifications.donation_flush_interval = 0.01
+        results = [False, True]
+        admin_notifications.send_notification = AsyncMock(side_effect=lambda *args, **kwargs: results.pop(0))
+        
+        admin_notifications.queue_donation_confirmation(1, "Anna", "000001", "my_goal *now*", {"name": "Extreme"})
+        admin_notifications.queue_donation_confirmation(2, "Boris", "000002", "Goal two", {})
+        await asyncio.sleep(0.1)
+        
+        assert admin_notifications.send_notification.await_count == 2
+        retried = admin_notifications.send_notification.call_args_list[1]
+        assert "Anna (ID: 1)" in retried[0][0] and "Boris (ID: 2)" in retried[0][0]
+        assert retried[1]["parse_mode"] == "HTML"
+        assert not admin_notifications._pending_donation_confirmations
+    
+    @pytest.mark.asyncio
+    async def test_donation_confirmation_queued_during_send_is_flushed(self, admin_notifications):
+        """Test that a confirmation queued while a flush is sending is not stranded."""
+        admin_notifications.donation_flush_interval = 0.01
+        sent = []
+        
+        async def send_notification(message, notification_type, parse_mode=None):
+            if not sent:
+                admin_notifications.queue_donation_confirmation(2, "Boris", "000002", "Goal two", {})
+            sent.append(message)
+            return True
+        
+        admin_notifications.send_notification = send_notification
+        admin_notifications.queue_donation_confirmation(1, "Anna", "000001", "Goal one", {})
+        await asyncio.sleep(0.1)
+        
+        assert len(sent) == 2
+        assert "Goal one" in sent[0] and "Goal two" in sent[1]
+        assert not admin_notifications._pending_donation_confirmations
@@ -3,6 +3,7 @@ Tests for database operations and user data management
 """
 import pytest
 import asyncio
+import sqlite3
 from modules.database import DatabaseManager
 
 
@@ -39,6 +40,17 @@ class TestDatabaseOperations:
         assert user_data["username"] == mock_user.username
         assert user_data["first_name"] == mock_user.first_name
     
+    @pytest.mark.asyncio
+    async def test_user_profile_record(self, temp_db, mock_user):
+        """Test that the profile record matches the dict profile."""
+        db_manager = DatabaseManager(temp_db)
+        await db_manager.initialize_user(mock_user.id, mock_user.username, mock_user.first_name)
+        
+        record = await db_manager.get_user_profile_record(mock_user.id)
+        
+        assert record._asdict() == await db_manager.get_user_profile(mock_user.id)
+        assert await db_manager.get_user_profile_record(mock_user.id + 1) is None
+    
     @pytest.mark.asyncio
     async def test_user_state_management(self, temp_db, mock_user):
         """Test user state management in database."""
@@ -81,6 +93,172 @@ class TestDatabaseOperations:
         assert final_data["name"] == "test"  # Preserved
         assert final_data["age"] == 25  # Added
     
+    @pytest.mark.asyncio
+    async def test_merge_user_state_data_returns_previous(self, temp_db, mock_user):
+        """Test that merging state data returns the data as it was before."""
+        db_manager = DatabaseManager(temp_db)
+        await db_manager.initialize_user(mock_user.id, mock_user.username, mock_user.first_name)
+        await db_manager.set_user_state(mock_user.id, "option_selection", {"step": "plan_selection", "user_goal": "goal"})
+        
+        previous = await db_manager.merge_user_state_data(mock_user.id, {"selected_plan": "extreme"})
+        
+        assert previous == {"step": "plan_selection", "user_goal": "goal"}
+        assert await db_manager.get_user_state(mock_user.id) == "option_selection"
+        assert await db_manager.get_user_state_data(mock_user.id) == {
+            "step": "plan_selection", "user_goal": "goal", "selected_plan": "extreme"
+        }
+    
+    @pytest.mark.asyncio
+    async def test_get_user_state_fields(self, temp_db, mock_user):
+        """Test that only the requested state keys are returned, with their JSON types intact."""
+        db_manager = DatabaseManager(temp_db)
+        await db_manager.initialize_user(mock_user.id, mock_user.username, mock_user.first_name)
+        await db_manager.update_user_state_data(mock_user.id, {
+            "selected_plan": "extreme",
+            "setup_completed": False,
+            "focus_statements": ["Я спокоен"],
+            "user_goal": "goal"
+        })
+        
+        fields = await db_manager.get_user_state_fields(
+            mock_user.id, ("selected_plan", "setup_completed", "focus_statements", "missing")
+        )
+        
+        assert fields == {"selected_plan": "extreme", "setup_completed": False, "focus_statements": ["Я спокоен"]}
+        assert await db_manager.get_user_state_fields(mock_user.id + 1, ("selected_plan",)) == {}
+    
+    @pytest.mark.asyncio
+    async def test_state_cache_write_through(self, temp_db, mock_user):
+        """Test that cached state follows every write and can't be mutated by callers."""
+        db_manager = DatabaseManager(temp_db)
+        await db_manager.initialize_user(mock_user.id, mock_user.username, mock_user.first_name)
+        await db_manager.update_user_state_data(mock_user.id, {"step": "goal_collection"})
+
+        state_data = await db_manager.get_user_state_data(mock_user.id)
+        state_data["step"] = "mutated"
+        assert await db_manager.get_user_state_data(mock_user.id) == {"step": "goal_collection"}
+
+        await db_manager.update_user_state_data(mock_user.id, {"user_goal": "goal"})
+        assert await db_manager.get_user_state_data(mock_user.id) == {"step": "goal_collection", "user_goal": "goal"}
+
+        await db_manager.mark_regular_plan_shown(mock_user.id)
+        assert (await db_manager.get_user_state_data(mock_user.id))["step"] == "plan_selection"
+
+    @pytest.mark.asyncio
+    async def test_update_state_data_and_get_profile(self, temp_db, mock_user):
+        """Test that the combined state update also returns the user's profile."""
+        db_manager = DatabaseManager(temp_db)
+        await db_manager.initialize_user(mock_user.id, mock_user.username, mock_user.first_name)
+        
+        profile = await db_manager.update_user_state_data_and_get_profile(mock_user.id, {"step": "plan_selection"})
+        
+        assert profile.first_name == mock_user.first_name
+        assert (await db_manager.get_user_state_data(mock_user.id))["step"] == "plan_selection"
+    
+    @pytest.mark.asyncio
+    async def test_mark_regular_plan_shown(self, temp_db, mock_user):
+        """Test that marking the Regular plan notice resets the step in place."""
+        db_manager = DatabaseManager(temp_db)
+        await db_manager.initialize_user(mock_user.id, mock_user.username, mock_user.first_name)
+        await db_manager.set_user_state(mock_user.id, "option_selection", {"step": "goal_validation", "user_goal": "goal"})
+        
+        await db_manager.mark_regular_plan_shown(mock_user.id)
+        
+        state_data = await db_manager.get_user_state_data(mock_user.id)
+        assert state_data["step"] == "plan_selection"
+        assert state_data["user_goal"] == "goal"
+        assert isinstance(state_data["regular_plan_shown_at"], int)
+    
+    @pytest.mark.asyncio
+    async def test_prefetch_user_context(self, temp_db, mock_user):
+        """Test that profile and subscription are prefetched together."""
+        db_manager = DatabaseManager(temp_db)
+        
+        context = await db_manager.prefetch_user_context(mock_user.id)
+        assert context == {"profile": None, "subscription": None}
+        
+        await db_manager.initialize_user(mock_user.id, mock_user.username, mock_user.first_name)
+        
+        context = await db_manager.prefetch_user_context(mock_user.id)
+        assert context["profile"].first_name == mock_user.first_name
+        assert context["subscription"] is None
+    
+    @pytest.mark.asyncio
+    async def test_active_subscription_lookup(self, temp_db, mock_user):
+        """Test the light active-subscription check and hydrating the full row."""
+        db_manager = DatabaseManager(temp_db)
+        await db_manager.initialize_user(mock_user.id, mock_user.username, mock_user.first_name)
+        
+        assert await db_manager.has_active_subscription(mock_user.id) is None
+        
+        with sqlite3.connect(temp_db) as conn:
+            conn.execute(
+                "INSERT INTO subscriptions (user_id, order_id, subscription_type, status, start_date, end_date, payment_id) "
+                "VALUES (?, '00001A', 'extreme', 'active', CURRENT_TIMESTAMP, datetime('now', '+7 days'), 'pay_1')",
+                (mock_user.id,)
+            )
+        
+        active = await db_manager.has_active_subscription(mock_user.id)
+        assert active.subscription_type == "extreme"
+        assert (await db_manager.prefetch_user_context(mock_user.id))["subscription"] == active
+        
+        subscription = await db_manager.get_subscription(active.id)
+        assert subscription["order_id"] == "00001A"
+        assert subscription["payment_id"] == "pay_1"
+        
+        bundle = await db_manager.get_user_bundle(mock_user.id)
+        assert bundle["state"] == {}
+        assert bundle["profile"]["first_name"] == mock_user.first_name
+        assert bundle["subscription"] == subscription
+    
+    @pytest.mark.asyncio
+    async def test_write_events(self, temp_db, mock_user):
+        """Test that writes notify subscribers with the affected user."""
+        db_manager = DatabaseManager(temp_db)
+        user_events, subscription_events = [], []
+        db_manager.subscribe("user_updated", user_events.append)
+        db_manager.subscribe("subscription_updated", subscription_events.append)
+        
+        await db_manager.initialize_user(mock_user.id, mock_user.username, mock_user.first_name)
+        await db_manager.update_user_state_data(mock_user.id, {"step": "goal"})
+        await db_manager.update_user_profile(mock_user.id, city="Москва")
+        assert user_events == [mock_user.id] * 3
+        
+        await db_manager.create_subscription(mock_user.id, "00001A", "goal", "extreme", {})
+        await db_manager.update_subscription_status("00001A", "active")
+        assert subscription_events == [mock_user.id] * 2
+    
+    @pytest.mark.asyncio
+    async def test_connection_pool_reuse(self, temp_db, mock_user):
+        """Test that pooled connections are reused and rolled back on error."""
+        db_manager = DatabaseManager(temp_db, pool_min_size=1, pool_max_size=1)
+        assert len(db_manager._pool) == 1
+        pooled = db_manager._pool[0]
+        
+        await db_manager.initialize_user(mock_user.id, mock_user.username, mock_user.first_name)
+        assert db_manager._pool == [pooled]
+        
+        with pytest.raises(sqlite3.OperationalError):
+            with db_manager._connection() as conn:
+                conn.execute("UPDATE users SET city = 'Москва' WHERE user_id = ?", (mock_user.id,))
+                conn.execute("SELECT * FROM missing_table")
+        
+        assert db_manager._pool == [pooled]
+        assert not pooled.in_transaction
+        profile = await db_manager.get_user_profile(mock_user.id)
+        assert profile["city"] is None
+    
+    @pytest.mark.asyncio
+    async def test_initialize_user_without_pool(self, temp_db, mock_user):
+        """Test that user initialization finishes before its connection is released."""
+        db_manager = DatabaseManager(temp_db, pool_min_size=0, pool_max_size=0)
+        
+        await db_manager.initialize_user(mock_user.id, mock_user.username, mock_user.first_name)
+        
+        assert await db_manager.get_user_state(mock_user.id) == "onboarding"
+        profile = await db_manager.get_user_profile(mock_user.id)
+        assert profile["first_name"] == mock_user.first_name
+    
     @pytest.mark.asyncio
     async def test_message_storage(self, temp_db, mock_user):
         """Test message storage functionality."""
@@ -112,6 +290,16 @@ class TestDatabaseOperations:
         assert user_messages[0]["message_text"] == "Hello bot!"
         assert bot_messages[0]["message_text"] == "Hello user!"
     
+    @pytest.mark.asyncio
+    async def test_sequence_values_increase(self, temp_db):
+        """Test that named sequences increase independently."""
+        db_manager = DatabaseManager(temp_db)
+        
+        assert await db_manager.next_sequence_value("orders") == 1
+        assert await db_manager.next_sequence_value("orders") == 2
+        assert await db_manager.next_sequence_value("payments") == 1
+        assert await db_manager.next_sequence_value("orders") == 3
+    
     @pytest.mark.asyncio
     async def test_subscription_management(self, temp_db, mock_user):
         """Test subscription and goal management."""
@@ -0,0 +1,40 @@
+"""
+Tests for performance caching helpers
+"""
+import pytest
+from unittest.mock import AsyncMock
+from modules.database import DatabaseManager
+from modules.performance import PerformanceManager, TTLCache
+
+
+class TestPerformanceManager:
+    """Test the performance manager's user caches."""
+    
+    @pytest.mark.asyncio
+    async def test_user_bundle_cached_without_subscription(self, temp_db, mock_user):
+        """Test that a user with no active subscription is still served from the cache."""
+        db_manager = DatabaseManager(temp_db)
+        await db_manager.initialize_user(mock_user.id, mock_user.username, mock_user.first_name)
+        performance = PerformanceManager(db_manager)
+        db_manager.get_user_bundle = AsyncMock(wraps=db_manager.get_user_bundle)
+        
+        first = await performance.get_cached_user_bundle(mock_user.id)
+        second = await performance.get_cached_user_bundle(mock_user.id)
+        
+        assert first["subscription"] is None
+        assert second == first
+        assert second["profile"]["first_name"] == mock_user.first_name
+        db_manager.get_user_bundle.assert_awaited_once_with(mock_user.id)
+    
+    @pytest.mark.asyncio
+    async def test_ttl_cache_stays_within_max_size(self):
+        """Test that a full cache of fresh entries evicts the oldest instead of growing."""
+        cache = TTLCache(ttl=60, max_size=3)
+        
+        for key in range(5):
+            assert await cache.get_or_load(key, AsyncMock(return_value=key * 10)) == key * 10
+        
+        assert len(cache) == 3
+        assert await cache.get_or_load(4, AsyncMock(return_value=None)) == 40
+        assert await cache.get_or_load(0, AsyncMock(return_value="reloaded")) == "reloaded"
+        assert len(cache) == 3
@@ -6,6 +6,7 @@ import asyncio
 from unittest.mock import Mock, AsyncMock, patch
 from modules.user_state import UserStateManager
 from modules.database import DatabaseManager
+from modules.settingup import SettingUpModule
 
 
 class TestStateManagementConsistency:
@@ -134,3 +135,49 @@ class TestStateManagementConsistency:
             await state_manager.set_user_state(mock_user.id, to_state, {})
             current_state = await state_manager.get_user_state(mock_user.id)
             assert current_state == to_state
+    
+    async def _setup_message(self, temp_db, mock_user, text):
+        """Build a setup module, an update carrying text and a context for one setup message."""
+        db_manager = DatabaseManager(temp_db)
+        await db_manager.initialize_user(mock_user.id, mock_user.username, mock_user.first_name)
+        await db_manager.set_user_state(mock_user.id, "setup", {
+            "current_question_type": "positive_feelings",
+            "positive_feelings": ["one", "two", "three"]
+        })
+        
+        update = Mock()
+        update.effective_user = mock_user
+        update.effective_chat.id = mock_user.id
+        update.message.text = text
+        update.message.reply_text = AsyncMock()
+        context = Mock()
+        context.user_data = {}
+        return SettingUpModule(db_manager, Mock()), db_manager, update, context
+    
+    @pytest.mark.asyncio
+    async def test_setup_flow_control_commits_one_write(self, temp_db, mock_user):
+        """Test that state staged while handling a setup message is written once at the end."""
+        settingup, db_manager, update, context = await self._setup_message(temp_db, mock_user, "Готов")
+        db_manager.update_user_state_data = AsyncMock(wraps=db_manager.update_user_state_data)
+        
+        await settingup.handle_message(update, context)
+        
+        db_manager.update_user_state_data.assert_awaited_once_with(mock_user.id, {
+            "current_question_type": "nervous_feelings",
+            "statements_collected": 0
+        })
+        state_data = await db_manager.get_user_state_data(mock_user.id)
+        assert state_data["current_question_type"] == "nervous_feelings"
+        assert state_data["positive_feelings"] == ["one", "two", "three"]
+        assert context.user_data == {}
+    
+    @pytest.mark.asyncio
+    async def test_setup_commit_failure_drops_cached_state(self, temp_db, mock_user):
+        """Test that a failed commit leaves no per-message state behind for later handlers."""
+        settingup, db_manager, update, context = await self._setup_message(temp_db, mock_user, "Готов")
+        db_manager.update_user_state_data = AsyncMock(side_effect=RuntimeError("write failed"))
+        
+        with pytest.raises(RuntimeError):
+            await settingup.handle_message(update, context)
+        
+        assert context.user_data == {}